@@ -0,0 +1,222 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: active_learning.py
+PURPOSE: Automatic selection of training samples during live prints.
+Based on: SECTION 4: LIVE AI MODEL STRUCTURE (Live Data Collection Pattern)
+================================================================================
+
+Saving every frame, or only the frames someone remembers to label, wastes
+labeling time on frames the model already gets right. The sampler looks at
+each analyzed frame and keeps it only when the model is unsure:
+  - 'uncertain'    - a detection scored inside the band just below the
+                     layer threshold (e.g. 0.40-0.70 at layer 5)
+  - 'disagreement' - the depth analyzer reported a defect that the RGB
+                     model did not see anywhere near (not even uncertain)
+                     (needs the RGB <-> depth tables, registration.npz)
+
+Kept frames go to a LiveDataCollector (asynchronous, so sampling costs the
+AI thread a hash and a frame copy) with the model's predictions as YOLO
+pre-labels, so labeling is mostly correcting boxes. A perceptual hash of the
+triggering region suppresses near-duplicates (the same unsure blob over
+fifty frames), and a per-print budget caps the total.
+
+Each kept sample is also listed in active_samples.jsonl (reason, layer,
+confidences) in the collector's directory; classes.txt gives the class
+names the pre-label ids refer to.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+import cv2
+
+
+def perceptual_hash(image):
+    """64-bit DCT perceptual hash (pHash) of a BGR or gray image, as a uint64."""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # Skip the DC term when taking the median: it only encodes brightness
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).view('>u8')[0]
+
+
+def hamming_distances(hashes, h):
+    """Bit differences between one hash and an array of hashes."""
+    if len(hashes) == 0:
+        return np.empty(0, dtype=np.int64)
+    diff = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(h))
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def yolo_labels(detections, width, height):
+    """DETECTION_DTYPE rows (full-frame boxes) -> YOLO label lines, normalized."""
+    lines = []
+    for det in detections:
+        x1, y1, x2, y2 = det['bbox']
+        lines.append(f"{int(det['class_id'])} {(x1 + x2) / 2 / width:.6f} {(y1 + y2) / 2 / height:.6f} "
+                     f"{(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}")
+    return lines
+
+
+def _overlaps(box, boxes):
+    """True if `box` intersects any of `boxes` (all [x1, y1, x2, y2])."""
+    if len(boxes) == 0:
+        return False
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return bool(np.any((boxes[:, 0] < box[2]) & (boxes[:, 2] > box[0]) &
+                       (boxes[:, 1] < box[3]) & (boxes[:, 3] > box[1])))
+
+
+class LiveActiveSampler:
+    """
+    Called by LiveAIThread after every in-process inference (observe) and by
+    the main loop for every depth defect (note_depth_defect).
+    The model must have uncertainty enabled; the sampler does that for you.
+    """
+    def __init__(self, model, collector, depth_source=None, band=0.30, budget=200,
+                 hash_distance=6, min_interval=2.0, disagreement_window=2.0, hash_margin=0.25):
+        self.model = model
+        self.collector = collector
+        self.depth_source = depth_source    # () -> latest depth frame (copy) or None
+        self.band = band
+        self.budget = budget
+        self.hash_distance = hash_distance
+        self.min_interval = min_interval
+        self.disagreement_window = disagreement_window
+        self.hash_margin = hash_margin
+
+        # The lowest layer threshold minus the band; per-layer bands are applied in observe
+        model.enable_uncertainty(float(model.min_threshold) - band)
+        self._depth_defects = deque(maxlen=32)  # (time, type, color bbox)
+        self._lock = threading.Lock()
+
+        names = model.model.names if hasattr(model.model, 'names') else {}
+        with open(os.path.join(collector.output_dir, 'classes.txt'), 'w') as f:
+            f.write(''.join(f"{names[i]}\n" for i in sorted(names)))
+        # Line-buffered: every entry is on disk as soon as its sample is queued
+        self.manifest = open(os.path.join(collector.output_dir, 'active_samples.jsonl'), 'a', buffering=1)
+        self.new_print()
+        print(f"[ACTIVE] Active learning sampler: band {band:.2f} below threshold, "
+              f"budget {budget} samples per print.")
+
+    def new_print(self):
+        """Reset the budget and the duplicate history (call when a print starts)."""
+        self.hashes = []
+        self.last_sample_time = 0.0
+        self.stats = {'observed': 0, 'uncertain': 0, 'disagreement': 0, 'duplicates': 0,
+                      'over_budget': 0, 'dropped': 0, 'sampled': 0}
+
+    @property
+    def remaining(self):
+        return max(0, self.budget - self.stats['sampled'])
+
+    def note_depth_defect(self, defect, now=None):
+        """
+        Remember a depth defect for disagreement checks. Only defects whose
+        box was mapped to color pixels (they carry 'depth_bbox', see
+        registration.py) can be compared with the RGB detections.
+        """
+        if defect.get('source') != 'depth' or defect.get('bbox') is None or 'depth_bbox' not in defect:
+            return
+        with self._lock:
+            self._depth_defects.append((time.time() if now is None else now, defect['type'], defect['bbox']))
+
+    def observe(self, frame, layer=None, now=None):
+        """
+        Look at the model's last result for `frame` and queue the frame if
+        it is worth labeling. Returns the sample_id, or None.
+        """
+        now = time.time() if now is None else now
+        self.stats['observed'] += 1
+        if now - self.last_sample_time < self.min_interval:
+            return None
+
+        layer = self.model.current_layer if layer is None else layer
+        threshold = self.model.get_threshold(layer)
+        certain = self.model.last_detections
+        uncertain = self.model.last_uncertain
+        if certain is None or uncertain is None:
+            return None
+        uncertain = uncertain[uncertain['confidence'] >= threshold - self.band]
+
+        # --- Why would a labeler want this frame? ---
+        reason = None
+        if len(uncertain):
+            reason = 'uncertain'
+            top = uncertain[np.argmax(uncertain['confidence'])]
+            defect_type = str(self.model.class_to_defect[top['class_id']])
+            trigger = uncertain['bbox']
+        else:
+            seen = np.concatenate([certain['bbox'], self.model.last_uncertain['bbox']])
+            with self._lock:
+                recent = [d for d in self._depth_defects if now - d[0] <= self.disagreement_window]
+            for _, depth_type, bbox in recent:
+                if not _overlaps(bbox, seen):
+                    reason = 'disagreement'
+                    defect_type = depth_type
+                    trigger = np.asarray([bbox], dtype=np.float32)
+                    break
+        if reason is None:
+            return None
+        self.stats[reason] += 1
+
+        if self.remaining == 0:
+            self.stats['over_budget'] += 1
+            return None
+
+        # --- Near-duplicate check on the region that triggered it ---
+        h = perceptual_hash(self._trigger_region(frame, trigger))
+        if np.any(hamming_distances(self.hashes, h) <= self.hash_distance):
+            self.stats['duplicates'] += 1
+            return None
+
+        detections = np.concatenate([certain, uncertain])
+        labels = yolo_labels(detections, frame.shape[1], frame.shape[0])
+        depth = self.depth_source() if self.depth_source is not None else None
+        sample_id = self.collector.capture_training_sample(frame, depth, defect_type, layer, labels=labels)
+        if sample_id is None:
+            self.stats['dropped'] += 1
+            return None
+
+        self.hashes.append(h)
+        self.last_sample_time = now
+        self.stats['sampled'] += 1
+        self.manifest.write(json.dumps({
+            'sample_id': sample_id,
+            'reason': reason,
+            'type': defect_type,
+            'layer': int(layer),
+            'threshold': float(threshold),
+            'confidences': [round(float(c), 3) for c in detections['confidence']],
+            'model': self.model.model_path,
+            'time': now
+        }) + '\n')
+        return sample_id
+
+    def _trigger_region(self, frame, boxes):
+        """Crop around the union of the triggering boxes (grown by hash_margin)."""
+        x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+        x2, y2 = boxes[:, 2].max(), boxes[:, 3].max()
+        mx, my = (x2 - x1) * self.hash_margin, (y2 - y1) * self.hash_margin
+        h, w = frame.shape[:2]
+        x1, y1 = max(0, int(x1 - mx)), max(0, int(y1 - my))
+        x2, y2 = min(w, int(x2 + mx) + 1), min(h, int(y2 + my) + 1)
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            return frame
+        return frame[y1:y2, x1:x2]
+
+    def get_stats(self):
+        return dict(self.stats, remaining=self.remaining)
+
+    def close(self):
+        self.manifest.close()
+        stats = self.get_stats()
+        print(f"[ACTIVE] {stats['sampled']} samples kept ({stats['uncertain']} uncertain, "
+              f"{stats['disagreement']} disagreements seen; {stats['duplicates']} near-duplicates, "
+              f"{stats['over_budget']} over budget, {stats['dropped']} dropped).")
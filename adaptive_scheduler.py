@@ -0,0 +1,202 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: adaptive_scheduler.py
+PURPOSE: Low baseline inference rate that escalates while a defect is suspected.
+Based on: SECTION 4: LIVE AI MODEL STRUCTURE
+================================================================================
+
+A fixed 5 FPS spends most of its compute confirming that a healthy print is
+still healthy. The scheduler runs the AI at a low baseline rate and keeps
+every detection above a low "suspect" confidence as a short-lived track.
+While any track is alive it:
+  - raises the AI sampler to the escalated rate, and
+  - asks the model for full-resolution tiles around each track's box
+    (LiveAIModel.detect_suspects), even on frames where the downscaled
+    pass misses it.
+A track is reported only after `confirm_hits` detections above the layer
+threshold within its history window. Once nothing has been seen for
+`hold_seconds`, the rate drops back to baseline.
+
+Worst case time-to-detect is about one baseline period plus
+confirm_hits escalated periods plus inference time (1 s + 2 x 0.2 s + latency
+with the defaults), inside the plan's 3 second target.
+"""
+
+import time
+from collections import deque
+import numpy as np
+from ai_model import DETECTION_DTYPE
+
+
+class _DefectTrack:
+    """Recent history of one suspected defect (same class, overlapping boxes)."""
+    def __init__(self, track_id, class_id, bbox, now):
+        self.track_id = track_id
+        self.class_id = class_id
+        self.bbox = bbox
+        self.first_seen = now
+        self.last_seen = now
+        self.history = deque()          # (time, confidence)
+        self.confirmed_at = None
+
+    def add(self, confidence, bbox, now, window):
+        self.bbox = bbox
+        self.last_seen = now
+        self.history.append((now, confidence))
+        while self.history and now - self.history[0][0] > window:
+            self.history.popleft()
+
+    def hits_above(self, threshold):
+        return sum(1 for _, conf in self.history if conf > threshold)
+
+
+def _iou(box, boxes):
+    tl = np.maximum(box[:2], boxes[:, :2])
+    br = np.minimum(box[2:], boxes[:, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=1)
+    area = np.prod(box[2:] - box[:2])
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+class LiveAdaptiveScheduler:
+    """
+    Drives a LiveFrameSampler's rate and LiveAIModel's focus regions from
+    the detections of each analyzed frame. Used by LiveAIThread in place of
+    calling LiveAIModel.analyze_live directly.
+    """
+    def __init__(self, sampler, baseline_hz=1.0, escalated_hz=5.0, suspect_threshold=0.25,
+                 confirm_hits=2, history_seconds=3.0, hold_seconds=5.0, track_iou=0.2):
+        self.sampler = sampler
+        self.baseline_hz = baseline_hz
+        self.escalated_hz = escalated_hz
+        self.suspect_threshold = suspect_threshold
+        self.confirm_hits = confirm_hits
+        self.history_seconds = history_seconds
+        self.hold_seconds = hold_seconds
+        self.track_iou = track_iou
+
+        self.tracks = []
+        self._next_track_id = 1
+        self.escalated = False
+        self.escalated_until = 0.0
+
+        # Stats
+        self.inferences = 0
+        self.escalations = 0
+        self.escalated_time = 0.0
+        self._escalated_since = None
+        self.confirm_delays = []        # first suspect -> confirmed, seconds
+        self.start_time = time.time()
+
+        self.sampler.set_rate(baseline_hz)
+        print(f"[SCHEDULER] Adaptive scheduler: {baseline_hz} FPS baseline, "
+              f"{escalated_hz} FPS while a defect is suspected (>= {suspect_threshold:.2f}).")
+
+    @property
+    def active(self):
+        """True while escalated; callers should not skip frames then (e.g. change gate)."""
+        return self.escalated
+
+    def focus_boxes(self):
+        """Full-frame boxes of live tracks, for full-resolution tiling."""
+        return [track.bbox for track in self.tracks]
+
+    def analyze(self, model, frame, roi=None, now=None):
+        """
+        Run the model on one frame and return the best confirmed defect dict
+        (like LiveAIModel.analyze_live), or None.
+        """
+        now = time.time() if now is None else now
+        with model.inference_lock:
+            threshold = model.get_threshold(model.current_layer)
+            detections = model.detect_suspects(frame, roi, threshold, self.suspect_threshold,
+                                               focus=self.focus_boxes())
+            if model.uncertain_floor is not None:
+                model.keep_uncertain(detections, threshold)
+            confirmed = self.update(detections, threshold, now)
+            model.last_detections = confirmed
+            return model.best_defect(confirmed, roi)
+
+    def update(self, detections, threshold, now=None):
+        """
+        Feed one frame's detections (DETECTION_DTYPE, >= suspect threshold).
+        Updates tracks and the sampler rate; returns the rows of confirmed
+        tracks that are above `threshold` in this frame.
+        """
+        now = time.time() if now is None else now
+        self.inferences += 1
+        if detections is None:
+            detections = np.empty(0, dtype=DETECTION_DTYPE)
+
+        # --- Associate detections with tracks (greedy, most confident first) ---
+        matched = set()
+        keep = np.zeros(len(detections), dtype=bool)
+        for i in np.argsort(-detections['confidence']):
+            det = detections[i]
+            candidates = [t for t in self.tracks if t.class_id == det['class_id'] and t.track_id not in matched]
+            track = None
+            if candidates:
+                ious = _iou(det['bbox'], np.array([t.bbox for t in candidates]))
+                best = int(np.argmax(ious))
+                if ious[best] >= self.track_iou:
+                    track = candidates[best]
+            if track is None:
+                track = _DefectTrack(self._next_track_id, int(det['class_id']), det['bbox'].copy(), now)
+                self._next_track_id += 1
+                self.tracks.append(track)
+            matched.add(track.track_id)
+            track.add(float(det['confidence']), det['bbox'].copy(), now, self.history_seconds)
+
+            # --- Confirmation over the track's history ---
+            if det['confidence'] > threshold and track.hits_above(threshold) >= self.confirm_hits:
+                keep[i] = True
+                if track.confirmed_at is None:
+                    track.confirmed_at = now
+                    self.confirm_delays.append(now - track.first_seen)
+
+        # --- Forget tracks not seen for a while ---
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.history_seconds]
+
+        # --- Rate: escalate while anything is suspected, then decay ---
+        if len(detections):
+            self.escalated_until = now + self.hold_seconds
+        if now < self.escalated_until:
+            self._escalate(now)
+        else:
+            self._relax(now)
+
+        return detections[keep]
+
+    def _escalate(self, now):
+        if not self.escalated:
+            self.escalated = True
+            self.escalations += 1
+            self._escalated_since = now
+            self.sampler.set_rate(self.escalated_hz)
+            print(f"[SCHEDULER] Defect suspected: AI rate -> {self.escalated_hz} FPS.")
+
+    def _relax(self, now):
+        if self.escalated:
+            self.escalated = False
+            self.escalated_time += now - self._escalated_since
+            self._escalated_since = None
+            self.sampler.set_rate(self.baseline_hz)
+            print(f"[SCHEDULER] Clear for {self.hold_seconds}s: AI rate -> {self.baseline_hz} FPS.")
+
+    def get_stats(self, now=None):
+        now = time.time() if now is None else now
+        escalated_time = self.escalated_time
+        if self._escalated_since is not None:
+            escalated_time += now - self._escalated_since
+        elapsed = max(1e-9, now - self.start_time)
+        return {
+            'inferences': self.inferences,
+            'avg_rate_hz': self.inferences / elapsed,
+            'escalations': self.escalations,
+            'escalated_ratio': escalated_time / elapsed,
+            'tracks': len(self.tracks),
+            'avg_confirm_s': float(np.mean(self.confirm_delays)) if self.confirm_delays else 0.0,
+            'max_confirm_s': float(np.max(self.confirm_delays)) if self.confirm_delays else 0.0
+        }
@@ -8,21 +8,89 @@ Based on: SECTION 4: LIVE AI MODEL STRUCTURE
 """
 
 import os
+import copy
+import glob
 import shutil
 import time
+import threading
+from queue import Queue, Full, Empty
 import numpy as np
 import cv2
-import torch
-from ultralytics import YOLO
+from tiled_inference import LiveTileGrid, merge_detections, TILING_MODES
+
+# One row per detection kept by LiveAIModel.detect_live
+DETECTION_DTYPE = np.dtype([
+    ('class_id', np.int16),
+    ('roi', np.int16),          # index into ROIMask.regions (crop mode), else 0
+    ('confidence', np.float32),
+    ('bbox', np.float32, (4,))  # [x1, y1, x2, y2], full-frame pixels
+])
+
+# Adaptive confidence threshold per layer (last entry applies to all later layers)
+# More sensitive early (< 10), less sensitive to small issues later (>= 50)
+THRESHOLD_TABLE = np.array([0.70] * 10 + [0.75] * 40 + [0.80])
+
+# torch and ultralytics take seconds to import. They are loaded on first use
+# (see import_heavy) so importing this module is cheap and the model can be
+# loaded in parallel with the rest of startup.
+torch = None
+YOLO = None
+
+def import_heavy():
+    """Import torch and ultralytics on first use."""
+    global torch, YOLO
+    if YOLO is None:
+        import torch as _torch
+        from ultralytics import YOLO as _YOLO
+        torch, YOLO = _torch, _YOLO
+
+# Inference backends LiveAIModel can run. Exported models are produced by
+# AITrainer.export_live_model and loaded through ultralytics, which drives
+# onnxruntime / OpenVINO and returns the same Results objects as PyTorch.
+INFERENCE_BACKENDS = ('torch', 'onnx', 'openvino')
+
+def resolve_backend_path(model_path, backend, prefer_int8=True):
+    """Find the exported model for `backend` next to a .pt file (None if missing)."""
+    if backend == 'torch':
+        return model_path
+    path = model_path.rstrip('/\\')
+    stem, ext = os.path.splitext(path)
+    if backend == 'onnx':
+        if ext == '.onnx':
+            return path
+        candidates = [stem + '_int8.onnx', stem + '.onnx']
+    elif backend == 'openvino':
+        if path.endswith('_openvino_model'):
+            return path
+        candidates = [stem + '_int8_openvino_model', stem + '_openvino_model']
+    else:
+        raise ValueError(f"Unknown backend '{backend}'. Choose from {INFERENCE_BACKENDS}.")
+    if not prefer_int8:
+        candidates.reverse()
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return None
 
 class LiveAIModel:
     """
     Wrapper for YOLOv8 model for live inference.
     Based on: Live AI Model Wrapper
     """
-    def __init__(self, model_path='yolov8n.pt'):
+    def __init__(self, model_path='yolov8n.pt', frame_skip=1, backend='torch'):
+        import_heavy()
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"[AI] Initializing AI model on device: {self.device}")
+        print(f"[AI] Initializing AI model on device: {self.device} (backend: {backend})")
+        
+        self.backend = backend
+        if backend != 'torch':
+            exported = resolve_backend_path(model_path, backend)
+            if exported is None:
+                print(f"[AI] WARNING: No {backend} export found for '{model_path}'.")
+                print("[AI] Run AITrainer.export_live_model() first. Falling back to torch.")
+                self.backend = 'torch'
+            else:
+                model_path = exported
         
         if not os.path.exists(model_path):
             print(f"[AI] WARNING: Model file not found at '{model_path}'.")
@@ -30,7 +98,11 @@ class LiveAIModel:
             model_path = 'yolov8n.pt'
             
         try:
-            self.model = YOLO(model_path).to(self.device)
+            if self.backend == 'torch':
+                self.model = YOLO(model_path).to(self.device)
+            else:
+                # ultralytics runs exported models through onnxruntime / OpenVINO
+                self.model = YOLO(model_path, task='detect')
             print(f"[AI] Model loaded: {model_path}")
             if hasattr(self.model, 'names'):
                  print(f"[AI] Model classes: {self.model.names}")
@@ -39,53 +111,392 @@ class LiveAIModel:
             print(f"[AI] Error: {e}")
             raise
 
+        self.model_path = model_path
+        self._build_class_table()
+        # Held for each analyzed frame; a hot swap (see model_swap.py) waits
+        # for it, so the model only ever changes between frames.
+        self.inference_lock = threading.RLock()
+        self.min_threshold = float(THRESHOLD_TABLE.min())
+        self.last_detections = None
+        # Detections just below the layer threshold, kept for active learning
+        # (see active_learning.py); off unless enable_uncertainty() is called
+        self.uncertain_floor = None
+        self.last_uncertain = None
+        self.reset_latency()
+        self.enable_tiling('off')
+
         self.frame_count = 0
+        # Frames are normally decimated upstream by LiveFrameSampler.
+        # Set frame_skip=6 to analyze only every 6th call instead.
+        self.frame_skip = max(1, int(frame_skip))
         self.current_layer = 0 # This should be updated by the main loop
     
-    def analyze_live(self, frame):
+    def analyze_live(self, frame, roi=None):
         """
         Analyze a single frame and return the highest confidence defect.
-        Handles its own frame skipping.
+        Every call runs inference unless frame_skip > 1.
+        If `roi` is an ROIMask in crop mode, only its region crops are sent
+        to the model (as one batch) and boxes are mapped back to full-frame
+        coordinates.
+        All defects above threshold are kept in self.last_detections.
         """
         self.frame_count += 1
         
-        # Skip frames to achieve target FPS (e.g., 5 FPS from 30 FPS)
-        if self.frame_count % 6 != 0:
+        # Optional legacy skipping (e.g., 5 FPS from 30 FPS with frame_skip=6)
+        if self.frame_count % self.frame_skip != 0:
             return None
         
-        # Run YOLO inference
+        with self.inference_lock:
+            detections = self.detect_live(frame, roi)
+            self.last_detections = detections
+            return self.best_defect(detections, roi)
+    
+    def detect_live(self, frame, roi=None):
+        """
+        Run inference and return every defect above the current layer's
+        threshold as a DETECTION_DTYPE structured array (or None on error).
+        Uses the tiling schedule set by enable_tiling (default: one pass).
+        """
+        with self.inference_lock:
+            threshold = self.get_threshold(self.current_layer)
+            if self.uncertain_floor is not None:
+                # Same single pass, with a lower cut-off; the extra rows are
+                # split off into last_uncertain
+                low = min(self.uncertain_floor, threshold)
+                if self.tiling_mode == 'coarse_fine':
+                    detections = self.detect_suspects(frame, roi, threshold, low)
+                elif self.tiling_mode == 'full':
+                    detections = self._detect_tiles(frame, roi, None, low)
+                else:
+                    detections = self._detect_frame(frame, roi, low)
+                return self.keep_uncertain(detections, threshold)
+            if self.tiling_mode == 'full':
+                return self._detect_tiles(frame, roi, None, threshold)
+            if self.tiling_mode == 'coarse_fine':
+                return self._detect_coarse_fine(frame, roi, threshold)
+            return self._detect_frame(frame, roi, threshold)
+    
+    def enable_uncertainty(self, floor):
+        """Keep detections between `floor` and the layer threshold in last_uncertain."""
+        self.uncertain_floor = floor
+        self.last_uncertain = None
+        print(f"[AI] Keeping uncertain detections down to {floor:.2f}")
+    
+    def keep_uncertain(self, detections, threshold):
+        """Store the rows in [uncertain_floor, threshold] and return the rows above threshold."""
+        if detections is None:
+            self.last_uncertain = None
+            return None
+        confidence = detections['confidence']
+        if self.uncertain_floor is not None:
+            self.last_uncertain = detections[(confidence >= self.uncertain_floor) & (confidence <= threshold)]
+        return detections[confidence > threshold]
+    
+    def detect_batch(self, frames, rois=None, layers=None):
+        """
+        One forward pass over several independent frames (e.g. one per
+        printer, see inference_service.py). Each frame has its own ROI and
+        layer threshold. Returns one DETECTION_DTYPE array per frame, or a
+        list of None on error. Tiling is not applied to batches.
+        """
+        rois = [None] * len(frames) if rois is None else rois
+        layers = [self.current_layer] * len(frames) if layers is None else layers
+        
+        images, owner, offsets, first_image = [], [], [], []
+        for i, (frame, roi) in enumerate(zip(frames, rois)):
+            first_image.append(len(images))
+            if roi is not None and roi.crop_mode:
+                for region, crop in roi.crop_live(frame):
+                    images.append(crop)
+                    owner.append(i)
+                    offsets.append((region.x1, region.y1, region.x1, region.y1))
+            else:
+                images.append(frame)
+                owner.append(i)
+                offsets.append((0, 0, 0, 0))
+        
+        thresholds = np.array([self.get_threshold(layer) for layer in layers], dtype=np.float32)
+        with self.inference_lock:
+            detections = self._run_batch(images, float(thresholds.min()))
+        if detections is None:
+            return [None] * len(frames)
+        
+        # Image index -> owning frame, full-frame box and ROI index within that frame
+        owner = np.array(owner, dtype=np.int64)
+        image = detections['roi'].astype(np.int64)
+        frame_of = owner[image]
+        detections['bbox'] += np.array(offsets, dtype=np.float32)[image]
+        detections['roi'] = image - np.array(first_image, dtype=np.int64)[frame_of]
+        keep = detections['confidence'] > thresholds[frame_of]
+        return [detections[keep & (frame_of == i)] for i in range(len(frames))]
+    
+    def _detect_frame(self, frame, roi, threshold):
+        """One pass over the frame (or the ROI crops, as one batch)."""
+        # Crop only on frames that will actually be analyzed
+        regions = None
+        if roi is not None and roi.crop_mode:
+            regions, crops = zip(*roi.crop_live(frame))
+            frame = list(crops)
+        
+        detections = self._run_batch(frame, threshold)
+        if regions is not None and detections is not None and len(detections):
+            # Crop coordinates -> full-frame coordinates
+            offsets = np.array([[r.x1, r.y1, r.x1, r.y1] for r in regions], dtype=np.float32)
+            detections['bbox'] += offsets[detections['roi']]
+        
+        return detections
+    
+    def _run_batch(self, images, threshold, imgsz=None):
+        """
+        Run YOLO on an image or list of images (one forward pass) and return
+        the detections above `threshold` with 'roi' set to the image index.
+        Filtering happens on the model's output tensor; only the kept rows
+        are copied to the host, in one transfer.
+        """
+        # Run YOLO inference. The model's own cut-off is the lowest threshold
+        # in use; the exact threshold is applied below.
+        kwargs = {'conf': min(self.min_threshold, threshold), 'verbose': False}
+        if imgsz is not None:
+            kwargs['imgsz'] = imgsz
         try:
-            results = self.model(frame, conf=0.75, verbose=False)
+            start = time.perf_counter()
+            results = self.model(images, **kwargs)
+            self._record_latency(time.perf_counter() - start)
         except Exception as e:
             print(f"[AI] Error during model inference: {e}")
             return None
-            
-        highest_conf_defect = None
-        
-        # Process results
-        for r in results:
-            for box in r.boxes:
-                class_id = int(box.cls)
-                confidence = float(box.conf)
-                
-                # Get adaptive threshold
-                threshold = self.get_threshold(self.current_layer)
-                
-                if confidence > threshold:
-                    defect_type = self.map_class_to_defect(class_id)
-                    
-                    if defect_type != 'unknown':
-                        defect = {
-                            'type': defect_type,
-                            'confidence': confidence,
-                            'bbox': box.xyxy[0].cpu().tolist() # [x1, y1, x2, y2]
-                        }
-                        
-                        # Store the highest confidence defect
-                        if highest_conf_defect is None or confidence > highest_conf_defect['confidence']:
-                            highest_conf_defect = defect
-        
-        return highest_conf_defect
+        
+        # (N, 7): x1, y1, x2, y2, conf, cls, image index - still on device
+        data = torch.cat([
+            torch.cat([r.boxes.data, torch.full((len(r.boxes), 1), i,
+                                                dtype=r.boxes.data.dtype,
+                                                device=r.boxes.data.device)], dim=1)
+            for i, r in enumerate(results)
+        ])
+        if data.shape[0] == 0:
+            return np.empty(0, dtype=DETECTION_DTYPE)
+        
+        # One mask: confidence over threshold and class maps to a defect
+        valid = self._class_valid_on(data.device)
+        cls = data[:, 5].long().clamp(0, valid.shape[0] - 1)
+        keep = (data[:, 4] > threshold) & valid[cls] & (data[:, 5] < valid.shape[0])
+        
+        # Single device-to-host transfer
+        kept = data[keep].cpu().numpy()
+        
+        detections = np.empty(len(kept), dtype=DETECTION_DTYPE)
+        detections['bbox'] = kept[:, :4]
+        detections['confidence'] = kept[:, 4]
+        detections['class_id'] = kept[:, 5]
+        detections['roi'] = kept[:, 6]
+        return detections
+    
+    # --- Tiled inference (see tiled_inference.py) ---
+    
+    def enable_tiling(self, mode='coarse_fine', tile_size=640, overlap=0.2,
+                      suspect_threshold=0.25, margin=32):
+        """
+        Analyze the ROI as overlapping full-resolution tiles.
+        mode: 'off', 'full' (all tiles every frame) or 'coarse_fine' (one
+        downscaled pass, then tiles only around boxes scoring between
+        suspect_threshold and the layer threshold).
+        """
+        if mode not in TILING_MODES:
+            raise ValueError(f"Unknown tiling mode '{mode}'. Choose from {TILING_MODES}.")
+        self.tiling_mode = mode
+        self.tile_size = tile_size
+        self.tile_overlap = overlap
+        self.suspect_threshold = suspect_threshold
+        self.tile_margin = margin
+        self._tile_grids = {}
+        if mode != 'off':
+            print(f"[AI] Tiling: {mode} ({tile_size}px tiles)")
+    
+    def _tile_grid(self, frame, roi):
+        """Tile grid for this frame size and ROI (built once, then cached)."""
+        h, w = frame.shape[:2]
+        if roi is not None and roi.crop_mode:
+            h, w = roi.height, roi.width
+        key = (h, w, id(roi))
+        if key not in self._tile_grids:
+            self._tile_grids[key] = LiveTileGrid(roi, w, h, self.tile_size, self.tile_overlap)
+        return self._tile_grids[key]
+    
+    def _detect_tiles(self, frame, roi, indices, threshold):
+        """Run the tiles in `indices` (all if None) as one batch and merge across tiles."""
+        grid = self._tile_grid(frame, roi)
+        if roi is not None and roi.crop_mode and (frame.shape[0] != roi.height or frame.shape[1] != roi.width):
+            frame = cv2.resize(frame, (roi.width, roi.height))
+        indices = np.arange(len(grid.tiles)) if indices is None else indices
+        if len(indices) == 0:
+            return np.empty(0, dtype=DETECTION_DTYPE)
+        
+        self.tile_stats['tile_passes'] += 1
+        self.tile_stats['tiles'] += len(indices)
+        detections = self._run_batch(grid.crop_tiles(frame, indices), threshold, imgsz=self.tile_size)
+        if detections is None or len(detections) == 0:
+            return detections
+        
+        # Tile coordinates -> full-frame coordinates; 'roi' becomes the region index
+        tile = indices[detections['roi']]
+        detections['bbox'] += grid.offsets[tile]
+        detections['roi'] = grid.tile_region[tile]
+        return merge_detections(detections)
+    
+    def _detect_coarse_fine(self, frame, roi, threshold):
+        """Downscaled pass first; full-resolution tiles only where it is unsure."""
+        detections = self.detect_suspects(frame, roi, threshold)
+        if detections is None:
+            return None
+        return detections[detections['confidence'] > threshold]
+    
+    def detect_suspects(self, frame, roi, threshold, suspect_threshold=None, focus=None):
+        """
+        Coarse pass at `suspect_threshold`, then full-resolution tiles around
+        every box that did not reach `threshold`, plus any `focus` boxes
+        (full-frame [x1, y1, x2, y2], e.g. from LiveAdaptiveScheduler).
+        Returns all merged detections above suspect_threshold, including the
+        low-confidence ones the caller may want to track.
+        """
+        with self.inference_lock:
+            suspect_threshold = self.suspect_threshold if suspect_threshold is None else suspect_threshold
+            suspect_threshold = min(suspect_threshold, threshold)
+            self.tile_stats['coarse_passes'] += 1
+            coarse = self._detect_frame(frame, roi, suspect_threshold)
+            if coarse is None:
+                return None
+        
+            boxes = coarse['bbox'][coarse['confidence'] <= threshold]
+            if focus is not None and len(focus):
+                boxes = np.concatenate([boxes, np.asarray(focus, dtype=np.float32).reshape(-1, 4)])
+            if len(boxes) == 0:
+                return coarse
+        
+            grid = self._tile_grid(frame, roi)
+            fine = self._detect_tiles(frame, roi, grid.tiles_around(boxes, self.tile_margin), suspect_threshold)
+            if fine is None or len(fine) == 0:
+                return coarse
+            return merge_detections(np.concatenate([coarse, fine]))
+    
+    # --- Hot swap (see model_swap.py) ---
+    
+    def get_state(self):
+        """Everything that changes when the weights change."""
+        return {
+            'model': self.model,
+            'model_path': self.model_path,
+            'backend': self.backend,
+            'class_to_defect': self.class_to_defect,
+            'class_valid': self.class_valid,
+            'class_valid_device': self._class_valid_device
+        }
+    
+    def set_state(self, state):
+        """Switch to another loaded model between frames."""
+        with self.inference_lock:
+            self.model = state['model']
+            self.model_path = state['model_path']
+            self.backend = state['backend']
+            self.class_to_defect = state['class_to_defect']
+            self.class_valid = state['class_valid']
+            self._class_valid_device = state['class_valid_device']
+            self.last_detections = None
+            self.last_uncertain = None
+    
+    def detached(self):
+        """
+        Another LiveAIModel on the currently loaded weights, with its own
+        last_detections / last_uncertain and latency stats, so running it
+        never changes what the live pipeline reads. Shares the inference
+        lock, so its frames still run one at a time with the live ones.
+        """
+        clone = copy.copy(self)
+        clone.set_state(self.get_state())
+        clone.reset_latency()
+        return clone
+    
+    def swap_from(self, other):
+        """Take over `other`'s (loaded, warmed-up) model. Returns the previous state."""
+        with self.inference_lock:
+            previous = self.get_state()
+            self.set_state(other.get_state())
+        print(f"[AI] Model swapped: {previous['model_path']} -> {self.model_path}")
+        return previous
+    
+    def best_defect(self, detections, roi=None):
+        """Highest confidence detection as a defect dict, or None."""
+        if detections is None or len(detections) == 0:
+            return None
+        return self.detection_to_defect(detections[np.argmax(detections['confidence'])], roi)
+    
+    def detection_to_defect(self, detection, roi=None):
+        """Convert one DETECTION_DTYPE row to the defect dict used downstream."""
+        defect = {
+            'type': str(self.class_to_defect[detection['class_id']]),
+            'confidence': float(detection['confidence']),
+            'bbox': detection['bbox'].tolist() # [x1, y1, x2, y2]
+        }
+        if roi is not None and roi.crop_mode:
+            defect['roi'] = roi.regions[detection['roi']].name
+        return defect
+    
+    def warmup(self, roi=None, width=1920, height=1080, tiles=None):
+        """
+        Run one inference on a blank frame so the lazy setup (predictor,
+        CUDA kernels, tile grids) is paid before monitoring starts, not on
+        the first real frame. `tiles` also warms the full-resolution tile
+        path (default: if tiling is on). Returns the warm-up time in seconds.
+        """
+        start = time.perf_counter()
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.detect_live(frame, roi)
+        if tiles is None:
+            tiles = self.tiling_mode != 'off'
+        if tiles:
+            self._detect_tiles(frame, roi, np.arange(1), 1.0)
+        self.reset_latency()
+        self.last_detections = None
+        self.last_uncertain = None
+        elapsed = time.perf_counter() - start
+        print(f"[AI] Warm-up inference done in {elapsed:.2f}s")
+        return elapsed
+    
+    def reset_latency(self):
+        self.tile_stats = {'coarse_passes': 0, 'tile_passes': 0, 'tiles': 0}
+        self.inference_count = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+    
+    def _record_latency(self, seconds):
+        self.inference_count += 1
+        self.total_latency += seconds
+        self.last_latency = seconds
+    
+    def get_latency_stats(self):
+        """Per-backend inference latency (model call only, includes pre/post-processing)."""
+        return {
+            'backend': self.backend,
+            'inferences': self.inference_count,
+            'avg_ms': 1000.0 * self.total_latency / self.inference_count if self.inference_count else 0.0,
+            'last_ms': 1000.0 * self.last_latency,
+            'tiling': self.tiling_mode,
+            **self.tile_stats
+        }
+    
+    def _build_class_table(self):
+        """Precompute class id -> defect type, and which ids are real defects."""
+        names = getattr(self.model, 'names', None)
+        count = len(names) if names else 1
+        self.class_to_defect = np.array([self.map_class_to_defect(i) for i in range(count)], dtype=object)
+        self.class_valid = self.class_to_defect != 'unknown'
+        self._class_valid_device = {}
+    
+    def _class_valid_on(self, device):
+        """class_valid as a bool tensor on `device` (cached)."""
+        key = str(device)
+        if key not in self._class_valid_device:
+            self._class_valid_device[key] = torch.as_tensor(self.class_valid, device=device)
+        return self._class_valid_device[key]
     
     def map_class_to_defect(self, class_id):
         """Map model classes to defect types"""
@@ -102,17 +513,176 @@ class LiveAIModel:
     
     def get_threshold(self, layer):
         """
-        Adaptive confidence threshold.
+        Adaptive confidence threshold, looked up from THRESHOLD_TABLE.
         Be less sensitive in early layers (adhesion issues).
         """
-        self.current_layer = layer
-        if layer < 10: return 0.70 # More sensitive
-        elif layer < 50: return 0.75
-        else: return 0.80 # Less sensitive to small issues
+        return float(THRESHOLD_TABLE[min(max(int(layer), 0), len(THRESHOLD_TABLE) - 1)])
         
     def set_current_layer(self, layer):
         self.current_layer = layer
 
+def _box_iou(a, b):
+    """Pairwise IoU of two (N, 4) / (M, 4) xyxy arrays."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+def _detection_parity(reference, candidate, iou_threshold=0.5):
+    """Match detections by class + IoU. Returns (matched, missing, extra, max_conf_diff)."""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0, len(reference), len(candidate), 0.0
+    iou = _box_iou(reference['bbox'], candidate['bbox'])
+    iou[reference['class_id'][:, None] != candidate['class_id'][None, :]] = 0
+    matched, max_diff, used = 0, 0.0, set()
+    for i in np.argsort(-reference['confidence']):
+        j = int(np.argmax(iou[i]))
+        if iou[i, j] >= iou_threshold and j not in used:
+            used.add(j)
+            matched += 1
+            max_diff = max(max_diff, abs(float(reference['confidence'][i] - candidate['confidence'][j])))
+            iou[:, j] = 0
+    return matched, len(reference) - matched, len(candidate) - matched, max_diff
+
+def compare_backends(model_path, frames, backends=INFERENCE_BACKENDS, iou_threshold=0.5,
+                     conf_tolerance=0.05, warmup=2):
+    """
+    Run every available backend on the same frames.
+    Reports average latency per backend and output parity against the
+    first backend that loads (normally torch).
+    """
+    report = {}
+    reference = None
+    for backend in backends:
+        try:
+            model = LiveAIModel(model_path, backend=backend)
+        except Exception as e:
+            report[backend] = {'error': str(e)}
+            continue
+        if model.backend != backend:
+            report[backend] = {'error': 'export not found'}
+            continue
+        
+        for _ in range(warmup):
+            model.detect_live(frames[0])
+        model.reset_latency()
+        outputs = [model.detect_live(frame) for frame in frames]
+        entry = model.get_latency_stats()
+        
+        if reference is None:
+            reference = outputs
+            entry['parity'] = 'reference'
+        else:
+            matched = missing = extra = 0
+            max_diff = 0.0
+            for ref_out, out in zip(reference, outputs):
+                m, mi, ex, diff = _detection_parity(ref_out, out, iou_threshold)
+                matched, missing, extra = matched + m, missing + mi, extra + ex
+                max_diff = max(max_diff, diff)
+            entry.update({
+                'matched': matched, 'missing': missing, 'extra': extra,
+                'max_conf_diff': max_diff,
+                'parity': 'ok' if missing == 0 and extra == 0 and max_diff <= conf_tolerance else 'MISMATCH'
+            })
+        report[backend] = entry
+        print(f"[AI] Backend {backend}: {entry['avg_ms']:.1f} ms/frame, parity: {entry['parity']}")
+    return report
+
+def _letterbox_geometry(h, w, size):
+    """(scale, new_w, new_h, left, top) of a size x size letterbox."""
+    scale = size / max(h, w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    return scale, new_w, new_h, (size - new_w) // 2, (size - new_h) // 2
+
+def _letterbox(image, size):
+    """Resize keeping aspect ratio and pad to a size x size square (YOLO style)."""
+    h, w = image.shape[:2]
+    _, new_w, new_h, left, top = _letterbox_geometry(h, w, size)
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+def _calibration_images(calibration_dir, samples):
+    """Evenly spaced RGB samples from a LiveDataCollector directory."""
+    paths = sorted(glob.glob(os.path.join(calibration_dir, '*.jpg')) +
+                   glob.glob(os.path.join(calibration_dir, '*.png')))
+    if len(paths) > samples:
+        paths = [paths[int(i)] for i in np.linspace(0, len(paths) - 1, samples)]
+    return paths
+
+# Class names for datasets without a classes.txt (see prepare_dataset)
+DEFAULT_CLASS_NAMES = ['warping', 'stringing', 'spaghetti']
+
+def _parse_sample_name(stem):
+    """
+    '<defect>_rgb_<layer>_<sample_id>' -> (defect, layer, session).
+    sample_id is '<session start>-<counter>' (LiveDataCollector); older
+    samples used a Unix timestamp, grouped by day instead.
+    """
+    if '_rgb_' not in stem:
+        return None
+    defect, rest = stem.rsplit('_rgb_', 1)
+    layer, _, sample_id = rest.partition('_')
+    if '-' in sample_id:
+        session = sample_id.rsplit('-', 1)[0]
+    elif sample_id.isdigit():
+        session = 'day-' + time.strftime('%Y%m%d', time.localtime(int(sample_id)))
+    else:
+        session = sample_id
+    return defect, int(layer) if layer.lstrip('-').isdigit() else 0, session
+
+def _file_state(path):
+    if path is None or not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def _build_sample(task):
+    """
+    Dataset builder worker (runs in a process pool): resize/letterbox one
+    image to the training size, adjust and write its labels.
+    Returns (stem, class ids, error or None).
+    """
+    stem, image_path, label_path, out_image, out_label, imgsz, letterbox, quality = task
+    try:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise IOError(f"cannot read {image_path}")
+        h, w = image.shape[:2]
+        rows = []
+        if label_path is not None:
+            with open(label_path, 'r') as f:
+                rows = [line.split() for line in f if line.strip()]
+        classes = [int(row[0]) for row in rows]
+
+        if letterbox:
+            scale, new_w, new_h, left, top = _letterbox_geometry(h, w, imgsz)
+            image = _letterbox(image, imgsz)
+            # Normalized to the original frame -> normalized to the square
+            lines = []
+            for row in rows:
+                xc, yc, bw, bh = (float(v) for v in row[1:5])
+                lines.append(f"{row[0]} {(xc * new_w + left) / imgsz:.6f} {(yc * new_h + top) / imgsz:.6f} "
+                             f"{bw * new_w / imgsz:.6f} {bh * new_h / imgsz:.6f}")
+        else:
+            # Longest side to imgsz; normalized labels stay valid
+            if max(h, w) > imgsz:
+                scale = imgsz / max(h, w)
+                image = cv2.resize(image, (int(round(w * scale)), int(round(h * scale))),
+                                   interpolation=cv2.INTER_AREA)
+            lines = [' '.join(row) for row in rows]
+
+        if not cv2.imwrite(out_image, image, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+            raise IOError(f"cannot write {out_image}")
+        with open(out_label, 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        return stem, classes, None
+    except Exception as e:
+        return stem, [], str(e)
+
 class AITrainer:
     """
     Handles structuring and running the YOLO training process.
@@ -121,35 +691,236 @@ class AITrainer:
     def __init__(self, dataset_path='dataset/'):
         self.dataset_path = dataset_path
         self.model_output = 'models/'
+        self.parity_report = None # Last export parity check (see export_live_model)
         os.makedirs(self.model_output, exist_ok=True)
         print(f"[TRAINER] AI Trainer initialized. Dataset path: {dataset_path}")
 
-    def prepare_dataset(self):
+    def prepare_dataset(self, names=DEFAULT_CLASS_NAMES):
         """
         Creates the required directory structure and dataset.yaml file.
         """
         print("[TRAINER] Preparing dataset directories...")
-        os.makedirs(f'{self.dataset_path}/images/train', exist_ok=True)
-        os.makedirs(f'{self.dataset_path}/images/val', exist_ok=True)
-        os.makedirs(f'{self.dataset_path}/labels/train', exist_ok=True)
-        os.makedirs(f'{self.dataset_path}/labels/val', exist_ok=True)
-        
+        self._make_dataset_dirs()
+        yaml_path = self._write_dataset_yaml(names)
+        print(f"[TRAINER] Created {yaml_path}. Ready for data.")
+        print("[TRAINER] Add your images and labels (from Roboflow, etc.) to these folders.")
+
+    def _make_dataset_dirs(self):
+        for kind in ('images', 'labels'):
+            for split in ('train', 'val'):
+                os.makedirs(f'{self.dataset_path}/{kind}/{split}', exist_ok=True)
+
+    def _write_dataset_yaml(self, names):
         yaml_path = f'{self.dataset_path}/dataset.yaml'
-        
-        # Create dataset.yaml
         with open(yaml_path, 'w') as f:
             f.write(f'''# YOLOv8 Dataset Config
 train: {os.path.abspath(self.dataset_path)}/images/train
 val: {os.path.abspath(self.dataset_path)}/images/val
 
 # Number of classes
-nc: 3
+nc: {len(names)}
 
 # Class names
-names: ['warping', 'stringing', 'spaghetti']
+names: {list(names)}
 ''')
-        print(f"[TRAINER] Created {yaml_path}. Ready for data.")
-        print("[TRAINER] Add your images and labels (from Roboflow, etc.) to these folders.")
+        return yaml_path
+
+    def build_dataset(self, raw_dir='live_raw_data/', imgsz=1920, letterbox=True, val_fraction=0.2,
+                      names=None, workers=None, quality=95):
+        """
+        Build the YOLO dataset from LiveDataCollector samples in raw_dir.
+        Only samples with a label file (.txt next to the .jpg, e.g. from
+        active learning pre-labels after review) are used; an empty label
+        file marks a clean background frame.
+
+        - Split: whole print sessions go to train or val, chosen so each
+          defect type gets about val_fraction of its samples in val (frames
+          of one print are too alike to be split). With a single session,
+          frames are split instead. Once assigned, a sample keeps its split.
+        - Images are letterboxed (or, with letterbox=False, shrunk) to
+          imgsz in a process pool; labels are adjusted to match.
+        - Incremental: a content-hash cache (.build_cache.json) skips
+          samples already built with the same settings, and outputs of
+          deleted samples are removed.
+        - names / nc come from `names`, else raw_dir/classes.txt, else
+          DEFAULT_CLASS_NAMES, extended if labels use higher ids.
+        Returns a summary dict.
+        """
+        import hashlib
+        import json
+        from concurrent.futures import ProcessPoolExecutor
+
+        start = time.perf_counter()
+        self._make_dataset_dirs()
+        cache_path = os.path.join(self.dataset_path, '.build_cache.json')
+        settings = f'imgsz={imgsz} letterbox={letterbox} quality={quality}'
+        cache = {'settings': settings, 'samples': {}, 'sessions': {}}
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as f:
+                cache = json.load(f)
+            if cache.get('settings') != settings:
+                print("[TRAINER] Build settings changed; rebuilding every sample.")
+                cache['settings'] = settings
+                for entry in cache['samples'].values():
+                    entry['hash'] = None
+
+        # --- Scan raw samples ---
+        found = {}
+        unlabeled = 0
+        for image_path in glob.glob(os.path.join(raw_dir, '*_rgb_*.jpg')):
+            stem = os.path.splitext(os.path.basename(image_path))[0]
+            parsed = _parse_sample_name(stem)
+            label_path = os.path.splitext(image_path)[0] + '.txt'
+            if parsed is None:
+                continue
+            if not os.path.exists(label_path):
+                unlabeled += 1
+                continue
+            found[stem] = (image_path, label_path) + parsed
+
+        # --- Content hashes (file size + mtime unchanged: reuse the cached hash) ---
+        samples = cache['samples']
+        for stem in [stem for stem in samples if stem not in found]:
+            split = samples.pop(stem)['split']
+            for path in (f'{self.dataset_path}/images/{split}/{stem}.jpg',
+                         f'{self.dataset_path}/labels/{split}/{stem}.txt'):
+                if os.path.exists(path):
+                    os.remove(path)
+        for stem, (image_path, label_path, defect, layer, session) in found.items():
+            state = [_file_state(image_path), _file_state(label_path)]
+            entry = samples.setdefault(stem, {'split': None, 'hash': None, 'built': None})
+            if entry.get('state') != state or entry['hash'] is None:
+                digest = hashlib.sha1(settings.encode())
+                for path in (image_path, label_path):
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+                entry['hash'] = digest.hexdigest()
+                entry['state'] = state
+            entry.update(defect=defect, layer=layer, session=session)
+
+        self._assign_splits(samples, cache['sessions'], val_fraction)
+
+        # --- Build what changed, in parallel ---
+        tasks = []
+        for stem, entry in samples.items():
+            if entry['built'] == entry['hash'] + entry['split']:
+                continue
+            # A sample never moves between splits, but clear a stale copy anyway
+            other = 'val' if entry['split'] == 'train' else 'train'
+            for path in (f'{self.dataset_path}/images/{other}/{stem}.jpg',
+                         f'{self.dataset_path}/labels/{other}/{stem}.txt'):
+                if os.path.exists(path):
+                    os.remove(path)
+            image_path, label_path = found[stem][:2]
+            tasks.append((stem, image_path, label_path,
+                          f'{self.dataset_path}/images/{entry["split"]}/{stem}.jpg',
+                          f'{self.dataset_path}/labels/{entry["split"]}/{stem}.txt',
+                          imgsz, letterbox, quality))
+
+        errors = 0
+        if tasks:
+            print(f"[TRAINER] Building {len(tasks)} new/changed samples "
+                  f"({len(samples) - len(tasks)} cached) with {workers or os.cpu_count()} processes...")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for done, (stem, classes, error) in enumerate(
+                        pool.map(_build_sample, tasks, chunksize=max(1, len(tasks) // 64)), 1):
+                    entry = samples[stem]
+                    if error is not None:
+                        errors += 1
+                        entry['built'] = None
+                        print(f"[TRAINER] Skipped {stem}: {error}")
+                    else:
+                        entry['built'] = entry['hash'] + entry['split']
+                        entry['classes'] = classes
+                    if done % 500 == 0:
+                        print(f"[TRAINER] {done}/{len(tasks)} samples built...")
+
+        # --- Class names and summary ---
+        if names is None:
+            classes_txt = os.path.join(raw_dir, 'classes.txt')
+            if os.path.exists(classes_txt):
+                with open(classes_txt, 'r') as f:
+                    names = [line.strip() for line in f if line.strip()]
+            else:
+                names = DEFAULT_CLASS_NAMES
+        names = list(names)
+        built = [entry for entry in samples.values() if entry['built']]
+        max_class = max((c for entry in built for c in entry.get('classes', [])), default=-1)
+        if max_class >= len(names):
+            print(f"[TRAINER] WARNING: labels use class id {max_class} but only {len(names)} names are known.")
+            names += [f'class{i}' for i in range(len(names), max_class + 1)]
+        yaml_path = self._write_dataset_yaml(names)
+
+        tmp = cache_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, cache_path)
+
+        summary = {'samples': len(built), 'built': len(tasks) - errors, 'cached': len(samples) - len(tasks),
+                   'errors': errors, 'unlabeled': unlabeled, 'seconds': time.perf_counter() - start,
+                   'names': names, 'splits': {}}
+        for split in ('train', 'val'):
+            in_split = [entry for entry in built if entry['split'] == split]
+            per_class = np.bincount([c for entry in in_split for c in entry.get('classes', [])],
+                                    minlength=len(names))
+            summary['splits'][split] = {
+                'images': len(in_split),
+                'sessions': len({entry['session'] for entry in in_split}),
+                'instances': {names[i]: int(n) for i, n in enumerate(per_class) if n}
+            }
+        print(f"[TRAINER] Dataset ready in {summary['seconds']:.1f}s: {summary['built']} built, "
+              f"{summary['cached']} cached, {errors} errors, {unlabeled} unlabeled samples skipped.")
+        for split, info in summary['splits'].items():
+            print(f"[TRAINER]   {split}: {info['images']} images from {info['sessions']} session(s), "
+                  f"instances {info['instances']}")
+        print(f"[TRAINER] Wrote {yaml_path} (nc={len(names)}).")
+        return summary
+
+    def _assign_splits(self, samples, sessions, val_fraction):
+        """
+        Give every sample without a split one, keeping the val share of
+        each defect type close to val_fraction. Sessions (or single frames,
+        if there is only one session) are assigned greedily, largest first.
+        """
+        pending = [stem for stem, entry in samples.items() if entry['split'] is None]
+        for stem in pending:
+            session = samples[stem]['session']
+            if session in sessions:
+                samples[stem]['split'] = sessions[session]
+        pending = [stem for stem in pending if samples[stem]['split'] is None]
+        if not pending:
+            return
+
+        totals, val = {}, {}
+        for entry in samples.values():
+            totals[entry['defect']] = totals.get(entry['defect'], 0) + 1
+            if entry['split'] == 'val':
+                val[entry['defect']] = val.get(entry['defect'], 0) + 1
+
+        by_session = len({samples[stem]['session'] for stem in samples}) > 1
+        if not by_session:
+            print("[TRAINER] Only one print session: splitting frames (val scores will be optimistic).")
+        groups = {}
+        for stem in sorted(pending):
+            key = samples[stem]['session'] if by_session else stem
+            groups.setdefault(key, []).append(stem)
+
+        def error(counts):
+            return sum(abs(counts.get(d, 0) - val_fraction * n) for d, n in totals.items())
+
+        for key in sorted(groups, key=lambda k: (-len(groups[k]), k)):
+            members = groups[key]
+            with_group = dict(val)
+            for stem in members:
+                defect = samples[stem]['defect']
+                with_group[defect] = with_group.get(defect, 0) + 1
+            split = 'val' if error(with_group) < error(val) else 'train'
+            if split == 'val':
+                val = with_group
+            for stem in members:
+                samples[stem]['split'] = split
+            if by_session:
+                sessions[key] = split
 
     def train_live_model(self, base_model='yolov8n.pt', epochs=100, batch=8):
         """
@@ -163,6 +934,7 @@ names: ['warping', 'stringing', 'spaghetti']
             return
 
         try:
+            import_heavy()
             model = YOLO(base_model)
             
             results = model.train(
@@ -184,7 +956,8 @@ names: ['warping', 'stringing', 'spaghetti']
                 final_path = os.path.join(self.model_output, final_model_name)
                 shutil.copy(best_model_path, final_path)
                 print(f"[TRAINER] Best model saved to: {final_path}")
-                print(f"[TRAINER] Copy this path to main.py to use the new model.")
+                print(f"[TRAINER] A running monitor watching {self.model_output} will validate and swap it in.")
+                print(f"[TRAINER] Otherwise, copy this path to main.py to use the new model.")
             else:
                 print(f"[TRAINER] Could not find 'best.pt' in {results.save_dir}")
 
@@ -193,32 +966,279 @@ names: ['warping', 'stringing', 'spaghetti']
             print("[TRAINER] Ensure 'ultralytics' is installed and CUDA is set up.")
 
 
+    def export_live_model(self, model_path, backends=('onnx',), int8=False,
+                          calibration_dir='live_raw_data/', imgsz=640, calibration_samples=100,
+                          parity_samples=8):
+        """
+        Export a trained model for CPU inference backends.
+        'onnx'     -> <stem>.onnx, plus <stem>_int8.onnx if int8
+                      (static quantization calibrated on calibration_dir)
+        'openvino' -> <stem>_openvino_model/ (<stem>_int8_openvino_model/ if int8)
+        Afterwards every export is checked against torch on parity_samples
+        frames from calibration_dir (latency and outputs, see
+        compare_backends; 0 = skip). The report is kept in
+        self.parity_report; a MISMATCH is printed as a warning.
+        Returns {backend: exported_path}. Load with LiveAIModel(model_path, backend=...).
+        """
+        import_heavy()
+        exported = {}
+        for backend in backends:
+            try:
+                model = YOLO(model_path)
+                if backend == 'onnx':
+                    path = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+                    if int8:
+                        path = self._quantize_onnx_int8(path, calibration_dir, imgsz, calibration_samples)
+                elif backend == 'openvino':
+                    kwargs = {'format': 'openvino', 'imgsz': imgsz, 'dynamic': True}
+                    if int8:
+                        kwargs.update(int8=True, data=self._calibration_yaml(calibration_dir, model.names))
+                    path = model.export(**kwargs)
+                else:
+                    print(f"[TRAINER] Unknown export backend '{backend}', skipping.")
+                    continue
+                if path:
+                    exported[backend] = str(path)
+                    print(f"[TRAINER] Exported {backend}{' (INT8)' if int8 else ''} model: {path}")
+            except Exception as e:
+                print(f"[TRAINER] Export to {backend} failed: {e}")
+        if exported and parity_samples:
+            self.parity_report = self.check_export_parity(model_path, tuple(exported), calibration_dir,
+                                                          parity_samples)
+        return exported
+
+    def check_export_parity(self, model_path, backends, frames_dir='live_raw_data/', samples=8):
+        """
+        Run torch and the exported backends on the same live-captured frames
+        (compare_backends). Returns the report, or None without frames.
+        """
+        frames = [frame for frame in (cv2.imread(path) for path in _calibration_images(frames_dir, samples))
+                  if frame is not None]
+        if not frames:
+            print(f"[TRAINER] No frames in {frames_dir}; export parity not checked.")
+            return None
+        print(f"[TRAINER] Checking exports against torch on {len(frames)} frames from {frames_dir}...")
+        report = compare_backends(model_path, frames, backends=('torch',) + tuple(backends))
+        for backend, entry in report.items():
+            if 'error' in entry:
+                print(f"[TRAINER] WARNING: {backend} export could not be checked: {entry['error']}")
+            elif entry['parity'] == 'MISMATCH':
+                print(f"[TRAINER] WARNING: {backend} export disagrees with torch: {entry['missing']} missing, "
+                      f"{entry['extra']} extra detections, max confidence diff {entry['max_conf_diff']:.3f}")
+        return report
+
+    def _quantize_onnx_int8(self, onnx_path, calibration_dir, imgsz, samples):
+        """Static INT8 quantization of an ONNX model with live-captured frames."""
+        import onnx
+        import onnxruntime
+        from onnxruntime.quantization import quantize_static, CalibrationDataReader, QuantFormat, QuantType
+
+        images = _calibration_images(calibration_dir, samples)
+        if not images:
+            print(f"[TRAINER] No calibration images in {calibration_dir}. Keeping FP32 ONNX model.")
+            return onnx_path
+        input_name = onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+        class LiveCalibrationReader(CalibrationDataReader):
+            def __init__(self):
+                self.paths = iter(images)
+            def get_next(self):
+                for path in self.paths:
+                    img = cv2.imread(path)
+                    if img is None:
+                        continue
+                    # Same preprocessing as ultralytics: letterbox, BGR->RGB, CHW, 0-1
+                    img = _letterbox(img, imgsz)[:, :, ::-1].transpose(2, 0, 1)
+                    return {input_name: np.ascontiguousarray(img, dtype=np.float32)[None] / 255.0}
+                return None
+
+        int8_path = os.path.splitext(onnx_path)[0] + '_int8.onnx'
+        print(f"[TRAINER] Quantizing to INT8 with {len(images)} calibration frames...")
+        quantize_static(onnx_path, int8_path, LiveCalibrationReader(),
+                        quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+        # Keep ultralytics metadata (class names, imgsz) so the model loads the same way
+        source = onnx.load(onnx_path)
+        target = onnx.load(int8_path)
+        if not target.metadata_props:
+            for prop in source.metadata_props:
+                target.metadata_props.add(key=prop.key, value=prop.value)
+            onnx.save(target, int8_path)
+        return int8_path
+
+    def _calibration_yaml(self, calibration_dir, names):
+        """Dataset yaml pointing at live-captured frames, for OpenVINO INT8 calibration."""
+        yaml_path = os.path.join(self.model_output, 'calibration.yaml')
+        with open(yaml_path, 'w') as f:
+            f.write(f'''# INT8 calibration set (live-captured frames)
+train: {os.path.abspath(calibration_dir)}
+val: {os.path.abspath(calibration_dir)}
+names: {[names[i] for i in sorted(names)]}
+''')
+        return yaml_path
+
+
+# What LiveDataCollector does when its write queue is full:
+#   'drop_oldest' - discard the oldest queued sample (keeps the newest data)
+#   'drop_newest' - discard the sample being captured
+#   'block'       - wait up to block_timeout for space, then drop it
+COLLECTOR_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
 class LiveDataCollector:
     """
     Captures and saves training data during live prints.
     Based on: Live Data Collection Pattern
+
+    capture_training_sample only copies the frames and queues them; a small
+    pool of writer threads does the JPEG encoding and disk I/O (both release
+    the GIL), so it is safe to call from the AI or main loop. The queue is
+    bounded, so a slow disk costs dropped samples, never memory or latency.
+
+    Files: <defect>_rgb_<layer>_<sample_id>.jpg,
+           <defect>_depth_<layer>_<sample_id>.npz (compressed, key 'depth') and
+           <defect>_rgb_<layer>_<sample_id>.txt (YOLO pre-labels, if given)
+    sample_id is <session start>-<counter>, unique and increasing within a
+    session, so samples captured in the same second no longer overwrite
+    each other and names sort in capture order.
     """
-    def __init__(self, output_dir='live_raw_data/'):
+    def __init__(self, output_dir='live_raw_data/', workers=2, max_queue=32,
+                 policy='drop_oldest', jpeg_quality=90, block_timeout=0.5):
+        if policy not in COLLECTOR_POLICIES:
+            raise ValueError(f"Unknown policy '{policy}'. Choose from {COLLECTOR_POLICIES}.")
         self.output_dir = output_dir
+        self.policy = policy
+        self.jpeg_quality = jpeg_quality
+        self.block_timeout = block_timeout
         os.makedirs(self.output_dir, exist_ok=True)
-        print(f"[COLLECTOR] Data collector initialized. Saving to: {output_dir}")
 
-    def capture_training_sample(self, rgb_frame, depth_frame, defect_type, layer):
+        self.session = time.strftime('%Y%m%d-%H%M%S')
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._queue = Queue(maxsize=max_queue)
+
+        # Stats
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.bytes_written = 0
+        self.write_time = 0.0
+        self.max_queue_depth = 0
+        self.start_time = time.time()
+
+        self.workers = [threading.Thread(target=self._writer_loop, daemon=True, name=f"Collector{i}")
+                        for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+        print(f"[COLLECTOR] Data collector initialized. Saving to: {output_dir} "
+              f"({workers} writers, queue {max_queue}, policy {policy})")
+
+    def capture_training_sample(self, rgb_frame, depth_frame, defect_type, layer, labels=None):
         """
         Capture one labeled sample (RGB + Depth) during a print.
+        The frames are copied (callers usually pass ring buffer views), so
+        they can be reused as soon as this returns. `labels` are YOLO label
+        lines ("class xc yc w h", normalized) written next to the image.
+        Returns the sample_id, or None if the sample was dropped.
         """
-        timestamp = int(time.time())
-        
+        with self._lock:
+            sample_id = f'{self.session}-{self._next_id:06d}'
+            self._next_id += 1
+            self.submitted += 1
+        sample = (sample_id, np.copy(rgb_frame), None if depth_frame is None else np.copy(depth_frame),
+                  defect_type, layer, labels)
+
+        if not self._enqueue(sample):
+            with self._lock:
+                self.dropped += 1
+            return None
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return sample_id
+
+    def _enqueue(self, sample):
+        if self.policy == 'block':
+            try:
+                self._queue.put(sample, timeout=self.block_timeout)
+                return True
+            except Full:
+                return False
         try:
-            # Save with label
-            rgb_filename = f'{self.output_dir}/{defect_type}_rgb_{layer}_{timestamp}.jpg'
-            depth_filename = f'{self.output_dir}/{defect_type}_depth_{layer}_{timestamp}.npy'
-            
-            cv2.imwrite(rgb_filename, rgb_frame)
-            if depth_frame is not None:
-                np.save(depth_filename, depth_frame)
-            
-            print(f"[COLLECTOR] Captured {defect_type} sample at layer {layer} (Timestamp: {timestamp})")
-        
-        except Exception as e:
-            print(f"[COLLECTOR] Error saving sample: {e}")
\ No newline at end of file
+            self._queue.put_nowait(sample)
+            return True
+        except Full:
+            if self.policy == 'drop_newest':
+                return False
+        # drop_oldest: make room by discarding the sample that has waited longest
+        try:
+            self._queue.get_nowait()
+            with self._lock:
+                self.dropped += 1
+        except Empty:
+            pass
+        try:
+            self._queue.put_nowait(sample)
+            return True
+        except Full:
+            return False
+
+    def _writer_loop(self):
+        while True:
+            sample = self._queue.get()
+            if sample is None:
+                break
+            sample_id, rgb_frame, depth_frame, defect_type, layer, labels = sample
+            start = time.perf_counter()
+            try:
+                # Save with label
+                rgb_filename = os.path.join(self.output_dir, f'{defect_type}_rgb_{layer}_{sample_id}.jpg')
+                ok, jpg = cv2.imencode('.jpg', rgb_frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if not ok:
+                    raise IOError("JPEG encoding failed")
+                jpg.tofile(rgb_filename)
+                size = jpg.nbytes
+                if depth_frame is not None:
+                    depth_filename = os.path.join(self.output_dir, f'{defect_type}_depth_{layer}_{sample_id}.npz')
+                    np.savez_compressed(depth_filename, depth=depth_frame)
+                    size += os.path.getsize(depth_filename)
+                if labels is not None:
+                    with open(os.path.splitext(rgb_filename)[0] + '.txt', 'w') as f:
+                        f.write(''.join(line + '\n' for line in labels))
+
+                with self._lock:
+                    self.written += 1
+                    self.bytes_written += size
+                    self.write_time += time.perf_counter() - start
+                print(f"[COLLECTOR] Captured {defect_type} sample at layer {layer} (ID: {sample_id})")
+
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"[COLLECTOR] Error saving sample {sample_id}: {e}")
+
+    def get_stats(self):
+        elapsed = max(1e-9, time.time() - self.start_time)
+        with self._lock:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'samples_per_s': self.written / elapsed,
+                'mb_per_s': self.bytes_written / elapsed / 1e6,
+                'avg_write_ms': 1000.0 * self.write_time / self.written if self.written else 0.0
+            }
+
+    def close(self, timeout=10.0):
+        """Write out everything still queued, then stop the writers."""
+        for _ in self.workers:
+            self._queue.put(None)
+        deadline = time.time() + timeout
+        for worker in self.workers:
+            worker.join(timeout=max(0.0, deadline - time.time()))
+        stats = self.get_stats()
+        print(f"[COLLECTOR] Stopped: {stats['written']} written, {stats['dropped']} dropped, "
+              f"{stats['errors']} errors ({stats['mb_per_s']:.1f} MB/s, {stats['avg_write_ms']:.0f} ms/sample).")
@@ -0,0 +1,112 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: change_gate.py
+PURPOSE: Cheap change detection in front of YOLO to skip static frames.
+Based on: SECTION 4: LIVE AI MODEL STRUCTURE
+================================================================================
+
+For most of a print the ROI barely changes between samples. The gate
+compares a heavily downsampled grayscale copy of each ROI against the copy
+taken at the last inference and only lets frames through when something
+moved, or when the forced re-check interval has passed.
+"""
+
+import time
+import numpy as np
+import cv2
+
+
+class _GateRegion:
+    """Downsampled reference/working images for one ROI."""
+    def __init__(self, name, x1, y1, x2, y2, scale):
+        self.name = name
+        self.bounds = (slice(y1, y2), slice(x1, x2))
+        self.small_size = (max(1, (x2 - x1) // scale), max(1, (y2 - y1) // scale))
+        w, h = self.small_size
+        self.small = np.zeros((h, w, 3), dtype=np.uint8)
+        self.gray = np.zeros((h, w), dtype=np.uint8)
+        self.reference = np.zeros((h, w), dtype=np.uint8)
+        self.diff = np.zeros((h, w), dtype=np.uint8)
+        self.score = 0.0
+
+
+class LiveChangeGate:
+    """
+    Decides per sampled frame whether YOLO needs to run.
+
+    A frame is analyzed if:
+      - any ROI's change score exceeds `change_threshold`
+        (fraction of downsampled pixels that moved by > pixel_threshold), or
+      - `max_interval` seconds have passed since the last inference, or
+      - the last inference found a defect (keep confirming it).
+    Otherwise the last result is reused and the inference is counted as saved.
+    """
+    def __init__(self, roi_mask=None, width=1920, height=1080, scale=8,
+                 pixel_threshold=12, change_threshold=0.002, max_interval=5.0,
+                 hold_on_defect=True):
+        self.pixel_threshold = pixel_threshold
+        self.change_threshold = change_threshold
+        self.max_interval = max_interval
+        self.hold_on_defect = hold_on_defect
+
+        if roi_mask is not None:
+            self.regions = [_GateRegion(r.name, r.x1, r.y1, r.x2, r.y2, scale) for r in roi_mask.regions]
+        else:
+            self.regions = [_GateRegion('frame', 0, 0, width, height, scale)]
+
+        self.last_inference_time = 0.0
+        self.last_result = None
+        self.has_reference = False
+        self.inferences_run = 0
+        self.inferences_saved = 0
+        print(f"[GATE] Change gate initialized: {len(self.regions)} region(s), "
+              f"threshold {change_threshold:.3%}, forced check every {max_interval}s.")
+
+    def update_scores(self, frame):
+        """Compute each region's change score against its reference."""
+        for region in self.regions:
+            view = frame[region.bounds]
+            cv2.resize(view, region.small_size, dst=region.small, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(region.small, cv2.COLOR_BGR2GRAY, dst=region.gray)
+            cv2.absdiff(region.gray, region.reference, dst=region.diff)
+            cv2.threshold(region.diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=region.diff)
+            changed = cv2.countNonZero(region.diff)
+            region.score = changed / region.diff.size
+        return {region.name: region.score for region in self.regions}
+
+    def should_infer(self, frame, now=None):
+        """True if this frame needs a real inference."""
+        now = time.time() if now is None else now
+        self.update_scores(frame)
+
+        if not self.has_reference:
+            return True
+        if now - self.last_inference_time >= self.max_interval:
+            return True
+        if self.hold_on_defect and self.last_result is not None:
+            return True
+        return any(region.score > self.change_threshold for region in self.regions)
+
+    def record_inference(self, result, now=None):
+        """Call after an inference ran: stores the result and re-bases the references."""
+        self.last_inference_time = time.time() if now is None else now
+        self.last_result = result
+        self.inferences_run += 1
+        for region in self.regions:
+            np.copyto(region.reference, region.gray)
+        self.has_reference = True
+
+    def record_skip(self):
+        """Call when inference was skipped. Returns the reused last result."""
+        self.inferences_saved += 1
+        return self.last_result
+
+    def get_stats(self):
+        total = self.inferences_run + self.inferences_saved
+        return {
+            'run': self.inferences_run,
+            'saved': self.inferences_saved,
+            'saved_ratio': self.inferences_saved / total if total else 0.0,
+            'scores': {region.name: region.score for region in self.regions}
+        }
@@ -5,129 +5,359 @@ FILE: correction_engine.py
 PURPOSE: Applies corrective G-code actions based on AI defects.
 Based on: SECTION 5: LIVE CORRECTION ENGINE STRUCTURE
 ================================================================================
+
+Corrections are declared in correction_rules.json, one rule per defect type:
+
+  "warping": {
+      "cooldown": 30,            seconds before this rule may fire again
+      "hysteresis": 0.05,        confidence margin below the first step
+      "reset_after": 120,        seconds unseen before the ladder restarts
+      "steps": [                 escalation ladder, mildest first
+          {"threshold": 0.80, "gcode": "M140 S+5", "max": 110, "desc": "Raise bed temp"},
+          {"threshold": 0.90, "gcode": "M220 S90", "desc": "Slow to 90%"}
+      ]
+  }
+
+The first detection above the first step's threshold applies that step;
+if the defect is still there after the cooldown, the next step is applied,
+and so on (the last step repeats). The ladder drops back to the first step
+once the defect clears: reported below the first threshold minus the
+hysteresis, or not reported for reset_after seconds. Every rule has its
+own cooldown, so a warping correction never delays a spaghetti M112.
+
+Steps are "gcode" (static, or "M104/M140 S+n|S-n" relative to the current
+target, clamped to "min"/"max") or "action": "pause" | "emergency_stop".
+M112 always takes the emergency lane. Rules are compiled into a dispatch
+table when loaded: picking a correction is a dict lookup and a few
+comparisons, and relative temperatures come from the printer's cached
+state, never from a serial round trip. The file is watched and reloaded
+while running; a file with errors is reported and the old rules stay.
 """
 
-import time
+import os
 import re
+import json
+import time
+import threading
+from serial_transport import PRIORITY_HIGH
+
+STEP_ACTIONS = ('gcode', 'pause', 'emergency_stop')
+
+# Used when correction_rules.json is missing
+DEFAULT_RULES = {
+    'defaults': {'cooldown': 30, 'hysteresis': 0.05, 'reset_after': 120},
+    'rules': {
+        'warping': {'steps': [
+            {'threshold': 0.80, 'gcode': 'M140 S+5', 'max': 110, 'desc': 'Raise bed temp'},
+            {'threshold': 0.90, 'gcode': 'M220 S90', 'desc': 'Slow to 90%'}
+        ]},
+        'stringing': {'steps': [
+            {'threshold': 0.75, 'gcode': 'M104 S-5', 'min': 180, 'desc': 'Lower hotend temp'},
+            {'threshold': 0.85, 'gcode': 'M106 S255', 'desc': 'Max fan'}
+        ]},
+        'spaghetti': {'steps': [
+            {'threshold': 0.85, 'gcode': 'M112', 'desc': 'Emergency stop'}
+        ]},
+        'layer_skip': {'steps': [
+            {'threshold': 0.80, 'gcode': 'M112', 'desc': 'Stop print'}
+        ]},
+        'overhang_stringing': {'steps': [
+            {'threshold': 0.80, 'gcode': 'M220 S80', 'desc': 'Slow to 80%'}
+        ]},
+        'anomaly': {'steps': [ # From default YOLO
+            {'threshold': 0.90, 'gcode': 'M112', 'desc': 'Emergency stop'}
+        ]}
+    }
+}
+
+# "M140 S+5" / "M104 S-10": relative to the current target temperature
+_RELATIVE_TEMP_REGEX = re.compile(r"^(M104|M140)\s+S([+-]\d+(?:\.\d+)?)$", re.IGNORECASE)
+_TARGET_FIELDS = {'M104': 'hotend_target', 'M140': 'bed_target'}
+
+
+class _CompiledStep:
+    """One ladder step with its command builder: build(printer_state) -> G-code or None."""
+    __slots__ = ('threshold', 'action', 'build', 'desc', 'source')
+
+    def __init__(self, threshold, action, build, desc, source):
+        self.threshold = threshold
+        self.action = action
+        self.build = build
+        self.desc = desc
+        self.source = source
+
+
+class _CompiledRule:
+    __slots__ = ('name', 'steps', 'floor', 'tuner', 'fired')
+
+    def __init__(self, name, steps, tuner):
+        self.name = name
+        self.steps = steps
+        self.floor = steps[0].threshold
+        self.tuner = tuner
+        self.fired = 0
+
+
+def _static_command(gcode):
+    return lambda state: gcode
+
+
+def _relative_temp_command(code, delta, field, low, high):
+    prefix = f"{code} S"
+
+    def build(state):
+        current = state.get(field)
+        if not current:
+            return None     # Unknown yet, or heater off: nothing to adjust
+        value = current + delta
+        if low is not None:
+            value = max(low, value)
+        if high is not None:
+            value = min(high, value)
+        return f"{prefix}{value:g}"
+    return build
+
+
+def compile_step(step, rule_name):
+    """Validate one step from the rules file and precompute its command builder."""
+    where = f"rule '{rule_name}'"
+    try:
+        threshold = float(step['threshold'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"{where}: every step needs a numeric 'threshold'")
+    action = step.get('action', 'gcode')
+    if action not in STEP_ACTIONS:
+        raise ValueError(f"{where}: unknown action {action!r} (expected one of {STEP_ACTIONS})")
+    desc = step.get('desc', action)
+
+    if action != 'gcode':
+        return _CompiledStep(threshold, action, None, desc, action)
+    gcode = str(step.get('gcode', '')).split(';', 1)[0].strip()
+    if not gcode:
+        raise ValueError(f"{where}: step '{desc}' has no 'gcode'")
+    if gcode.split()[0].upper() == 'M112':
+        return _CompiledStep(threshold, 'emergency_stop', None, desc, gcode)
+
+    match = _RELATIVE_TEMP_REGEX.match(gcode)
+    if match:
+        code = match.group(1).upper()
+        build = _relative_temp_command(code, float(match.group(2)), _TARGET_FIELDS[code],
+                                       step.get('min'), step.get('max'))
+    elif re.search(r"\bS[+-]", gcode):
+        raise ValueError(f"{where}: relative values are only supported for M104/M140, not '{gcode}'")
+    else:
+        build = _static_command(gcode)
+    return _CompiledStep(threshold, 'gcode', build, desc, gcode)
+
+
+def compile_rules(config, previous=None):
+    """
+    Rules file contents -> dispatch table {defect type: _CompiledRule}.
+    Cooldown / escalation state of rules in `previous` carries over.
+    """
+    defaults = dict(DEFAULT_RULES['defaults'])
+    defaults.update(config.get('defaults', {}))
+    table = {}
+    for name, rule in config.get('rules', {}).items():
+        steps = tuple(compile_step(step, name) for step in rule.get('steps', []))
+        if not steps:
+            raise ValueError(f"rule '{name}' has no steps")
+        if any(b.threshold < a.threshold for a, b in zip(steps, steps[1:])):
+            raise ValueError(f"rule '{name}': step thresholds must not decrease along the ladder")
+        settings = dict(defaults)
+        settings.update({k: rule[k] for k in ('cooldown', 'hysteresis', 'reset_after') if k in rule})
+        tuner = LiveParameterTuner(float(settings['cooldown']), float(settings['hysteresis']),
+                                   float(settings['reset_after']), quiet=True)
+        table[name] = _CompiledRule(name, steps, tuner)
+        old = previous.get(name) if previous else None
+        if old is not None:
+            tuner.carry_over(old.tuner, len(steps))
+            table[name].fired = old.fired
+    return table
+
 
 class LiveCorrectionEngine:
     """
     Receives defect info and sends corrective commands to the printer.
     Based on: Live Correction Engine
     """
-    def __init__(self, printer, logger):
+    def __init__(self, printer, logger, rules_path='correction_rules.json', watch_interval=2.0):
         self.printer = printer
         self.logger = logger
-        self.tuner = LiveParameterTuner()
-        
-        # Define correction strategies
-        # These are examples. TUNE THEM CAREFULLY.
-        self.corrections = {
-            'warping': [
-                {'cmd': 'M140 S+5', 'threshold': 0.80, 'desc': 'Raise bed temp'},
-                {'cmd': 'M220 S90', 'threshold': 0.90, 'desc': 'Slow to 90%'}
-            ],
-            'stringing': [
-                {'cmd': 'M104 S-5', 'threshold': 0.75, 'desc': 'Lower hotend temp'},
-                {'cmd': 'M106 S255', 'threshold': 0.85, 'desc': 'Max fan'}
-            ],
-            'spaghetti': [
-                {'cmd': 'M112', 'threshold': 0.85, 'desc': 'Emergency stop'}
-            ],
-            'layer_skip': [
-                {'cmd': 'M112', 'threshold': 0.80, 'desc': 'Stop print'}
-            ],
-            'overhang_stringing': [
-                {'cmd': 'M220 S80', 'threshold': 0.80, 'desc': 'Slow to 80%'}
-            ],
-            'anomaly': [ # From default YOLO
-                {'cmd': 'M112', 'threshold': 0.90, 'desc': 'Emergency stop'}
-            ]
-        }
-        print("[CORRECTOR] Correction Engine initialized.")
+        self.rules_path = rules_path
+        self.watch_interval = watch_interval
+        self.current_layer = 0 # Published by the G-code streamer
+        self.rules = {}
+        self._rules_mtime = None
+        self.stats = {'decisions': 0, 'applied': 0, 'cooldown': 0, 'below_threshold': 0,
+                      'unbuildable': 0, 'no_rule': 0, 'reloads': 0, 'reload_errors': 0}
+        self.decide_time = 0.0
 
-    def apply_live_correction(self, defect):
+        if not self.reload():
+            print("[CORRECTOR] Using the built-in correction rules.")
+            self.rules = compile_rules(DEFAULT_RULES)
+        self.stats['reloads'] = 0 # Count reloads after startup only
+        self.running = True
+        self.watch_thread = None
+        if rules_path and watch_interval:
+            self.watch_thread = threading.Thread(target=self._watch_loop, daemon=True, name="CorrectionRules")
+            self.watch_thread.start()
+        print(f"[CORRECTOR] Correction Engine initialized ({len(self.rules)} rules).")
+
+    # --- Rules file ---
+
+    def reload(self):
+        """(Re)load and compile the rules file. Returns False (keeping the old rules) on error."""
+        if not self.rules_path or not os.path.exists(self.rules_path):
+            return False
+        try:
+            mtime = os.path.getmtime(self.rules_path)
+            with open(self.rules_path, 'r') as f:
+                config = json.load(f)
+            rules = compile_rules(config, previous=self.rules)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            self.stats['reload_errors'] += 1
+            print(f"[CORRECTOR] Invalid rules in {self.rules_path}, keeping the current ones: {e}")
+            return False
+        self._rules_mtime = mtime
+        # One assignment: a correction in progress sees either the old or the new table
+        self.rules = rules
+        self.stats['reloads'] += 1
+        print(f"[CORRECTOR] Loaded {len(rules)} correction rules from {self.rules_path}.")
+        return True
+
+    def _watch_loop(self):
+        while self.running:
+            time.sleep(self.watch_interval)
+            try:
+                mtime = os.path.getmtime(self.rules_path)
+            except OSError:
+                continue
+            if mtime != self._rules_mtime:
+                self._rules_mtime = mtime   # A broken file is reported once, not every poll
+                self.reload()
+
+    def stop(self):
+        self.running = False
+
+    # --- Decisions ---
+
+    def set_current_layer(self, layer):
+        self.current_layer = layer
+
+    def decide(self, defect, now=None):
         """
-        Apply corrections based on live detection, checking cooldowns.
+        Pick the ladder step for one defect, or None. Updates the rule's
+        escalation state; no I/O.
         """
-        defect_type = defect['type']
-        
-        if defect_type not in self.corrections:
-            print(f"[CORRECTOR] No correction strategy found for defect: {defect_type}")
-            return
-            
-        if not self.tuner.is_cooldown_over():
-            print(f"[CORRECTOR] Cooldown active. Skipping correction for {defect_type}.")
-            return
+        rule = self.rules.get(defect['type'])
+        if rule is None:
+            self.stats['no_rule'] += 1
+            return None
+        now = time.time() if now is None else now
+        confidence = defect['confidence']
+        tuner = rule.tuner
+        tuner.observe(confidence, rule.floor, now)
+        if not tuner.is_cooldown_over(now):
+            self.stats['cooldown'] += 1
+            return None
+        step = rule.steps[tuner.level]
+        if not confidence > step.threshold:
+            self.stats['below_threshold'] += 1
+            return None
+        return rule, step
 
-        for correction in self.corrections[defect_type]:
-            if defect['confidence'] > correction['threshold']:
-                
-                # Parse the dynamic command
-                cmd = self.parse_dynamic_command(correction['cmd'])
-                
-                if cmd is None:
-                    print(f"[CORRECTOR] Could not parse dynamic command: {correction['cmd']}")
-                    continue
-                
-                print(f"[CORRECTOR] Applying: {correction['desc']} (G-code: {cmd})")
-                
-                # Send the command
-                self.printer.send_live(cmd)
-                
-                # Log and reset cooldown
-                self.logger.log_correction(defect, cmd)
-                self.tuner.reset_cooldown()
-                
-                # Only apply the first (highest priority) matching correction
-                break
-    
-    def parse_dynamic_command(self, cmd_template):
+    def apply_live_correction(self, defect):
         """
-        Parse commands with live values (e.g., S+5, S-10).
+        Apply the correction for a live detection, if its rule is ready.
+        Never blocks on the printer: commands are queued (ahead of status
+        polls) and M112 is written straight away.
         """
-        try:
-            if 'S+' in cmd_template or 'S-' in cmd_template:
-                # Get current temps
-                temps = self.printer.get_live_temp()
-                if temps is None:
-                    print("[CORRECTOR] Cannot apply dynamic temp: M105 failed.")
-                    return None
-
-                delta = int(re.findall(r'[+-]\d+', cmd_template)[0])
-
-                if 'M140' in cmd_template: # Bed temp
-                    current = temps['bed_target'] # Adjust target, not actual
-                    new_temp = current + delta
-                    return f"M140 S{new_temp}"
-                
-                elif 'M104' in cmd_template: # Hotend temp
-                    current = temps['hotend_target'] # Adjust target, not actual
-                    new_temp = current + delta
-                    return f"M104 S{new_temp}"
-            
-            else:
-                # Static command (e.g., M112, M220 S80)
-                return cmd_template
-                
-        except Exception as e:
-            print(f"[CORRECTOR] Error parsing dynamic command '{cmd_template}': {e}")
-            return None
+        start = time.perf_counter()
+        now = time.time()
+        self.stats['decisions'] += 1
+        decision = self.decide(defect, now)
+        if decision is None:
+            self.decide_time += time.perf_counter() - start
+            return
+        rule, step = decision
+
+        cmd = step.source
+        if step.action == 'gcode':
+            # Relative temperatures use the auto-reported targets (no M105)
+            cmd = step.build(self.printer.state.snapshot())
+            if cmd is None:
+                self.stats['unbuildable'] += 1
+                self.decide_time += time.perf_counter() - start
+                print(f"[CORRECTOR] Cannot apply '{step.source}' for {rule.name}: no target temperature reported.")
+                return
+        rule.tuner.fired(now, len(rule.steps))
+        rule.fired += 1
+        self.stats['applied'] += 1
+        self.decide_time += time.perf_counter() - start
+
+        print(f"[CORRECTOR] Applying: {step.desc} (G-code: {cmd}) at layer {self.current_layer}")
+        if step.action == 'emergency_stop':
+            self.printer.emergency_stop_live()
+        elif step.action == 'pause':
+            self.printer.pause_live(f"AI {rule.name}")
+        else:
+            future = self.printer.send_async(cmd, priority=PRIORITY_HIGH)
+            if future is not None:
+                future.add_done_callback(lambda f, cmd=cmd, name=rule.name: self._sent(f, cmd, name))
+        self.logger.log_correction(defect, cmd)
+
+    def _sent(self, future, cmd, name):
+        error = future.exception()
+        if error is not None:
+            print(f"[CORRECTOR] '{cmd}' for {name} was not applied: {error}")
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['avg_decide_us'] = 1e6 * self.decide_time / self.stats['decisions'] if self.stats['decisions'] else 0.0
+        stats['fired'] = {name: rule.fired for name, rule in self.rules.items() if rule.fired}
+        return stats
 
 class LiveParameterTuner:
     """
-    Manages correction frequency and hysteresis.
+    Manages correction frequency and hysteresis for one rule.
     Based on: Live Adaptive Parameters
     """
-    def __init__(self):
-        self.correction_cooldown_sec = 30  # Seconds between corrections
+    def __init__(self, cooldown=30.0, hysteresis=0.05, reset_after=120.0, quiet=False):
+        self.correction_cooldown_sec = cooldown  # Seconds between corrections
+        self.hysteresis = hysteresis
+        self.reset_after = reset_after
         self.last_correction_time = 0
-        print(f"[TUNER] Parameter Tuner initialized. Cooldown: {self.correction_cooldown_sec}s")
-    
-    def is_cooldown_over(self):
+        self.last_seen = 0
+        self.level = 0 # Next ladder step
+        if not quiet:
+            print(f"[TUNER] Parameter Tuner initialized. Cooldown: {self.correction_cooldown_sec}s")
+
+    def observe(self, confidence, floor, now):
+        """Restart the ladder once the defect has cleared (hysteresis below `floor`, or gone)."""
+        if confidence < floor - self.hysteresis:
+            self.level = 0
+            return
+        if now - self.last_seen > self.reset_after:
+            self.level = 0
+        self.last_seen = now
+
+    def is_cooldown_over(self, now=None):
         """Prevent rapid correction spam"""
-        return (time.time() - self.last_correction_time) > self.correction_cooldown_sec
-        
-    def reset_cooldown(self):
+        now = time.time() if now is None else now
+        return (now - self.last_correction_time) > self.correction_cooldown_sec
+
+    def reset_cooldown(self, now=None):
         """Call this after a successful correction."""
-        self.last_correction_time = time.time()
\ No newline at end of file
+        self.last_correction_time = time.time() if now is None else now
+
+    def fired(self, now, steps):
+        """A step was applied: start the cooldown and escalate (the last step repeats)."""
+        self.reset_cooldown(now)
+        self.level = min(self.level + 1, steps - 1)
+
+    def carry_over(self, other, steps):
+        """Keep cooldown and escalation state across a rules reload."""
+        self.last_correction_time = other.last_correction_time
+        self.last_seen = other.last_seen
+        self.level = min(other.level, steps - 1)
@@ -0,0 +1,387 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: depth_analysis.py
+PURPOSE: Vectorized height-map defect detection from the Kinect depth stream.
+Based on: SECTION 2: LIVE KINECT CAPTURE STRUCTURE (depth stream)
+================================================================================
+
+Runs at depth-frame rate next to the YOLO path. Works directly on the raw
+uint16 millimeter frames: every step writes into preallocated buffers, so
+there is no float32 copy and no per-frame allocation apart from the
+connected-component labelling of flagged pixels.
+
+The toolhead and gantry move through the ROI and stand well above the
+part. A band around the toolhead (position from the printer's M154 /
+M114 reports, see set_toolhead_source) is left out of every check, and
+checks are paused while that position is unknown. On top of that, only
+material that stayed put for `settle_frames` frames counts towards the
+tallest-seen map and blobs, so a head passing faster than the position
+reports doesn't either.
+
+The empty-bed baseline is only captured on request, with the bed empty:
+  python depth_analysis.py calibrate
+"""
+
+import os
+import argparse
+import numpy as np
+import cv2
+
+
+class LiveDepthAnalyzer:
+    """
+    Compares a live height map of the bed ROI against an empty-bed baseline
+    and the expected part height for the current layer.
+
+    Flags two kinds of defect, in the same dict format as
+    LiveAIModel.analyze_live (bbox is in depth-frame pixels):
+      'depth_blob'    - material standing above the expected part height
+                        (blobs, spaghetti, a nozzle drag-up)
+      'depth_missing' - material that was there and has disappeared
+                        (part knocked off / detached)
+    """
+    def __init__(self, width=512, height=424, roi=(96, 92, 416, 332),
+                 layer_height_mm=0.2, first_layer_mm=0.3,
+                 blob_tolerance_mm=5, missing_tolerance_mm=4,
+                 min_part_mm=1, min_blob_pixels=30, confirm_frames=3, settle_frames=15,
+                 bed_mm=(0, 0, 220, 220), toolhead_radius_mm=40, gantry_band_mm=20,
+                 toolhead_source=None, baseline_frames=30, baseline_path='depth_baseline.npy'):
+        self.width = width
+        self.height = height
+
+        # --- IMPORTANT ---
+        # Print area in *depth* pixels (x1, y1, x2, y2), exclusive end.
+        # You MUST adjust these for your printer setup!
+        x1, y1, x2, y2 = roi
+        self.roi = (slice(max(0, y1), min(height, y2)), slice(max(0, x1), min(width, x2)))
+        self.roi_x, self.roi_y = max(0, x1), max(0, y1)
+        roi_h = self.roi[0].stop - self.roi[0].start
+        roi_w = self.roi[1].stop - self.roi[1].start
+
+        self.layer_height_mm = layer_height_mm
+        self.first_layer_mm = first_layer_mm
+        self.blob_tolerance_mm = blob_tolerance_mm
+        self.missing_tolerance_mm = missing_tolerance_mm
+        self.min_part_mm = min_part_mm
+        self.min_blob_pixels = min_blob_pixels
+        self.confirm_frames = confirm_frames
+        self.current_layer = 0
+
+        # --- IMPORTANT ---
+        # Printer coordinates (x_min, y_min, x_max, y_max) in mm that the
+        # ROI spans: ROI left/right = X min/max, ROI top = Y max (back of
+        # the bed), ROI bottom = Y min. Adjust with the ROI above.
+        bx1, by1, bx2, by2 = bed_mm
+        self.col_mm = bx1 + (np.arange(roi_w) + 0.5) * (bx2 - bx1) / roi_w
+        self.row_mm = by2 - (np.arange(roi_h) + 0.5) * (by2 - by1) / roi_h
+        self.toolhead_radius_mm = toolhead_radius_mm
+        self.gantry_band_mm = gantry_band_mm    # X gantry beam across the ROI at the head's Y (0 = none)
+        self.toolhead_source = toolhead_source  # callable -> (x, y) in mm, or None if unknown
+        self.toolhead = None
+
+        # Baseline (empty bed), uint16 mm over the ROI
+        self.baseline_frames = baseline_frames
+        self.baseline_path = baseline_path
+        self.baseline = None
+        self.baseline_valid = None
+        self._baseline_stack = []
+        self._warned = None
+
+        # Preallocated work buffers (ROI sized)
+        self.filtered = np.zeros((roi_h, roi_w), dtype=np.uint16)
+        self.height_map = np.zeros((roi_h, roi_w), dtype=np.int16)   # mm above bed
+        self.max_height = np.zeros((roi_h, roi_w), dtype=np.int16)   # tallest seen per pixel
+        self.drop_map = np.zeros((roi_h, roi_w), dtype=np.int16)     # mm lost vs. tallest
+        self.valid = np.zeros((roi_h, roi_w), dtype=bool)
+        self.flag = np.zeros((roi_h, roi_w), dtype=bool)
+        self.part = np.zeros((roi_h, roi_w), dtype=bool)
+        self.flag_u8 = np.zeros((roi_h, roi_w), dtype=np.uint8)
+        self.head = np.zeros((roi_h, roi_w), dtype=bool)             # toolhead / gantry band
+        self.clear = np.zeros((roi_h, roi_w), dtype=bool)            # valid and not under the head
+        self.head_dist = np.zeros((roi_h, roi_w), dtype=np.float32)  # mm^2 from the toolhead
+        # Last settle_frames height maps; their minimum is what stayed put
+        self.settle_frames = max(1, settle_frames)
+        self.history = np.zeros((self.settle_frames, roi_h, roi_w), dtype=np.int16)
+        self.settled = np.zeros((roi_h, roi_w), dtype=np.int16)
+        self._history_pos = 0
+        self._history_count = 0
+
+        self._streak = {'depth_blob': 0, 'depth_missing': 0}
+        self.frames_analyzed = 0
+
+        self.load_baseline()
+        print(f"[DEPTH] Depth analyzer initialized. ROI {roi_w}x{roi_h} px.")
+
+    # --- Baseline ---
+
+    @property
+    def baseline_ready(self):
+        return self.baseline is not None
+
+    def add_baseline_frame(self, depth_frame):
+        """
+        Feed one frame of the *empty* bed. After `baseline_frames` frames the
+        per-pixel median becomes the baseline and is saved to disk.
+        Returns True once the baseline is ready.
+        """
+        if self.baseline_ready:
+            return True
+
+        depth = depth_frame.reshape((self.height, self.width))
+        self._baseline_stack.append(depth[self.roi].copy())
+        if len(self._baseline_stack) < self.baseline_frames:
+            return False
+
+        stack = np.stack(self._baseline_stack)
+        self._baseline_stack = []
+        # Ignore invalid (0) readings when taking the median
+        masked = np.ma.masked_equal(stack, 0)
+        self.set_baseline(np.ma.median(masked, axis=0).filled(0).astype(np.uint16))
+        self.save_baseline()
+        print(f"[DEPTH] Baseline captured from {self.baseline_frames} frames.")
+        return True
+
+    def set_baseline(self, baseline):
+        self.baseline = baseline
+        self.baseline_valid = baseline > 0
+        self.max_height[:] = 0
+        self._history_count = 0
+
+    def save_baseline(self):
+        if self.baseline_ready and self.baseline_path:
+            np.save(self.baseline_path, self.baseline)
+            print(f"[DEPTH] Baseline saved to {self.baseline_path}")
+
+    def load_baseline(self):
+        if not self.baseline_path or not os.path.exists(self.baseline_path):
+            return False
+        baseline = np.load(self.baseline_path)
+        if baseline.shape != self.height_map.shape or baseline.dtype != np.uint16:
+            print(f"[DEPTH] Ignoring {self.baseline_path}: ROI does not match.")
+            return False
+        self.set_baseline(baseline)
+        print(f"[DEPTH] Baseline loaded from {self.baseline_path}")
+        return True
+
+    def reset_baseline(self):
+        """Forget the baseline (e.g., new bed position) before recalibrating."""
+        self.baseline = None
+        self.baseline_valid = None
+        self._baseline_stack = []
+
+    # --- Toolhead ---
+
+    def set_toolhead_source(self, source):
+        """source() -> current toolhead (x, y) in printer mm, or None if unknown / stale."""
+        self.toolhead_source = source
+
+    def update_toolhead_mask(self):
+        """
+        Mark the pixels the toolhead and gantry may cover in self.head.
+        Returns False if the toolhead position is unknown.
+        """
+        position = self.toolhead_source() if self.toolhead_source is not None else None
+        self.toolhead = position
+        if position is None:
+            return False
+        x, y = position
+        dy = self.row_mm - y
+        np.add(np.square(dy)[:, None], np.square(self.col_mm - x)[None, :], out=self.head_dist)
+        np.less_equal(self.head_dist, self.toolhead_radius_mm ** 2, out=self.head)
+        if self.gantry_band_mm > 0:
+            np.logical_or(self.head, (np.abs(dy) <= self.gantry_band_mm)[:, None], out=self.head)
+        return True
+
+    # --- Layer tracking ---
+
+    def set_current_layer(self, layer):
+        self.current_layer = layer
+
+    def expected_height_mm(self, layer=None):
+        """Expected top of the part in mm, or None if the layer is unknown (0)."""
+        layer = self.current_layer if layer is None else layer
+        if layer <= 0:
+            return None
+        return self.first_layer_mm + (layer - 1) * self.layer_height_mm
+
+    # --- Analysis ---
+
+    def update_height_map(self, depth_frame):
+        """
+        Compute mm-above-bed over the ROI into self.height_map (int16).
+        The camera looks down, so height = baseline depth - live depth.
+        """
+        depth = depth_frame.reshape((self.height, self.width))[self.roi]
+
+        # 3x3 median knocks out Kinect speckle and flying pixels
+        cv2.medianBlur(depth, 3, dst=self.filtered)
+
+        # Invalid pixels (0) in either frame are ignored
+        np.greater(self.filtered, 0, out=self.valid)
+        np.logical_and(self.valid, self.baseline_valid, out=self.valid)
+
+        # uint16 - uint16 wraps; casting into int16 recovers the signed mm
+        np.subtract(self.baseline, self.filtered, out=self.height_map, casting='unsafe')
+        np.multiply(self.height_map, self.valid, out=self.height_map)
+
+        # What stayed put over the last settle_frames frames (a passing head doesn't)
+        self.history[self._history_pos] = self.height_map
+        self._history_pos = (self._history_pos + 1) % self.settle_frames
+        self._history_count = min(self._history_count + 1, self.settle_frames)
+        np.min(self.history[:self._history_count], axis=0, out=self.settled)
+        return self.height_map
+
+    def region_height_mm(self, bbox):
+        """
+        Tallest point (mm above bed) of the latest height map inside a
+        depth-frame [x1, y1, x2, y2]. None if no baseline or outside the ROI.
+        Used to check YOLO detections against depth (see registration.py).
+        """
+        if not self.baseline_ready or bbox is None:
+            return None
+        x1 = max(0, int(bbox[0]) - self.roi_x)
+        y1 = max(0, int(bbox[1]) - self.roi_y)
+        x2 = min(self.height_map.shape[1], int(np.ceil(bbox[2])) - self.roi_x + 1)
+        y2 = min(self.height_map.shape[0], int(np.ceil(bbox[3])) - self.roi_y + 1)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return float(self.height_map[y1:y2, x1:x2].max())
+
+    def analyze_depth(self, depth_frame):
+        """
+        Analyze one raw uint16 depth frame.
+        Returns the highest confidence confirmed defect dict, or None.
+        Returns None without checking while there is no baseline (run
+        the calibrate command) or the toolhead position is unknown.
+        """
+        if depth_frame is None:
+            return None
+        if not self.baseline_ready:
+            self._pause("No empty-bed baseline; run: python depth_analysis.py calibrate")
+            return None
+        if not self.update_toolhead_mask():
+            self._pause("Toolhead position unknown; depth checks paused.")
+            return None
+        if self._warned is not None:
+            print("[DEPTH] Depth checks running.")
+            self._warned = None
+
+        self.frames_analyzed += 1
+        height_map = self.update_height_map(depth_frame)
+        if self._history_count < self.settle_frames:
+            return None     # Not enough frames yet to tell what stays put
+        settled = self.settled
+        expected = self.expected_height_mm()
+        np.logical_and(self.valid, np.logical_not(self.head, out=self.clear), out=self.clear)
+        candidates = []
+
+        # --- Blobs: material that stays above the expected part height ---
+        # Only possible once the current layer is known.
+        blob = None
+        if expected is not None:
+            np.greater(settled, int(expected + self.blob_tolerance_mm), out=self.flag)
+            np.logical_and(self.flag, self.clear, out=self.flag)
+            blob = self._largest_component(self.flag)
+        if blob is not None:
+            bbox, area = blob
+            excess = int(settled[bbox[1]:bbox[3], bbox[0]:bbox[2]].max()) - expected
+            candidates.append(self._make_defect('depth_blob', bbox, area, excess, self.blob_tolerance_mm))
+
+        # --- Missing mass: pixels that dropped well below their own max ---
+        # The tallest height seen per pixel only learns from settled
+        # material away from the toolhead, and never above the expected
+        # part height, so neither the head nor a moving blob leaves a
+        # trail of "missing" pixels behind.
+        np.copyto(self.part, self.clear)
+        if expected is not None:
+            np.less_equal(settled, int(expected + self.blob_tolerance_mm), out=self.flag)
+            np.logical_and(self.part, self.flag, out=self.part)
+        np.maximum(self.max_height, settled, out=self.max_height, where=self.part)
+        np.subtract(self.max_height, height_map, out=self.drop_map)
+        np.greater(self.drop_map, self.missing_tolerance_mm, out=self.flag)
+        np.greater_equal(self.max_height, self.min_part_mm, out=self.part)
+        np.logical_and(self.flag, self.part, out=self.flag)
+        np.logical_and(self.flag, self.clear, out=self.flag)
+        missing = self._largest_component(self.flag)
+        if missing is not None:
+            bbox, area = missing
+            drop = int(self.drop_map[bbox[1]:bbox[3], bbox[0]:bbox[2]].max())
+            candidates.append(self._make_defect('depth_missing', bbox, area, drop, self.missing_tolerance_mm))
+
+        # --- Require a few consecutive frames before reporting ---
+        found = {d['type'] for d in candidates}
+        for defect_type in self._streak:
+            self._streak[defect_type] = self._streak[defect_type] + 1 if defect_type in found else 0
+        confirmed = [d for d in candidates if self._streak[d['type']] >= self.confirm_frames]
+
+        if not confirmed:
+            return None
+        return max(confirmed, key=lambda d: d['confidence'])
+
+    def _pause(self, reason):
+        """Skip this frame; say why once, and forget unconfirmed streaks."""
+        if self._warned != reason:
+            print(f"[DEPTH] {reason}")
+            self._warned = reason
+        for defect_type in self._streak:
+            self._streak[defect_type] = 0
+
+    def _largest_component(self, flag):
+        """Largest connected region of flagged pixels as ((x1, y1, x2, y2), area) in ROI px."""
+        if np.count_nonzero(flag) < self.min_blob_pixels:
+            return None
+        np.copyto(self.flag_u8, flag)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(self.flag_u8, connectivity=8)
+        if count <= 1:
+            return None
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        best = int(np.argmax(areas)) + 1
+        area = int(stats[best, cv2.CC_STAT_AREA])
+        if area < self.min_blob_pixels:
+            return None
+        x, y = int(stats[best, cv2.CC_STAT_LEFT]), int(stats[best, cv2.CC_STAT_TOP])
+        w, h = int(stats[best, cv2.CC_STAT_WIDTH]), int(stats[best, cv2.CC_STAT_HEIGHT])
+        return (x, y, x + w, y + h), area
+
+    def _make_defect(self, defect_type, bbox, area, magnitude_mm, tolerance_mm):
+        """Build an analyze_live-style defect dict with bbox in depth-frame pixels."""
+        # Confidence grows with blob size and with how far past tolerance it is
+        size_score = min(1.0, area / (4.0 * self.min_blob_pixels))
+        depth_score = min(1.0, max(0.0, magnitude_mm / (2.0 * tolerance_mm)))
+        confidence = 0.5 + 0.25 * size_score + 0.25 * depth_score
+        x1, y1, x2, y2 = bbox
+        return {
+            'type': defect_type,
+            'confidence': confidence,
+            'bbox': [x1 + self.roi_x, y1 + self.roi_y, x2 + self.roi_x, y2 + self.roi_y],
+            'source': 'depth',
+            'height_mm': float(magnitude_mm)
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture the empty-bed depth baseline.")
+    parser.add_argument('command', choices=['calibrate'])
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--output', default='depth_baseline.npy')
+    args = parser.parse_args()
+
+    import time
+    from kinect_capture import LiveKinectCapture
+    analyzer = LiveDepthAnalyzer(baseline_frames=args.frames, baseline_path=args.output)
+    analyzer.reset_baseline()
+    kinect = LiveKinectCapture()
+    try:
+        print(f"[DEPTH] Capturing {args.frames} depth frames (bed should be EMPTY)...")
+        last = None
+        done = False
+        while not done:
+            _, depth = kinect.get_latest_frame()
+            if depth is None or depth is last:
+                time.sleep(0.01)
+                continue
+            last = depth
+            done = analyzer.add_baseline_frame(kinect.get_live_depth_raw(depth))
+    finally:
+        kinect.close()
@@ -0,0 +1,252 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: frame_buffer.py
+PURPOSE: Preallocated, zero-copy frame ring buffer and frame-rate sampler
+         shared between threads.
+Based on: SECTION 1: CORE SYSTEM ARCHITECTURE (Live Threading Pattern)
+================================================================================
+
+Replaces the frame_queue / web_frame_queue pair. All frame memory is
+allocated once up front; the capture thread converts straight into a slot
+and consumers read views of the newest slot without copying.
+LiveFrameSampler decides *before* conversion which frames are needed at all.
+"""
+
+import threading
+import time
+import numpy as np
+
+
+class FrameRef:
+    """
+    A pinned, read-only view of one committed frame.
+    The slot will not be overwritten until the reference is released.
+    """
+    __slots__ = ('seq', 'slot', 'timestamp', 'frame')
+
+    def __init__(self, seq, slot, timestamp, frame):
+        self.seq = seq
+        self.slot = slot
+        self.timestamp = timestamp
+        self.frame = frame
+
+
+class LiveFrameBuffer:
+    """
+    Fixed-slot ring buffer of frames with sequence numbers.
+
+    Writer:  slot, view = buf.begin_write() ... fill view in place ... buf.commit_write(slot)
+    Reader:  ref = buf.acquire_latest(after_seq) ... use ref.frame ... buf.release(ref)
+
+    The writer always picks the oldest slot that is neither the latest frame
+    nor pinned by a reader, so readers never see a frame being overwritten.
+    With one reader, 3 slots are enough; add one slot per extra reader.
+    """
+    def __init__(self, slots=3, height=1080, width=1920, channels=3, dtype=np.uint8, name="frames"):
+        if slots < 2:
+            raise ValueError("LiveFrameBuffer needs at least 2 slots.")
+        self.name = name
+        self.slots = slots
+        self.shape = (height, width, channels) if channels > 1 else (height, width)
+        self.frames = np.zeros((slots,) + self.shape, dtype=dtype)
+        self.seqs = [0] * slots          # 0 = empty / being written
+        self.timestamps = [0.0] * slots
+        self.pins = [0] * slots
+        self.latest_slot = -1
+        self.seq = 0
+        self.dropped = 0                 # Writes refused because every slot was busy
+        self._cond = threading.Condition()
+        self._shm = None
+        mb = self.frames.nbytes / (1024 * 1024)
+        print(f"[BUFFER] '{name}' ring buffer: {slots} x {self.shape} ({mb:.1f} MB preallocated)")
+
+    def share(self):
+        """
+        Move the slots into named shared memory so another process can read
+        them (see inference_worker.py). Call before any thread starts.
+        Returns the shared memory block name.
+        """
+        if self._shm is None:
+            from multiprocessing import shared_memory
+            self._shm = shared_memory.SharedMemory(create=True, size=self.frames.nbytes)
+            frames = np.ndarray(self.frames.shape, dtype=self.frames.dtype, buffer=self._shm.buf)
+            frames[:] = self.frames
+            self.frames = frames
+            print(f"[BUFFER] '{self.name}' ring buffer moved to shared memory '{self._shm.name}'")
+        return self._shm.name
+
+    def close(self):
+        """Release shared memory (if any). Frames must no longer be in use."""
+        if self._shm is None:
+            return
+        self.frames = None
+        try:
+            self._shm.close()
+            self._shm.unlink()
+        except Exception as e:
+            print(f"[BUFFER] Error releasing shared memory for '{self.name}': {e}")
+        self._shm = None
+
+    # --- Writer API ---
+
+    def begin_write(self):
+        """
+        Reserve a free slot for the writer.
+        Returns (slot, view) or (None, None) if every slot is pinned.
+        """
+        with self._cond:
+            best = None
+            for i in range(self.slots):
+                if i == self.latest_slot or self.pins[i] > 0:
+                    continue
+                if best is None or self.seqs[i] < self.seqs[best]:
+                    best = i
+            if best is None:
+                self.dropped += 1
+                return None, None
+            self.seqs[best] = 0
+            return best, self.frames[best]
+
+    def commit_write(self, slot, timestamp=None):
+        """Publish a filled slot as the latest frame. Returns its sequence number."""
+        with self._cond:
+            self.seq += 1
+            self.seqs[slot] = self.seq
+            self.timestamps[slot] = time.time() if timestamp is None else timestamp
+            self.latest_slot = slot
+            self._cond.notify_all()
+            return self.seq
+
+    def abort_write(self, slot):
+        """Give back a reserved slot without publishing it."""
+        with self._cond:
+            self.seqs[slot] = 0
+
+    # --- Reader API ---
+
+    def acquire_latest(self, after_seq=0, timeout=None):
+        """
+        Pin and return the newest frame with seq > after_seq.
+        Blocks up to `timeout` seconds (None = don't wait). Returns FrameRef or None.
+        """
+        with self._cond:
+            if self.seq <= after_seq:
+                if not timeout:
+                    return None
+                if not self._cond.wait_for(lambda: self.seq > after_seq, timeout):
+                    return None
+            slot = self.latest_slot
+            self.pins[slot] += 1
+            return FrameRef(self.seqs[slot], slot, self.timestamps[slot], self.frames[slot])
+
+    def release(self, ref):
+        """Unpin a frame obtained from acquire_latest."""
+        if ref is None:
+            return
+        with self._cond:
+            self.pins[ref.slot] -= 1
+
+    def wake_readers(self):
+        """Wake any blocked readers (used on shutdown)."""
+        with self._cond:
+            self._cond.notify_all()
+
+
+class LiveFrameSampler:
+    """
+    Time-based frame sampler shared by a producer (capture) and a consumer.
+
+    The capture thread asks `due()` before doing any work on a new frame,
+    so frames the consumer will never see skip conversion and masking.
+    With latest_when_free=True nothing is produced while the consumer is
+    busy; the first frame after it frees up (the newest) is used instead.
+
+    Producer:  if sampler.due(): ... prepare frame ... sampler.publish(seq)
+    Consumer:  seq = sampler.wait(timeout) ... process ... sampler.done()
+    """
+    def __init__(self, target_hz=5.0, latest_when_free=True, name="ai"):
+        self.name = name
+        self.latest_when_free = latest_when_free
+        self.interval = 1.0 / target_hz if target_hz else 0.0
+        self.next_due = 0.0
+        self.last_publish = None
+        self.busy = False
+        self.published_seq = 0
+        self.taken_seq = 0
+        # Stats
+        self.published = 0
+        self.skipped = 0
+        self._cond = threading.Condition()
+        print(f"[SAMPLER] '{name}' sampler: {target_hz} Hz"
+              f"{' (newest frame when free)' if latest_when_free else ''}")
+
+    def set_rate(self, target_hz):
+        """
+        Change the target rate on the fly. A faster rate takes effect for
+        the very next sample, not after the slot scheduled at the old rate.
+        """
+        with self._cond:
+            self.interval = 1.0 / target_hz if target_hz else 0.0
+            if self.last_publish is not None:
+                self.next_due = min(self.next_due, self.last_publish + self.interval)
+
+    # --- Producer API ---
+
+    def due(self, now=None):
+        """True if the next frame should be prepared for the consumer."""
+        now = time.time() if now is None else now
+        with self._cond:
+            if self.latest_when_free and (self.busy or self.published_seq > self.taken_seq):
+                ok = False
+            else:
+                ok = now >= self.next_due
+            if not ok:
+                self.skipped += 1
+            return ok
+
+    def publish(self, seq, now=None):
+        """Hand frame `seq` to the consumer and schedule the next sample."""
+        now = time.time() if now is None else now
+        with self._cond:
+            self.published_seq = seq
+            self.published += 1
+            self.last_publish = now
+            self.next_due += self.interval
+            if self.next_due <= now:
+                # Fell behind (e.g. model was busy); don't burst to catch up
+                self.next_due = now + self.interval
+            self._cond.notify_all()
+
+    # --- Consumer API ---
+
+    def wait(self, timeout=None):
+        """
+        Wait for a newly published frame. Marks the consumer busy.
+        Returns the published sequence number or None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.published_seq > self.taken_seq, timeout):
+                return None
+            self.taken_seq = self.published_seq
+            self.busy = True
+            return self.taken_seq
+
+    def done(self):
+        """Consumer finished with the current frame and is free again."""
+        with self._cond:
+            self.busy = False
+
+    def wake(self):
+        """Wake a blocked consumer (used on shutdown)."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def get_stats(self):
+        with self._cond:
+            total = self.published + self.skipped
+            return {
+                'published': self.published,
+                'skipped': self.skipped,
+                'skip_ratio': self.skipped / total if total else 0.0
+            }
@@ -0,0 +1,318 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: gcode_stream.py
+PURPOSE: Host-side G-code streaming with a precomputed layer index.
+Based on: SECTION 3: LIVE PRINTER CONTROL STRUCTURE
+================================================================================
+
+The monitor prints the file itself instead of leaving the printer to work
+out which layer it is on:
+  - build_layer_index() scans the file once (memory-mapped, so
+    multi-hundred-MB files are never read into Python strings) and records
+    where each layer starts: byte offset, Z height and the filament the
+    layer is expected to extrude. Slicer layer markers (";LAYER:n" from
+    Cura, ";LAYER_CHANGE" from PrusaSlicer / OrcaSlicer) are used when
+    present, otherwise a layer starts at the first extruding move at a
+    higher Z. The index is cached next to the file as <file>.layers.npy
+    and opened memory-mapped afterwards.
+  - LiveGcodeStreamer sends the file through the printer's serial
+    transport with ok-based flow control: at most `window` lines are
+    waiting for their "ok" at any time.
+  - The streamer only compares the current byte offset with the next
+    layer's start offset for each line. Listeners (model thresholds,
+    depth analyzer, correction engine) are called once per layer change,
+    and progress is read on demand with get_progress().
+"""
+
+import os
+import re
+import mmap
+import time
+import threading
+from collections import deque
+import numpy as np
+
+from serial_transport import PRIORITY_NORMAL, PrinterCommandError, PrinterDisconnected
+
+LAYER_INDEX_DTYPE = np.dtype([
+    ('layer', np.int32),            # 1-based layer number
+    ('offset', np.uint64),          # byte offset of the layer's first line
+    ('z', np.float32),              # Z height in mm (NaN if the layer never extrudes)
+    ('extrusion', np.float32)       # expected filament length in mm (net E)
+])
+
+INDEX_SUFFIX = '.layers.npy'
+
+# Only the lines that matter for the index; everything else is skipped in C
+_INDEX_LINE_REGEX = re.compile(
+    rb'^[ \t]*(?:;[ \t]*(LAYER:-?\d+|LAYER_CHANGE)'      # 1: slicer layer marker
+    rb'|G([0-3])(?![0-9.])([^;\r\n]*)'                  # 2, 3: move (G0-G3) and its parameters
+    rb'|M8([23])(?![0-9.])'                             # 4: absolute / relative extrusion
+    rb'|G92(?![0-9.])([^;\r\n]*))',                     # 5: set position
+    re.MULTILINE)
+_PARAM_REGEX = re.compile(rb'([XYZE])[ \t]*(-?\d*\.?\d+)')
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def build_layer_index(path):
+    """
+    One pass over a G-code file. Returns a LAYER_INDEX_DTYPE array, one row
+    per layer in file order.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return np.empty(0, dtype=LAYER_INDEX_DTYPE)
+
+    marked = []             # [offset, filament at start, z] per slicer marker
+    by_z = []               # the same, inferred from Z changes
+    relative_e = False
+    e = 0.0                 # current E axis position (absolute mode)
+    filament = 0.0          # net filament extruded so far
+    z = 0.0
+    z_offset = 0            # offset of the line that moved to the current Z
+    last_layer_z = None
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for match in _INDEX_LINE_REGEX.finditer(mm):
+            marker, move, move_params, m8x, g92_params = match.groups()
+            if move is not None:
+                params = dict(_PARAM_REGEX.findall(move_params))
+                if b'Z' in params:
+                    new_z = float(params[b'Z'])
+                    if new_z != z:
+                        z = new_z
+                        z_offset = match.start()
+                if b'E' in params:
+                    value = float(params[b'E'])
+                    delta = value if relative_e else value - e
+                    e = e + value if relative_e else value
+                    filament += delta
+                    if delta > 0 and move != b'0':
+                        # Extruding move: belongs to a layer at height z
+                        if marked and marked[-1][2] is None:
+                            marked[-1][2] = z
+                        if last_layer_z is None or z > last_layer_z + 1e-4:
+                            by_z.append([z_offset, filament - delta, z])
+                            last_layer_z = z
+            elif marker is not None:
+                marked.append([match.start(), filament, None])
+            elif m8x is not None:
+                relative_e = m8x == b'3'
+            elif g92_params is not None:
+                params = dict(_PARAM_REGEX.findall(g92_params))
+                if b'E' in params:
+                    e = float(params[b'E'])
+                elif not g92_params.strip():
+                    e = 0.0     # bare G92 zeroes every axis
+
+    rows = marked if marked else by_z
+    index = np.empty(len(rows), dtype=LAYER_INDEX_DTYPE)
+    if len(rows):
+        index['layer'] = np.arange(1, len(rows) + 1)
+        index['offset'] = [row[0] for row in rows]
+        index['z'] = [np.nan if row[2] is None else row[2] for row in rows]
+        starts = np.array([row[1] for row in rows] + [filament], dtype=np.float64)
+        index['extrusion'] = np.diff(starts)
+    return index
+
+
+def load_layer_index(path, rebuild=False):
+    """
+    The layer index of `path`, memory-mapped from <path>.layers.npy.
+    The cache is (re)built when missing or older than the G-code file.
+    """
+    cache = index_path(path)
+    fresh = (not rebuild and os.path.exists(cache) and
+             os.path.getmtime(cache) >= os.path.getmtime(path))
+    if not fresh:
+        start = time.perf_counter()
+        index = build_layer_index(path)
+        try:
+            np.save(cache, index)
+        except OSError as e:
+            print(f"[GCODE] Could not cache the layer index at {cache}: {e}")
+            return index
+        print(f"[GCODE] Indexed {len(index)} layers of {path} in {time.perf_counter() - start:.2f}s.")
+    index = np.load(cache, mmap_mode='r')
+    if index.dtype != LAYER_INDEX_DTYPE:
+        return load_layer_index(path, rebuild=True)
+    return index
+
+
+class LiveGcodeStreamer:
+    """
+    Streams one G-code file to a LivePrinterControl's transport.
+    on_layer(info) is called from the streaming thread when the first
+    line of each layer is sent; info is a dict with 'layer', 'layers',
+    'z', 'extrusion' and 'progress'.
+    """
+    def __init__(self, printer, path, window=4, on_layer=None, timeout=None):
+        self.printer = printer
+        self.path = path
+        self.window = max(1, window)
+        self.timeout = timeout                  # per line; None = the transport's
+        self.listeners = []
+        if on_layer is not None:
+            self.listeners.append(on_layer)
+
+        self.index = load_layer_index(path)
+        self.size = os.path.getsize(path)
+        self.state = 'idle'     # idle, streaming, paused, finished, stopped, failed
+        self.message = ''
+        self.layer = 0
+        self.z = None
+        self.position = 0
+        self.lines = 0
+        self.rejected = 0
+        self.started_at = None
+        self.finished_at = None
+
+        self._resume = threading.Event()
+        self._resume.set()
+        self._stop = False
+        self.thread = None
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def start(self):
+        self.state = 'streaming'
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="GcodeStreamer")
+        self.thread.start()
+        print(f"[GCODE] Streaming {self.path} ({self.size / 1e6:.1f} MB, {len(self.index)} layers, "
+              f"window {self.window}).")
+        return self
+
+    # --- Control ---
+
+    def pause(self):
+        """Stop feeding lines; the printer finishes what it has buffered."""
+        if self.state == 'streaming':
+            self._resume.clear()
+            self.state = 'paused'
+            print(f"[GCODE] Paused at layer {self.layer}.")
+
+    def resume(self):
+        if self.state == 'paused':
+            self.state = 'streaming'
+            self._resume.set()
+            print(f"[GCODE] Resumed at layer {self.layer}.")
+
+    def stop(self):
+        """Stop streaming (e.g. emergency stop). Lines already sent are not recalled."""
+        self._stop = True
+        self._resume.set()
+
+    @property
+    def active(self):
+        return self.state in ('streaming', 'paused')
+
+    # --- Streaming ---
+
+    def _run(self):
+        transport = self.printer.transport
+        offsets = self.index['offset']
+        next_layer = 0
+        next_offset = int(offsets[0]) if len(offsets) else self.size
+        pending = deque()
+        pos = 0
+        try:
+            with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                while pos < self.size:
+                    if not self._resume.is_set():
+                        self._resume.wait()
+                    if self._stop:
+                        break
+                    end = mm.find(b'\n', pos)
+                    if end < 0:
+                        end = self.size
+                    if pos >= next_offset:
+                        # Usually this line; past it if the marker sat in a skipped line
+                        while next_layer + 1 < len(offsets) and int(offsets[next_layer + 1]) <= pos:
+                            next_layer += 1
+                        self._enter_layer(next_layer, pos)
+                        next_layer += 1
+                        next_offset = int(offsets[next_layer]) if next_layer < len(offsets) else self.size
+                    line = mm[pos:end]
+                    pos = end + 1
+                    self.position = pos
+                    comment = line.find(b';')
+                    if comment >= 0:
+                        line = line[:comment]
+                    line = line.strip()
+                    if not line:
+                        continue
+
+                    pending.append(transport.send(line.decode('ascii', errors='replace'),
+                                                  priority=PRIORITY_NORMAL, timeout=self.timeout))
+                    self.lines += 1
+                    while len(pending) >= self.window:
+                        self._wait(pending.popleft())
+                while pending and not self._stop:
+                    self._wait(pending.popleft())
+        except (PrinterDisconnected, TimeoutError) as e:
+            self._finish('failed', f"Streaming stopped at layer {self.layer}: {e}")
+            return
+        except Exception as e:
+            self._finish('failed', f"Streaming error at layer {self.layer}: {e}")
+            return
+        self.position = min(pos, self.size)
+        if self._stop:
+            self._finish('stopped', f"Streaming stopped at layer {self.layer}.")
+        else:
+            self._finish('finished', f"Finished {self.path}: {self.lines} lines, {self.layer} layers.")
+
+    def _wait(self, future):
+        try:
+            future.result()
+        except PrinterCommandError as e:
+            if self._stop:
+                return      # emergency stop failed everything in flight
+            # e.g. a slicer-specific M-code this firmware lacks; carry on
+            self.rejected += 1
+            print(f"[GCODE] Printer rejected a line: {e}")
+
+    def _enter_layer(self, i, pos):
+        row = self.index[i]
+        self.layer = int(row['layer'])
+        self.z = None if np.isnan(row['z']) else float(row['z'])
+        info = {
+            'layer': self.layer,
+            'layers': len(self.index),
+            'z': self.z,
+            'extrusion': float(row['extrusion']),
+            'progress': pos / self.size
+        }
+        for callback in self.listeners:
+            try:
+                callback(info)
+            except Exception as e:
+                print(f"[GCODE] Layer listener error: {e}")
+
+    def _finish(self, state, message):
+        self.state = state
+        self.message = message
+        self.finished_at = time.time()
+        print(f"[GCODE] {message}")
+
+    # --- Status ---
+
+    def get_progress(self):
+        """Where the print is. Reads a few attributes; never blocks the streaming thread."""
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return {
+            'state': self.state,
+            'file': os.path.basename(self.path),
+            'layer': self.layer,
+            'layers': len(self.index),
+            'z': self.z,
+            'progress': self.position / self.size if self.size else 1.0,
+            'lines': self.lines,
+            'rejected': self.rejected,
+            'elapsed': end - self.started_at if self.started_at is not None else 0.0
+        }
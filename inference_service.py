@@ -0,0 +1,466 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: inference_service.py
+PURPOSE: One shared, batching YOLO service for several printers on a host.
+Based on: SECTION 1: CORE SYSTEM ARCHITECTURE (Live Threading Pattern)
+================================================================================
+
+Without this, every printer's main.py loads its own copy of the weights.
+With it, the host runs a single service process that owns the only model:
+
+    python inference_service.py --model best.pt
+    python main.py --ai-service localhost:6001 --printer-id prusa1
+    python main.py --ai-service localhost:6001 --printer-id prusa2 ...
+
+Each printer keeps its own capture, correction engine and dashboard. Its AI
+ring buffer is moved into shared memory (like inference_worker.py), and only
+slot indices cross the socket. The service collects pending frames into
+dynamic batches, bounded by max_batch and by max_wait after the oldest
+request, taking printers round-robin. It runs one forward pass per batch and
+sends each printer its own result back.
+"""
+
+import time
+import argparse
+import threading
+from collections import deque, OrderedDict
+from multiprocessing.connection import Listener, Client
+import numpy as np
+
+DEFAULT_ADDRESS = ('localhost', 6001)
+DEFAULT_AUTHKEY = b'live-ai-monitor'
+
+
+def parse_address(text):
+    """'host:port' -> (host, port)."""
+    host, _, port = text.rpartition(':')
+    return (host or 'localhost', int(port))
+
+
+def _attach_shared_memory(name):
+    """Attach to another process's block without taking ownership of it."""
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: the resource tracker would unlink the block on exit
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _PrinterChannel:
+    """Service-side state for one connected printer."""
+    def __init__(self, printer_id, conn, shm, frames, roi_mask):
+        self.printer_id = printer_id
+        self.conn = conn
+        self.shm = shm
+        self.frames = frames
+        self.roi_mask = roi_mask
+        self.pending = deque()          # (slot, seq, timestamp, layer, received)
+        self.send_lock = threading.Lock()
+        self.connected = True
+
+        # Stats
+        self.requests = 0
+        self.served = 0
+        self.total_wait = 0.0           # queued -> batch start
+        self.total_latency = 0.0        # queued -> result sent
+
+    def close(self):
+        self.connected = False
+        self.frames = None
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class LiveInferenceService:
+    """
+    Dynamic batching server around one LiveAIModel.
+    A batch is run as soon as it holds max_batch frames, or max_wait seconds
+    after its oldest frame arrived, whichever comes first.
+    """
+    def __init__(self, model, address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY,
+                 max_batch=8, max_wait=0.03, stats_interval=60.0):
+        self.model = model
+        self.address = address
+        self.authkey = authkey
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait
+        self.stats_interval = stats_interval
+
+        self.channels = OrderedDict()   # printer_id -> _PrinterChannel
+        self._cond = threading.Condition()
+        self._next = 0                  # round-robin start position
+        self.running = False
+
+        # Stats
+        self.batches = 0
+        self.batched_frames = 0
+        self.total_batch_time = 0.0
+
+    # --- Connections ---
+
+    def serve_forever(self):
+        """Accept printers and run the batcher until Ctrl+C."""
+        self.running = True
+        self.listener = Listener(self.address, authkey=self.authkey)
+        print(f"[SERVICE] Listening on {self.address[0]}:{self.address[1]} "
+              f"(max batch {self.max_batch}, max wait {self.max_wait * 1000:.0f} ms)")
+        threading.Thread(target=self._accept_loop, daemon=True, name="ServiceAccept").start()
+        try:
+            self._batch_loop()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                if self.running:
+                    print(f"[SERVICE] Connection rejected: {e}")
+                continue
+            threading.Thread(target=self._client_loop, args=(conn,), daemon=True,
+                             name="ServiceClient").start()
+
+    def _client_loop(self, conn):
+        """Register one printer, then queue its requests until it disconnects."""
+        channel = None
+        try:
+            _, printer_id, shm_name, shape, dtype, roi_mask = conn.recv()
+            shm = _attach_shared_memory(shm_name)
+            frames = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            channel = _PrinterChannel(printer_id, conn, shm, frames, roi_mask)
+            with self._cond:
+                old = self.channels.pop(printer_id, None)
+                self.channels[printer_id] = channel
+            if old is not None:
+                old.close()
+            conn.send(('ready', printer_id))
+            print(f"[SERVICE] Printer '{printer_id}' connected ({len(self.channels)} total).")
+
+            while self.running:
+                msg = conn.recv()
+                if msg is None:
+                    break
+                _, slot, seq, timestamp, layer = msg
+                with self._cond:
+                    channel.requests += 1
+                    channel.pending.append((slot, seq, timestamp, layer, time.perf_counter()))
+                    self._cond.notify()
+        except (EOFError, OSError, ValueError) as e:
+            if channel is None:
+                print(f"[SERVICE] Bad handshake: {e}")
+        finally:
+            if channel is not None:
+                with self._cond:
+                    if self.channels.get(channel.printer_id) is channel:
+                        del self.channels[channel.printer_id]
+                    channel.pending.clear()
+                channel.close()
+                print(f"[SERVICE] Printer '{channel.printer_id}' disconnected.")
+            else:
+                conn.close()
+
+    # --- Batching ---
+
+    def _take_batch(self):
+        """
+        Block until a batch is ready. Printers are visited round-robin,
+        one frame each per round, so a busy printer cannot starve the rest.
+        """
+        with self._cond:
+            while self.running and not any(c.pending for c in self.channels.values()):
+                self._cond.wait(timeout=1.0)
+            if not self.running:
+                return []
+
+            # Wait for more frames, up to max_wait after the oldest one
+            oldest = min(c.pending[0][4] for c in self.channels.values() if c.pending)
+            while True:
+                queued = sum(len(c.pending) for c in self.channels.values())
+                remaining = oldest + self.max_wait - time.perf_counter()
+                if queued >= self.max_batch or remaining <= 0 or not self.running:
+                    break
+                self._cond.wait(timeout=remaining)
+
+            channels = list(self.channels.values())
+            if not channels:
+                return []
+            start = self._next % len(channels)
+            order = channels[start:] + channels[:start]
+            self._next = start + 1
+
+            batch = []
+            while len(batch) < self.max_batch and any(c.pending for c in order):
+                for channel in order:
+                    if channel.pending and len(batch) < self.max_batch:
+                        batch.append((channel, channel.pending.popleft()))
+            return batch
+
+    def _batch_loop(self):
+        last_stats = time.time()
+        while self.running:
+            batch = self._take_batch()
+            if batch:
+                self._run_batch(batch)
+            if self.stats_interval and time.time() - last_stats >= self.stats_interval:
+                last_stats = time.time()
+                self.print_stats()
+
+    def _run_batch(self, batch):
+        # Printers that disconnected since the batch was taken
+        batch = [(channel, request) for channel, request in batch if channel.frames is not None]
+        if not batch:
+            return
+        start = time.perf_counter()
+        frames = [channel.frames[request[0]] for channel, request in batch]
+        rois = [channel.roi_mask for channel, _ in batch]
+        layers = [request[3] for _, request in batch]
+        try:
+            results = self.model.detect_batch(frames, rois, layers)
+        except Exception as e:
+            print(f"[SERVICE] Error during batch inference: {e}")
+            results = [None] * len(batch)
+        done = time.perf_counter()
+
+        self.batches += 1
+        self.batched_frames += len(batch)
+        self.total_batch_time += done - start
+
+        for (channel, (slot, seq, timestamp, layer, received)), detections in zip(batch, results):
+            result = self.model.best_defect(detections, channel.roi_mask)
+            channel.served += 1
+            channel.total_wait += start - received
+            channel.total_latency += done - received
+            try:
+                with channel.send_lock:
+                    channel.conn.send(('result', seq, timestamp, result, done - received))
+            except (OSError, ValueError):
+                channel.connected = False
+
+    # --- Stats ---
+
+    def get_stats(self):
+        """Service totals plus per-printer share and latency (fairness)."""
+        served = sum(c.served for c in self.channels.values())
+        printers = {}
+        for printer_id, c in self.channels.items():
+            printers[printer_id] = {
+                'requests': c.requests,
+                'served': c.served,
+                'share': c.served / served if served else 0.0,
+                'avg_wait_ms': 1000.0 * c.total_wait / c.served if c.served else 0.0,
+                'avg_latency_ms': 1000.0 * c.total_latency / c.served if c.served else 0.0,
+                'queued': len(c.pending)
+            }
+        return {
+            'batches': self.batches,
+            'avg_batch_size': self.batched_frames / self.batches if self.batches else 0.0,
+            'avg_batch_ms': 1000.0 * self.total_batch_time / self.batches if self.batches else 0.0,
+            'printers': printers
+        }
+
+    def print_stats(self):
+        stats = self.get_stats()
+        print(f"[SERVICE] {stats['batches']} batches, avg size {stats['avg_batch_size']:.1f}, "
+              f"avg {stats['avg_batch_ms']:.0f} ms per batch.")
+        for printer_id, p in stats['printers'].items():
+            print(f"[SERVICE]   {printer_id}: {p['served']} frames ({p['share']:.0%}), "
+                  f"wait {p['avg_wait_ms']:.0f} ms, latency {p['avg_latency_ms']:.0f} ms.")
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.print_stats()
+        with self._cond:
+            self._cond.notify_all()
+            channels = list(self.channels.values())
+            self.channels.clear()
+        for channel in channels:
+            channel.close()
+        self.listener.close()
+        print("[SERVICE] Inference service stopped.")
+
+
+class LiveInferenceClient:
+    """
+    Printer-side handle for a shared LiveInferenceService.
+    Same interface as LiveInferenceWorker, so LiveAIThread can use either.
+    Like the worker, a lost service is reconnected on a background thread
+    (with backoff); until then analyze_ref returns None at once.
+    """
+    def __init__(self, printer_id, frame_buffer, roi_mask=None, address=DEFAULT_ADDRESS,
+                 authkey=DEFAULT_AUTHKEY, timeout=10.0, restart_backoff=1.0, restart_backoff_max=30.0):
+        self.printer_id = printer_id
+        self.frame_buffer = frame_buffer
+        self.roi_mask = roi_mask
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.restart_backoff = restart_backoff          # first retry delay after a failed reconnect
+        self.restart_backoff_max = restart_backoff_max
+        self.current_layer = 0
+
+        self.shm_name = frame_buffer.share()
+        self.conn = None
+        self.ready = threading.Event()      # set while registered with the service
+        self.closing = False
+        self._restart_thread = None
+
+        # Stats
+        self.restarts = 0
+        self.skipped_not_ready = 0
+        self.inferences = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+
+        self.connect()
+
+    def connect(self):
+        """(Re)connect to the service and register this printer's frame buffer."""
+        conn = None
+        try:
+            conn = Client(self.address, authkey=self.authkey)
+            conn.send(('hello', self.printer_id, self.shm_name, self.frame_buffer.frames.shape,
+                       self.frame_buffer.frames.dtype.str, self.roi_mask))
+            if not conn.poll(self.timeout):
+                raise TimeoutError("no reply from service")
+            conn.recv()
+        except (OSError, EOFError, TimeoutError) as e:
+            print(f"[SERVICE] Could not reach inference service: {e}")
+            if conn is not None:
+                conn.close()
+            return False
+        if self.closing:
+            conn.close()
+            return False
+        self.conn = conn
+        print(f"[SERVICE] Printer '{self.printer_id}' registered with inference service "
+              f"at {self.address[0]}:{self.address[1]}.")
+        self.ready.set()
+        return True
+
+    def restart(self, reason):
+        """Drop the connection and reconnect in the background. Returns at once."""
+        print(f"[SERVICE] Reconnecting to inference service: {reason}")
+        self.restarts += 1
+        self.ready.clear()
+        self._disconnect()
+        self._restart_thread = threading.Thread(target=self._restart_loop, daemon=True,
+                                                name="AIServiceReconnect")
+        self._restart_thread.start()
+
+    def _restart_loop(self):
+        """Reconnect, retrying with backoff until registered (or close())."""
+        delay = self.restart_backoff
+        while not self.closing:
+            if self.connect():
+                return
+            if self.closing:
+                return
+            print(f"[SERVICE] Retrying in {delay:.0f}s.")
+            time.sleep(delay)
+            delay = min(delay * 2, self.restart_backoff_max)
+
+    @property
+    def restarting(self):
+        return self._restart_thread is not None and self._restart_thread.is_alive()
+
+    def _disconnect(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
+
+    def set_current_layer(self, layer):
+        self.current_layer = layer
+
+    def analyze_ref(self, ref):
+        """
+        Analyze a pinned FrameRef from the shared frame buffer.
+        Returns the defect dict (with frame_seq / frame_time added) or None.
+        The ref must stay pinned until this returns. Returns None at once
+        while (re)connecting to the service.
+        """
+        if not self.ready.is_set():
+            if not self.restarting and not self.closing:
+                self.restart("not connected")
+            self.skipped_not_ready += 1
+            return None
+
+        try:
+            self.conn.send(('infer', ref.slot, ref.seq, ref.timestamp, self.current_layer))
+            # Discard replies to earlier, timed-out requests
+            while True:
+                if not self.conn.poll(self.timeout):
+                    self.restart(f"no result after {self.timeout}s")
+                    return None
+                _, seq, timestamp, result, latency = self.conn.recv()
+                if seq == ref.seq:
+                    break
+        except (EOFError, BrokenPipeError, OSError) as e:
+            self.restart(f"connection lost ({e})")
+            return None
+
+        self.inferences += 1
+        self.last_latency = latency
+        self.total_latency += latency
+        if result:
+            result['frame_seq'] = seq
+            result['frame_time'] = timestamp
+        return result
+
+    def get_stats(self):
+        return {
+            'inferences': self.inferences,
+            'restarts': self.restarts,
+            'skipped_not_ready': self.skipped_not_ready,
+            'avg_latency': self.total_latency / self.inferences if self.inferences else 0.0,
+            'last_latency': self.last_latency
+        }
+
+    def close(self):
+        """Unregister from the service (shared memory is owned by the frame buffer)."""
+        self.closing = True
+        self.ready.clear()
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self._disconnect()
+        print("[SERVICE] Disconnected from inference service.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared batching inference service for several printers.")
+    parser.add_argument('--model', default='best.pt')
+    parser.add_argument('--backend', default='torch')
+    parser.add_argument('--address', default=f"{DEFAULT_ADDRESS[0]}:{DEFAULT_ADDRESS[1]}",
+                        help="host:port to listen on")
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--max-wait', type=float, default=0.03,
+                        help="Seconds to wait for a batch to fill")
+    args = parser.parse_args()
+
+    from ai_model import LiveAIModel
+    model = LiveAIModel(model_path=args.model, backend=args.backend)
+    model.warmup()
+    service = LiveInferenceService(model, parse_address(args.address),
+                                   max_batch=args.max_batch, max_wait=args.max_wait)
+    service.serve_forever()
@@ -0,0 +1,223 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: inference_worker.py
+PURPOSE: Runs LiveAIModel in a separate process to get around the GIL.
+Based on: SECTION 1: CORE SYSTEM ARCHITECTURE (Live Threading Pattern)
+================================================================================
+
+The AI thread keeps its place in the pipeline, but instead of calling the
+model it hands a ring buffer slot index to a worker process and waits on a
+pipe (which releases the GIL). Frames are never copied: the ring buffer is
+moved into shared memory and the worker reads the slot in place.
+
+If the worker crashes or hangs it is killed and restarted automatically,
+on a background thread: loading the model can take minutes, and the AI
+thread must not sit on a ring slot meanwhile. Frames arriving before the
+new worker is ready are skipped (analyze_ref returns None at once).
+"""
+
+import os
+import time
+import threading
+import multiprocessing as mp
+import numpy as np
+
+
+def _worker_main(model_path, shm_name, shape, dtype, roi_mask, backend, tiling, conn):
+    """Worker process entry point. Loads the model and serves requests."""
+    from multiprocessing import shared_memory
+    from ai_model import LiveAIModel
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    model = LiveAIModel(model_path=model_path, backend=backend)
+    model.enable_tiling(tiling)
+    model.warmup(roi_mask, width=shape[2], height=shape[1])
+    conn.send(('ready', os.getpid()))
+
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            slot, seq, timestamp, layer = msg
+            model.set_current_layer(layer)
+            start = time.time()
+            result = model.analyze_live(frames[slot], roi=roi_mask)
+            conn.send(('result', seq, timestamp, result, time.time() - start))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del frames
+        shm.close()
+
+
+class LiveInferenceWorker:
+    """
+    Parent-side handle for the inference process.
+    Used by LiveAIThread in place of calling LiveAIModel directly.
+    """
+    def __init__(self, model_path, frame_buffer, roi_mask=None, timeout=10.0, start_timeout=180.0,
+                 backend='torch', tiling='off', restart_backoff=1.0, restart_backoff_max=60.0):
+        self.model_path = model_path
+        self.backend = backend
+        self.tiling = tiling
+        self.frame_buffer = frame_buffer
+        self.roi_mask = roi_mask
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.restart_backoff = restart_backoff          # first retry delay after a failed restart
+        self.restart_backoff_max = restart_backoff_max
+        self.current_layer = 0
+
+        self.shm_name = frame_buffer.share()
+        self._ctx = mp.get_context('spawn')
+        self.process = None
+        self.conn = None
+        self.ready = threading.Event()      # set while a loaded worker is serving
+        self.closing = False
+        self._restart_thread = None
+
+        # Stats
+        self.restarts = 0
+        self.skipped_not_ready = 0
+        self.inferences = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+
+        self.start()
+
+    def start(self):
+        """Spawn the worker and wait until its model is loaded."""
+        parent_conn, child_conn = self._ctx.Pipe()
+        self.process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.model_path, self.shm_name, self.frame_buffer.frames.shape,
+                  self.frame_buffer.frames.dtype.str, self.roi_mask, self.backend, self.tiling, child_conn),
+            daemon=True,
+            name="AIWorker"
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        print(f"[WORKER] Inference process started (pid {self.process.pid}). Loading model...")
+
+        # The local pipe: close() may reset self.conn from another thread meanwhile
+        try:
+            if not parent_conn.poll(self.start_timeout):
+                raise TimeoutError(f"model not loaded after {self.start_timeout}s")
+            parent_conn.recv()
+        except (EOFError, OSError, TimeoutError) as e:
+            if self.closing:
+                return False
+            print(f"[WORKER] Inference process failed to start: {e}")
+            self._kill()
+            return False
+        if self.closing:
+            return False
+        print("[WORKER] Inference process ready.")
+        self.ready.set()
+        return True
+
+    def restart(self, reason):
+        """Kill the worker and start a new one in the background. Returns at once."""
+        print(f"[WORKER] Restarting inference process: {reason}")
+        self.restarts += 1
+        self.ready.clear()
+        self._kill()
+        self._restart_thread = threading.Thread(target=self._restart_loop, daemon=True,
+                                                name="AIWorkerRestart")
+        self._restart_thread.start()
+
+    def _restart_loop(self):
+        """Start a new worker, retrying with backoff until one loads (or close())."""
+        delay = self.restart_backoff
+        while not self.closing:
+            if self.start():
+                return
+            if self.closing:
+                return
+            print(f"[WORKER] Retrying in {delay:.0f}s.")
+            time.sleep(delay)
+            delay = min(delay * 2, self.restart_backoff_max)
+
+    @property
+    def restarting(self):
+        return self._restart_thread is not None and self._restart_thread.is_alive()
+
+    def _kill(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                self.process.kill()
+        self.process = None
+
+    def set_current_layer(self, layer):
+        self.current_layer = layer
+
+    def analyze_ref(self, ref):
+        """
+        Analyze a pinned FrameRef from the shared frame buffer.
+        Returns the defect dict (with frame_seq / frame_time added) or None.
+        The ref must stay pinned until this returns. Returns None at once
+        while the worker is (re)starting.
+        """
+        if not self.ready.is_set():
+            if not self.restarting and not self.closing:
+                self.restart("process is not running")
+            self.skipped_not_ready += 1
+            return None
+        if not self.process.is_alive():
+            self.restart("process is not running")
+            self.skipped_not_ready += 1
+            return None
+
+        try:
+            self.conn.send((ref.slot, ref.seq, ref.timestamp, self.current_layer))
+            if not self.conn.poll(self.timeout):
+                self.restart(f"no result after {self.timeout}s")
+                return None
+            _, seq, timestamp, result, latency = self.conn.recv()
+        except (EOFError, BrokenPipeError, OSError) as e:
+            self.restart(f"worker died ({e})")
+            return None
+
+        self.inferences += 1
+        self.last_latency = latency
+        self.total_latency += latency
+        if result:
+            result['frame_seq'] = seq
+            result['frame_time'] = timestamp
+        return result
+
+    def get_stats(self):
+        return {
+            'inferences': self.inferences,
+            'restarts': self.restarts,
+            'skipped_not_ready': self.skipped_not_ready,
+            'avg_latency': self.total_latency / self.inferences if self.inferences else 0.0,
+            'last_latency': self.last_latency
+        }
+
+    def close(self):
+        """Stop the worker process (shared memory is owned by the frame buffer)."""
+        self.closing = True
+        self.ready.clear()
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        if self.process is not None:
+            self.process.join(timeout=2.0)
+        self._kill()
+        if self.restarting:
+            # A restart was loading a model; it gives up once its pipe closes
+            self._restart_thread.join(timeout=5.0)
+            self._kill()
+        print("[WORKER] Inference process stopped.")
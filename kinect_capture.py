@@ -10,17 +10,15 @@ Based on: SECTION 2: LIVE KINECT CAPTURE STRUCTURE
 import numpy as np
 import cv2
 
+# pykinect2 is only needed for the live sensor. Without it, ROIMask and the
+# replay sources (replay_capture.py) still work, e.g. on Linux build machines.
 try:
     from pykinect2 import PyKinectV2
     from pykinect2.PyKinectRuntime import PyKinectRuntime
-except ImportError:
-    print("="*50)
-    print("FATAL ERROR: pykinect2 library not found.")
-    print("Please ensure it is installed correctly for your Python version.")
-    print("This is a common issue and may require specific wheel files.")
-    print("See README.md for installation instructions.")
-    print("="*50)
-    raise
+except ImportError as e:
+    PyKinectV2 = None
+    PyKinectRuntime = None
+    PYKINECT_IMPORT_ERROR = e
 
 class LiveKinectCapture:
     """
@@ -28,6 +26,15 @@ class LiveKinectCapture:
     Based on: Live Kinect Initialization Pattern
     """
     def __init__(self):
+        if PyKinectRuntime is None:
+            print("="*50)
+            print("FATAL ERROR: pykinect2 library not found.")
+            print("Please ensure it is installed correctly for your Python version.")
+            print("This is a common issue and may require specific wheel files.")
+            print("See README.md for installation instructions.")
+            print("="*50)
+            raise ImportError(f"pykinect2 not available: {PYKINECT_IMPORT_ERROR}")
+
         print("[KINECT] Initializing Kinect V2 Runtime...")
         try:
             self.kinect = PyKinectRuntime(
@@ -55,9 +62,10 @@ class LiveKinectCapture:
         
         return self.latest_rgb_frame, self.latest_depth_frame
 
-    def get_live_rgb_image(self, rgb_frame_data):
+    def get_live_rgb_image(self, rgb_frame_data, out=None):
         """
         Convert live raw color frame to OpenCV format (BGR).
+        If `out` is given (e.g. a LiveFrameBuffer slot), convert into it in place.
         """
         if rgb_frame_data is None:
             return None
@@ -70,8 +78,23 @@ class LiveKinectCapture:
         ))
         
         # Convert BGRA to BGR
+        if out is not None:
+            return cv2.cvtColor(rgb_img, cv2.COLOR_BGRA2BGR, dst=out)
         return cv2.cvtColor(rgb_img, cv2.COLOR_BGRA2BGR)
 
+    def get_live_depth_raw(self, depth_frame_data):
+        """
+        Reshape a live raw depth frame to (H, W) uint16 millimeters.
+        Returns a view of the raw data (no conversion, no copy).
+        """
+        if depth_frame_data is None:
+            return None
+        
+        return depth_frame_data.reshape((
+            self.kinect.depth_frame_desc.Height,
+            self.kinect.depth_frame_desc.Width
+        ))
+
     def get_live_depth_image(self, depth_frame_data):
         """
         Convert live raw depth frame to a normalized 8-bit image for visualization
@@ -99,39 +122,114 @@ class LiveKinectCapture:
             print("[KINECT] Kinect runtime closed.")
 
 
+class ROIRegion:
+    """
+    One named region of interest: an axis-aligned rectangle or a polygon.
+    Used by ROIMask crop mode to hand the AI only the pixels it needs.
+    """
+    def __init__(self, name, shape, width=1920, height=1080):
+        self.name = name
+
+        if len(shape) == 4 and all(np.isscalar(v) for v in shape):
+            # Rectangle (x1, y1, x2, y2), inclusive like cv2.rectangle
+            x1, y1, x2, y2 = [int(v) for v in shape]
+            self.polygon = None
+            self.x1, self.y1 = max(0, x1), max(0, y1)
+            self.x2, self.y2 = min(width, x2 + 1), min(height, y2 + 1)
+        else:
+            # Polygon [(x, y), ...]
+            self.polygon = np.array(shape, dtype=np.int32).reshape(-1, 2)
+            x, y, w, h = cv2.boundingRect(self.polygon)
+            self.x1, self.y1 = max(0, x), max(0, y)
+            self.x2, self.y2 = min(width, x + w), min(height, y + h)
+
+        crop_h = self.y2 - self.y1
+        crop_w = self.x2 - self.x1
+        if crop_h <= 0 or crop_w <= 0:
+            raise ValueError(f"ROI '{name}' lies outside the {width}x{height} frame.")
+
+        # Polygon regions get a mask over their bounding box and a reusable
+        # output buffer, so cropping never allocates on the hot path.
+        self.crop_mask = None
+        self.crop_buffer = None
+        if self.polygon is not None:
+            self.crop_mask = np.zeros((crop_h, crop_w), dtype=np.uint8)
+            cv2.fillPoly(self.crop_mask, [self.polygon - (self.x1, self.y1)], 255)
+            self.crop_buffer = np.zeros((crop_h, crop_w, 3), dtype=np.uint8)
+
+    @property
+    def area(self):
+        return (self.x2 - self.x1) * (self.y2 - self.y1)
+
+    def draw(self, mask):
+        """Paint this region (255) onto a full-frame mask."""
+        if self.polygon is None:
+            mask[self.y1:self.y2, self.x1:self.x2] = 255
+        else:
+            cv2.fillPoly(mask, [self.polygon], 255)
+
+    def crop(self, frame):
+        """
+        Extract this region from a full frame.
+        Rectangles return a view (no copy). Polygons are masked into a
+        preallocated buffer that is reused on the next call.
+        """
+        view = frame[self.y1:self.y2, self.x1:self.x2]
+        if self.crop_mask is None:
+            return view
+        # Outside-polygon pixels of crop_buffer are never written, so stay black
+        return cv2.bitwise_and(view, view, dst=self.crop_buffer, mask=self.crop_mask)
+
+    def to_frame_bbox(self, bbox):
+        """Map a [x1, y1, x2, y2] box from crop coordinates back to the full frame."""
+        return [bbox[0] + self.x1, bbox[1] + self.y1, bbox[2] + self.x1, bbox[3] + self.y1]
+
+
 class ROIMask:
     """
     Generates and applies a Region of Interest mask to focus AI.
     Based on: Live ROI Mask Generation
+
+    Supports several named regions per camera (rectangles or polygons).
+    In crop mode the AI is given only each region's bounding box instead of
+    a full frame with black borders (see crop_live).
     """
-    def __init__(self, width=1920, height=1080):
+    def __init__(self, width=1920, height=1080, regions=None, crop=False):
         self.width = width
         self.height = height
+        self.crop_mode = crop
         self.mask = np.zeros((self.height, self.width), dtype=np.uint8)
         
         # --- IMPORTANT ---
-        # Define your print area coordinates here (top_left, bottom_right)
+        # Define your print area coordinates here.
+        # A region is either a rectangle (top_left_x, top_left_y, bottom_right_x, bottom_right_y)
+        # or a polygon [(x, y), (x, y), ...].
         # These values are for a 1920x1080 frame.
         # You MUST adjust these for your printer setup!
-        top_left_x = 400
-        top_left_y = 300
-        bottom_right_x = 1520
-        bottom_right_y = 900
+        if regions is None:
+            regions = {
+                'bed': (400, 300, 1520, 900),
+                # 'nozzle': [(860, 180), (1060, 180), (1100, 420), (820, 420)],
+            }
         
-        print(f"[ROI] Creating mask from ({top_left_x},{top_left_y}) to ({bottom_right_x},{bottom_right_y})")
+        self.regions = []
+        for name, shape in regions.items():
+            region = ROIRegion(name, shape, self.width, self.height)
+            self.regions.append(region)
+            print(f"[ROI] Region '{name}': ({region.x1},{region.y1}) to ({region.x2},{region.y2})"
+                  f"{' polygon' if region.polygon is not None else ''}")
+            
+            # Add the region (255) to the black mask (0)
+            region.draw(self.mask)
         
-        # Create a white rectangle (255) on the black mask (0)
-        cv2.rectangle(
-            self.mask, 
-            (top_left_x, top_left_y), 
-            (bottom_right_x, bottom_right_y), 
-            255,  # Color (white)
-            -1    # Thickness (-1 for filled)
-        )
-    
-    def apply_live(self, frame):
+        roi_pixels = sum(r.area for r in self.regions)
+        print(f"[ROI] Mode: {'crop' if crop else 'mask'}. "
+              f"ROI covers {100.0 * roi_pixels / (self.width * self.height):.0f}% of the frame.")
+
+    def apply_live(self, frame, out=None):
         """
         Apply the pre-calculated mask to a live frame.
+        If `out` is given, write the masked frame into it in place.
         """
         # Ensure frame dimensions match mask
         if frame.shape[0] != self.height or frame.shape[1] != self.width:
@@ -139,4 +237,20 @@ class ROIMask:
             frame = cv2.resize(frame, (self.width, self.height))
         
         # Use bitwise_and to zero out everything outside the mask
-        return cv2.bitwise_and(frame, frame, mask=self.mask)
\ No newline at end of file
+        if out is not None:
+            # Pixels outside the mask are left untouched in `out`. Ring buffer
+            # slots start zeroed and are only ever written through this mask,
+            # so they stay black without re-clearing the whole frame.
+            return cv2.bitwise_and(frame, frame, dst=out, mask=self.mask)
+        return cv2.bitwise_and(frame, frame, mask=self.mask)
+
+    def crop_live(self, frame):
+        """
+        Crop mode: return [(region, crop), ...] for every region.
+        Rectangle crops are views into `frame`; no full-frame work is done.
+        """
+        # Ensure frame dimensions match mask
+        if frame.shape[0] != self.height or frame.shape[1] != self.width:
+            frame = cv2.resize(frame, (self.width, self.height))
+        
+        return [(region, region.crop(frame)) for region in self.regions]
@@ -11,76 +11,128 @@ and runs the main logic loop to coordinate detection, correction, and web broadc
 """
 
 import time
-import cv2
+import argparse
+import numpy as np
 from queue import Queue, Empty
 from threading import Thread
 
 # --- Import project modules ---
 from kinect_capture import LiveKinectCapture, ROIMask
 from printer_control import LivePrinterControl
-from ai_model import LiveAIModel
+from ai_model import LiveAIModel, LiveDataCollector, INFERENCE_BACKENDS
+from tiled_inference import TILING_MODES
+from adaptive_scheduler import LiveAdaptiveScheduler
+from model_swap import LiveModelSwapper
+from active_learning import LiveActiveSampler
 from correction_engine import LiveCorrectionEngine
 from web_dashboard import LiveWebDashboard
 from event_logger import LiveEventLogger
+from frame_buffer import LiveFrameBuffer, LiveFrameSampler
+from depth_analysis import LiveDepthAnalyzer
+from replay_capture import open_replay_capture
+from change_gate import LiveChangeGate
+from registration import LiveRegistration
+from inference_worker import LiveInferenceWorker
+from inference_service import LiveInferenceClient, parse_address
 
-# --- Global Queues (from SECTION 1) ---
-# frame_queue: Holds raw frames from Kinect for AI processing
-frame_queue = Queue(maxsize=10) 
+# --- Shared Frame Buffers (from SECTION 1) ---
+# Preallocated ring buffers replace the old frame_queue / web_frame_queue.
+# Capture writes into a slot in place; readers pin the latest slot and use it
+# without copying. Total frame memory is fixed at startup.
+# frame_buffer: ROI-masked frames for AI processing (mask mode only)
+frame_buffer = LiveFrameBuffer(slots=3, name="ai")
+# web_frame_buffer: Full BGR frames for the web dashboard.
+# In ROI crop mode the AI thread crops from these too (one slot per reader).
+web_frame_buffer = LiveFrameBuffer(slots=4, name="web")
+# depth_buffer: Raw uint16 (mm) Kinect V2 depth frames for the depth analyzer
+depth_buffer = LiveFrameBuffer(slots=3, height=424, width=512, channels=1, dtype=np.uint16, name="depth")
 # ai_result_queue: Holds detection results from AI for main loop
 ai_result_queue = Queue()
-# web_frame_queue: Holds the single latest frame for web dashboard
-# Use maxsize=1 to only keep the most recent frame
-web_frame_queue = Queue(maxsize=1)
+
+# --- Frame Samplers ---
+# Decimation happens here, *before* conversion, so frames nobody will look
+# at cost nothing. The AI gets the newest frame whenever the model is free,
+# at most AI_TARGET_HZ. The dashboard just gets a capped frame rate.
+AI_TARGET_HZ = 5.0
+WEB_TARGET_HZ = 15.0
+ai_sampler = LiveFrameSampler(target_hz=AI_TARGET_HZ, latest_when_free=True, name="ai")
+web_sampler = LiveFrameSampler(target_hz=WEB_TARGET_HZ, latest_when_free=False, name="web")
 
 # --- Thread Definitions (from SECTION 1) ---
 
 class LiveCaptureThread(Thread):
     """
     Producer Thread: Captures frames from Kinect at max FPS.
-    Puts *all* frames into frame_queue for AI.
-    Puts *latest* frame into web_frame_queue for dashboard.
+    Only frames the AI or dashboard samplers want are converted: straight
+    into a web_frame_buffer slot, then masked into a frame_buffer slot for AI.
+    No per-frame allocation. In ROI crop mode the full-frame mask is skipped.
     """
     def __init__(self, kinect, roi_mask):
         super().__init__(daemon=True, name="CaptureThread")
         self.kinect = kinect
         self.roi_mask = roi_mask
         self.running = True
+        self.last_raw_frame = None
+        self.last_raw_depth = None
         print("[CAPTURE] Capture thread initialized.")
 
     def run(self):
         print("[CAPTURE] Capture thread started.")
         while self.running:
             # Get raw frame data
-            rgb_frame, _ = self.kinect.get_latest_frame()
+            rgb_frame, depth_frame = self.kinect.get_latest_frame()
+
+            # --- Depth: copy raw uint16 straight into a depth buffer slot ---
+            if depth_frame is not None and depth_frame is not self.last_raw_depth:
+                self.last_raw_depth = depth_frame
+                depth_slot, depth_view = depth_buffer.begin_write()
+                if depth_slot is not None:
+                    np.copyto(depth_view, self.kinect.get_live_depth_raw(depth_frame))
+                    depth_buffer.commit_write(depth_slot)
             
-            if rgb_frame is not None:
-                # Convert to OpenCV format
-                img = self.kinect.get_live_rgb_image(rgb_frame)
+            # Only process frames we haven't seen yet
+            if rgb_frame is not None and rgb_frame is not self.last_raw_frame:
+                self.last_raw_frame = rgb_frame
+                timestamp = time.time()
+
+                # --- Decide before doing any work ---
+                ai_due = ai_sampler.due(timestamp)
+                web_due = web_sampler.due(timestamp)
+                if not (ai_due or web_due):
+                    # Nobody wants this frame: skip conversion and masking
+                    time.sleep(0.001)
+                    continue
+
+                # --- Convert into a web buffer slot (in place) ---
+                web_slot, web_view = web_frame_buffer.begin_write()
+                if web_slot is None:
+                    # Every slot pinned by readers, drop frame (normal behavior)
+                    time.sleep(0.001)
+                    continue
+
+                img = self.kinect.get_live_rgb_image(rgb_frame, out=web_view)
                 if img is None:
+                    web_frame_buffer.abort_write(web_slot)
                     time.sleep(0.001)
                     continue
 
-                # Apply ROI mask
-                masked_img = self.roi_mask.apply_live(img)
-                
-                # --- Queue for AI Thread ---
-                try:
-                    # Non-blocking put for AI processing
-                    frame_queue.put(masked_img, block=False)
-                except:
-                    # AI queue is full, drop frame (normal behavior)
-                    pass 
-                
-                # --- Queue for Web Thread ---
-                try:
-                    # Clear queue
-                    while not web_frame_queue.empty():
-                        web_frame_queue.get_nowait()
-                    # Put latest frame
-                    web_frame_queue.put(img, block=False) 
-                except:
-                    # Web queue is full (unlikely with maxsize=1)
-                    pass
+                # --- Mask into an AI buffer slot (in place) ---
+                # Crop mode: the AI thread crops the web frame itself.
+                ai_seq = None
+                if ai_due and not self.roi_mask.crop_mode:
+                    ai_slot, ai_view = frame_buffer.begin_write()
+                    if ai_slot is not None:
+                        self.roi_mask.apply_live(img, out=ai_view)
+                        ai_seq = frame_buffer.commit_write(ai_slot, timestamp)
+
+                web_seq = web_frame_buffer.commit_write(web_slot, timestamp)
+                if web_due:
+                    web_sampler.publish(web_seq, timestamp)
+                if ai_due:
+                    if self.roi_mask.crop_mode:
+                        ai_seq = web_seq
+                    if ai_seq is not None:
+                        ai_sampler.publish(ai_seq, timestamp)
             
             # Sleep tiny amount to yield processor
             time.sleep(0.001) 
@@ -91,60 +143,255 @@ class LiveCaptureThread(Thread):
 
 class LiveAIThread(Thread):
     """
-    Consumer Thread: Processes frames from frame_queue.
-    Analyzes frames at a set interval (e.g., 5 FPS).
+    Consumer Thread: Waits for ai_sampler to hand it a frame, then reads
+    it from frame_buffer. The sampler sets the rate (e.g., 5 FPS).
     Puts detection results (if any) into ai_result_queue.
+    In ROI crop mode it reads full frames and the model crops the regions.
+    An optional LiveChangeGate skips inference on frames where nothing moved.
+    With a LiveInferenceWorker the model runs in a separate process and this
+    thread only passes it shared-memory slot indices.
+    With a LiveAdaptiveScheduler (in-process model only) the AI rate and
+    resolution rise while a defect is suspected.
+    With a LiveActiveSampler (in-process model only) frames the model is
+    unsure about are queued for labeling.
     """
-    def __init__(self, model):
+    def __init__(self, model, roi_mask=None, gate=None, worker=None, scheduler=None, sampler=None):
         super().__init__(daemon=True, name="AIThread")
         self.model = model
+        self.gate = gate
+        self.worker = worker
+        self.scheduler = scheduler if worker is None else None
+        self.sampler = sampler if worker is None else None
         self.running = True
+        self.roi_mask = roi_mask if roi_mask is not None and roi_mask.crop_mode else None
+        self.source = web_frame_buffer if self.roi_mask is not None else frame_buffer
         print("[AI] AI thread initialized.")
 
     def run(self):
         print("[AI] AI thread started.")
         while self.running:
+            # Wait for the capture thread to publish a sampled frame
+            seq = ai_sampler.wait(timeout=1.0)
+            if seq is None:
+                continue
+
+            # Newest frame at or after the published one
+            ref = self.source.acquire_latest(seq - 1)
             try:
-                # Wait for a frame from the capture thread
-                frame = frame_queue.get(timeout=1.0)
-                
-                # Analyze frame (model handles its own frame skipping)
+                if ref is None:
+                    continue
+
+                # Static scene: reuse the last (clean) result, skip YOLO.
+                # Never skip while the scheduler is chasing a suspected defect.
+                escalated = self.scheduler is not None and self.scheduler.active
+                if self.gate is not None and not escalated and not self.gate.should_infer(ref.frame):
+                    self.gate.record_skip()
+                    continue
+
+                # Analyze frame (decimation already done by ai_sampler)
                 # Based on: LiveAIModel.analyze_live
-                result = self.model.analyze_live(frame)
+                if self.worker is not None:
+                    # Slot stays pinned while the worker process reads it
+                    result = self.worker.analyze_ref(ref)
+                elif self.scheduler is not None:
+                    result = self.scheduler.analyze(self.model, ref.frame, roi=self.roi_mask)
+                else:
+                    result = self.model.analyze_live(ref.frame, roi=self.roi_mask)
+                if self.gate is not None:
+                    self.gate.record_inference(result)
+                if self.sampler is not None:
+                    self.sampler.observe(ref.frame)
                 
                 if result:
                     # Put defect result into the queue for main loop
                     ai_result_queue.put(result)
                     
-            except Empty:
-                # Queue was empty, just loop again
-                pass
             except Exception as e:
                 print(f"[AI] Error in AI thread: {e}")
                 time.sleep(0.5)
+            finally:
+                self.source.release(ref)
+                ai_sampler.done()
         print("[AI] AI thread stopped.")
 
     def stop(self):
         self.running = False
+        ai_sampler.wake()
+
+class LiveDepthThread(Thread):
+    """
+    Consumer Thread: Runs the vectorized depth analyzer on every new
+    depth frame (Kinect V2: 30 FPS), alongside the YOLO path.
+    Puts depth defects into ai_result_queue like the AI thread.
+    With registration tables, defect boxes are mapped to color pixels.
+    """
+    def __init__(self, analyzer, registration=None):
+        super().__init__(daemon=True, name="DepthThread")
+        self.analyzer = analyzer
+        self.registration = registration
+        self.running = True
+        self.last_seq = 0
+        print("[DEPTH] Depth thread initialized.")
+
+    def run(self):
+        print("[DEPTH] Depth thread started.")
+        if not self.analyzer.baseline_ready:
+            print("[DEPTH] No empty-bed baseline; depth checks are off until you run: "
+                  "python depth_analysis.py calibrate")
+        while self.running:
+            ref = depth_buffer.acquire_latest(self.last_seq, timeout=1.0)
+            if ref is None:
+                continue
+
+            try:
+                self.last_seq = ref.seq
+                result = self.analyzer.analyze_depth(ref.frame)
+                
+                if result:
+                    if self.registration is not None:
+                        # Dashboard and logs expect color-frame boxes
+                        color_bbox = self.registration.depth_bbox_to_color(result['bbox'])
+                        if color_bbox is not None:
+                            result['depth_bbox'] = result['bbox']
+                            result['bbox'] = color_bbox
+                    ai_result_queue.put(result)
+                    
+            except Exception as e:
+                print(f"[DEPTH] Error in depth thread: {e}")
+                time.sleep(0.5)
+            finally:
+                depth_buffer.release(ref)
+        print("[DEPTH] Depth thread stopped.")
+
+    def stop(self):
+        self.running = False
+        depth_buffer.wake_readers()
+
+# --- Startup Helpers ---
+def _timed(phase_times, name, fn, *args, **kwargs):
+    """Call fn and record how long it took as phase_times[name]."""
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        phase_times[name] = time.perf_counter() - start
+
+class _InitTask(Thread):
+    """
+    Runs one startup phase in the background. result() waits for it and
+    re-raises its exception. Daemon, so a phase that never finishes
+    (e.g. printer retries) cannot keep a failed startup alive.
+    """
+    def __init__(self, phase_times, name, fn, *args, **kwargs):
+        super().__init__(daemon=True, name=f"Init-{name}")
+        self.phase_times = phase_times
+        self.phase = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = _timed(self.phase_times, self.phase, self.fn, *self.args, **self.kwargs)
+        except BaseException as e:
+            self.error = e
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+def _init_ai(phase_times, model_path, roi, backend, tiling, ai_process, ai_service, printer_id, adaptive):
+    """Load (and warm up) the model, or connect to the worker/service. Returns (ai_model, ai_worker)."""
+    ai_source = web_frame_buffer if roi.crop_mode else frame_buffer
+    if ai_service is not None:
+        # One model shared by all printers on this host; frames go via shared memory
+        return None, LiveInferenceClient(printer_id, ai_source, roi, address=parse_address(ai_service))
+    if ai_process:
+        # The model lives in the worker process (warmed up there); frames go via shared memory
+        return None, LiveInferenceWorker(model_path, ai_source, roi, backend=backend, tiling=tiling)
+
+    ai_model = _timed(phase_times, 'model load', LiveAIModel, model_path=model_path, backend=backend)
+    ai_model.enable_tiling(tiling)
+    # First-inference setup happens now, not on the first real frame.
+    # The adaptive scheduler uses full-resolution tiles, so warm those too.
+    _timed(phase_times, 'model warm-up', ai_model.warmup, roi, tiles=True if adaptive else None)
+    return ai_model, None
+
+def _latest_depth():
+    """Copy of the newest depth frame (for active learning samples), or None."""
+    ref = depth_buffer.acquire_latest(0)
+    if ref is None:
+        return None
+    try:
+        return ref.frame.copy()
+    finally:
+        depth_buffer.release(ref)
 
 # --- Main Application ---
-def main():
+def main(replay=None, realtime=True, ai_process=False, backend='torch', tiling='off',
+         ai_service=None, printer_id='printer1', adaptive=False, active_learning=False, gcode=None):
+    """
+    Run the monitor. `replay` is a video file or raw archive directory to
+    use instead of the live Kinect (see replay_capture.py).
+    `ai_process` runs the model in a separate process (see inference_worker.py).
+    `backend` is 'torch', 'onnx' or 'openvino' (export with AITrainer.export_live_model).
+    `tiling` is 'off', 'full' or 'coarse_fine' (see tiled_inference.py).
+    `ai_service` is the host:port of a shared inference_service.py; this
+    printer then registers as `printer_id` and loads no model itself.
+    `adaptive` runs the AI at a low baseline rate and escalates while a
+    defect is suspected (see adaptive_scheduler.py).
+    `active_learning` saves frames the model is unsure about, with
+    pre-labels, to live_raw_data/ (see active_learning.py).
+    `gcode` is a file to print from the host; its layer index drives the
+    per-layer thresholds and the dashboard (see gcode_stream.py).
+    """
     print("[SYSTEM] Starting Live AI 3D Printer Monitor...")
+    startup_start = time.perf_counter()
+    phase_times = {}
 
     # 1. Initialize Modules
+    # Capture, printer, model and dashboard don't depend on each other, so
+    # they start in parallel: the printer's bootloader wait, the Kinect
+    # runtime and the model load/warm-up overlap instead of adding up.
     try:
         # Log to 'print_monitor.log'
         logger = LiveEventLogger("print_monitor.log") 
-        kinect = LiveKinectCapture()
-        roi = ROIMask()
+        # crop=True sends only the ROI bounding boxes to YOLO (see ROIMask)
+        roi = ROIMask(crop=True)
+        # --- ADJUST YOUR MODEL PATH HERE ---
+        model_path = 'best.pt' # Use your trained 'best.pt' or 'yolov8n.pt'
+
+        if replay is None:
+            kinect_task = _InitTask(phase_times, 'capture', LiveKinectCapture)
+        else:
+            kinect_task = _InitTask(phase_times, 'capture', open_replay_capture, replay, realtime=realtime)
         # --- IMPORTANT ---
         # --- ADJUST YOUR PRINTER'S PORT HERE ---
-        printer = LivePrinterControl(port='COM3', baud=115200) 
-        # --- ADJUST YOUR MODEL PATH HERE ---
-        ai_model = LiveAIModel(model_path='best.pt') # Use your trained 'best.pt' or 'yolov8n.pt'
-        
+        # A missing / unplugged printer doesn't stop the monitor: it reconnects in the background
+        printer_task = _InitTask(phase_times, 'printer', LivePrinterControl, port='COM3', baud=115200,
+                                 on_connection=lambda state: logger.log_system(f"Printer {state}"))
+        ai_task = _InitTask(phase_times, 'ai', _init_ai, phase_times, model_path, roi, backend, tiling,
+                            ai_process, ai_service, printer_id, adaptive)
+        web_task = _InitTask(phase_times, 'dashboard', LiveWebDashboard) # This will pass printer/ai objects
+
+        # --- ADJUST THE DEPTH ROI, BED SIZE AND LAYER HEIGHT HERE ---
+        # Empty-bed baseline: python depth_analysis.py calibrate (once, with the bed empty)
+        depth_analyzer = _timed(phase_times, 'depth', LiveDepthAnalyzer, layer_height_mm=0.2)
+        # RGB <-> depth lookup tables (build once with: python registration.py calibrate)
+        registration = _timed(phase_times, 'registration', LiveRegistration.load, 'registration.npz')
+
+        kinect = kinect_task.result()
+        ai_model, ai_worker = ai_task.result()
+        web_dashboard = web_task.result()
+        printer = printer_task.result()
         corrector = LiveCorrectionEngine(printer, logger)
-        web_dashboard = LiveWebDashboard() # This will pass printer/ai objects
+        # Depth checks leave out the toolhead and gantry, so they need its position
+        depth_analyzer.set_toolhead_source(lambda: printer.state.toolhead(max_age=3.0 * printer.report_interval))
     
     except ImportError as e:
         print(f"[FATAL] Failed to import module. Is pykinect2 installed? Error: {e}")
@@ -154,16 +401,67 @@ def main():
         print(f"[FATAL] Failed to initialize modules: {e}")
         return
 
+    startup_time = time.perf_counter() - startup_start
+    breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in
+                          sorted(phase_times.items(), key=lambda item: -item[1]))
+    print(f"[STARTUP] Ready in {startup_time:.2f}s ({breakdown})")
+    logger.log_system(f"Startup took {startup_time:.2f}s ({breakdown})")
+
     # 2. Start Worker Threads
     capture_thread = LiveCaptureThread(kinect, roi)
-    ai_thread = LiveAIThread(ai_model)
+    # Skip YOLO when the ROI hasn't changed; force a check every 5 s
+    change_gate = LiveChangeGate(roi, max_interval=5.0)
+    scheduler = None
+    if adaptive:
+        if ai_model is not None:
+            # 1 FPS while healthy, 5 FPS + full-resolution tiles while suspected
+            scheduler = LiveAdaptiveScheduler(ai_sampler, baseline_hz=1.0, escalated_hz=AI_TARGET_HZ)
+        else:
+            print("[SYSTEM] Adaptive scheduling needs the in-process model; using a fixed rate.")
+    collector = None
+    active_sampler = None
+    if active_learning:
+        if ai_model is not None:
+            collector = LiveDataCollector('live_raw_data/')
+            active_sampler = LiveActiveSampler(ai_model, collector, depth_source=_latest_depth)
+        else:
+            print("[SYSTEM] Active learning needs the in-process model; not collecting.")
+    ai_thread = LiveAIThread(ai_model, roi, gate=change_gate, worker=ai_worker, scheduler=scheduler,
+                             sampler=active_sampler)
+    depth_thread = LiveDepthThread(depth_analyzer, registration)
+    # New models dropped into models/ are loaded, checked on golden_frames/
+    # and swapped in between frames; roll back from the dashboard
+    model_swapper = None
+    if ai_model is not None:
+        model_swapper = LiveModelSwapper(ai_model, roi, watch_dir='models/', golden_dir='golden_frames/')
+        web_dashboard.attach_model_swapper(model_swapper)
+        model_swapper.start_watching()
+    else:
+        print("[SYSTEM] Model hot swap needs the in-process model (not --ai-process / --ai-service).")
     
     capture_thread.start()
     ai_thread.start()
+    depth_thread.start()
+    logger.log_system("Monitoring active.")
+
+    # Layer changes come from the G-code streamer, once per layer (not per line)
+    def publish_layer(info):
+        layer = info['layer']
+        if ai_model is not None:
+            ai_model.set_current_layer(layer)
+        if ai_worker is not None:
+            ai_worker.set_current_layer(layer)
+        depth_analyzer.set_current_layer(layer)
+        corrector.set_current_layer(layer)
+        logger.log_system(f"Layer {layer}/{info['layers']} (Z={info['z']}, "
+                          f"{info['extrusion']:.0f} mm filament expected)")
+
+    if gcode is not None:
+        printer.stream_file(gcode, on_layer=publish_layer)
 
     # 3. Main Logic Loop (consumes AI results)
     print("[SYSTEM] Main loop running. Press Ctrl+C to stop.")
-    current_layer = 0 # TODO: This should be updated, e.g., from G-code parser
+    last_web_seq = 0
     
     try:
         while True:
@@ -171,6 +469,14 @@ def main():
             try:
                 defect = ai_result_queue.get(timeout=0.01) # Non-blocking
                 
+                # Depth check on YOLO detections: a table lookup, no SDK call
+                if registration is not None and defect.get('source') != 'depth':
+                    defect['depth_bbox'] = registration.color_bbox_to_depth(defect['bbox'])
+                    defect['height_mm'] = depth_analyzer.region_height_mm(defect['depth_bbox'])
+                
+                if active_sampler is not None:
+                    active_sampler.note_depth_defect(defect)
+                
                 # We found a defect!
                 print(f"[MAIN] Defect detected: {defect['type']} ({defect['confidence']:.2f})")
                 logger.log_defect(defect)
@@ -183,30 +489,38 @@ def main():
                 pass
 
             # --- B. Broadcast Web Dashboard Frame ---
-            try:
-                # Get the latest frame for the web dashboard
-                web_frame = web_frame_queue.get_nowait()
-                
-                # Get live printer status
-                temps = printer.get_live_temp()
-                if temps is None:
-                    temps = {'hotend': 0, 'bed': 0, 'hotend_target': 0, 'bed_target': 0}
-                
-                # Prepare metadata
-                metadata = {
-                    'layer': current_layer,
-                    'temp': temps,
-                    'defect': None # TODO: Add last defect info
-                }
-                
-                # Broadcast
-                web_dashboard.broadcast_live_frame(web_frame, metadata)
-                
-            except Empty:
-                # No new web frame, skip
-                pass
-            except Exception as e:
-                print(f"[MAIN] Error in web broadcast loop: {e}")
+            # Pin the latest frame for the web dashboard (no copy)
+            web_ref = web_frame_buffer.acquire_latest(last_web_seq)
+            if web_ref is not None:
+                try:
+                    last_web_seq = web_ref.seq
+                    
+                    # Get live printer status from the auto-reported cache (no serial round-trip).
+                    # Offline or stale (reports stopped): send nothing, the dashboard shows '--'
+                    temps = None
+                    if printer.connected:
+                        temps = printer.state.temps(max_age=3.0 * printer.report_interval)
+                    if temps is None:
+                        temps = {}
+                    
+                    # Layer and progress of the host print (attribute reads, no serial I/O)
+                    progress = printer.get_progress()
+                    
+                    # Prepare metadata
+                    metadata = {
+                        'layer': progress['layer'] if progress is not None else 0,
+                        'progress': progress,
+                        'temp': temps,
+                        'defect': None # TODO: Add last defect info
+                    }
+                    
+                    # Broadcast
+                    web_dashboard.broadcast_live_frame(web_ref.frame, metadata)
+                    
+                except Exception as e:
+                    print(f"[MAIN] Error in web broadcast loop: {e}")
+                finally:
+                    web_frame_buffer.release(web_ref)
 
             # Small sleep to prevent 100% CPU on main thread
             time.sleep(0.005)
@@ -220,12 +534,65 @@ def main():
     finally:
         # 7. Cleanup
         print("[SYSTEM] Stopping threads...")
+        if model_swapper is not None:
+            model_swapper.stop()
+        corrector.stop()
         capture_thread.stop()
         ai_thread.stop()
+        depth_thread.stop()
         
         capture_thread.join(timeout=2.0)
         ai_thread.join(timeout=2.0)
+        depth_thread.join(timeout=2.0)
+
+        ai_stats = ai_sampler.get_stats()
+        print(f"[SYSTEM] AI sampler: {ai_stats['published']} frames analyzed, "
+              f"{ai_stats['skipped']} skipped before conversion.")
+        if scheduler is not None:
+            sched_stats = scheduler.get_stats()
+            print(f"[SYSTEM] Scheduler: avg {sched_stats['avg_rate_hz']:.1f} FPS, "
+                  f"{sched_stats['escalations']} escalations ({sched_stats['escalated_ratio']:.0%} of the time), "
+                  f"time-to-confirm avg {sched_stats['avg_confirm_s']:.1f}s / max {sched_stats['max_confirm_s']:.1f}s.")
+        if active_sampler is not None:
+            active_sampler.close()
+            collector.close()
+        gate_stats = change_gate.get_stats()
+        print(f"[SYSTEM] Change gate: {gate_stats['run']} inferences run, "
+              f"{gate_stats['saved']} saved ({gate_stats['saved_ratio']:.0%}).")
+        if ai_model is not None:
+            latency = ai_model.get_latency_stats()
+            print(f"[SYSTEM] Model ({latency['backend']}): {latency['inferences']} inferences, "
+                  f"avg {latency['avg_ms']:.0f} ms.")
+            if latency['tiling'] != 'off':
+                print(f"[SYSTEM] Tiling ({latency['tiling']}): {latency['tiles']} tiles in "
+                      f"{latency['tile_passes']} batches, {latency['coarse_passes']} coarse passes.")
+        if ai_worker is not None:
+            worker_stats = ai_worker.get_stats()
+            print(f"[SYSTEM] Inference {'service' if ai_service else 'worker'}: {worker_stats['inferences']} inferences, "
+                  f"avg {worker_stats['avg_latency'] * 1000:.0f} ms, {worker_stats['restarts']} restarts.")
+            ai_worker.close()
+            frame_buffer.close()
+            web_frame_buffer.close()
         
+        correction_stats = corrector.get_stats()
+        print(f"[SYSTEM] Corrections: {correction_stats['applied']} applied of {correction_stats['decisions']} "
+              f"defects ({correction_stats['cooldown']} in cooldown), avg decision "
+              f"{correction_stats['avg_decide_us']:.0f} us, rules reloaded {correction_stats['reloads']} times.")
+        serial_stats = printer.get_stats()
+        if serial_stats is not None:
+            print(f"[SYSTEM] Printer serial: {serial_stats['completed']} commands, avg round trip "
+                  f"{serial_stats['avg_rtt_ms']:.0f} ms (max {serial_stats['max_rtt_ms']:.0f} ms), "
+                  f"{serial_stats['resends']} resends, {serial_stats['timeouts']} timeouts, "
+                  f"{serial_stats['status_polls']} fallback status polls (M105 / M114).")
+            print(f"[SYSTEM] Printer connection: {serial_stats['disconnects']} disconnects, "
+                  f"{serial_stats['failed_attempts']} failed connection attempts, reconnect avg "
+                  f"{serial_stats['avg_reconnect_s']:.1f}s (max {serial_stats['max_reconnect_s']:.1f}s), "
+                  f"{serial_stats['offline_rejected']} commands rejected while offline.")
+        progress = printer.get_progress()
+        if progress is not None:
+            print(f"[SYSTEM] G-code stream ({progress['state']}): layer {progress['layer']}/{progress['layers']}, "
+                  f"{progress['progress']:.0%} of {progress['file']}, {progress['lines']} lines "
+                  f"({progress['rejected']} rejected) in {progress['elapsed']:.0f}s.")
         printer.close()
         kinect.close()
         
@@ -233,4 +600,29 @@ def main():
         logger.log_system("Shutdown complete.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Live AI 3D Printer Monitor")
+    parser.add_argument('--replay', default=None,
+                        help="Replay a video file or raw archive directory instead of the Kinect")
+    parser.add_argument('--unthrottled', action='store_true',
+                        help="Replay frames as fast as they are consumed (benchmarking)")
+    parser.add_argument('--ai-process', action='store_true',
+                        help="Run YOLO in a separate, auto-restarting process")
+    parser.add_argument('--backend', default='torch', choices=INFERENCE_BACKENDS,
+                        help="Inference backend (onnx/openvino need an exported model)")
+    parser.add_argument('--tiling', default='off', choices=TILING_MODES,
+                        help="Full-resolution tiled inference over the ROI")
+    parser.add_argument('--ai-service', default=None, metavar='HOST:PORT',
+                        help="Use a shared inference_service.py instead of loading the model")
+    parser.add_argument('--printer-id', default='printer1',
+                        help="Name of this printer on the shared inference service")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Low baseline AI rate, escalated while a defect is suspected")
+    parser.add_argument('--active-learning', action='store_true',
+                        help="Save frames the model is unsure about (with pre-labels) for labeling")
+    parser.add_argument('--gcode', default=None, metavar='FILE',
+                        help="Print this G-code file from the host (tracks the current layer)")
+    args = parser.parse_args()
+    main(replay=args.replay, realtime=not args.unthrottled, ai_process=args.ai_process,
+         backend=args.backend, tiling=args.tiling, ai_service=args.ai_service,
+         printer_id=args.printer_id, adaptive=args.adaptive, active_learning=args.active_learning,
+         gcode=args.gcode)
\ No newline at end of file
@@ -0,0 +1,257 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: model_swap.py
+PURPOSE: Zero-downtime model deployment and rollback for a running monitor.
+Based on: SECTION 4: LIVE AI MODEL STRUCTURE (Live AI Training Structure)
+================================================================================
+
+A new model is loaded and warmed up on a background thread while the old one
+keeps analyzing frames. It is then checked against a small golden frame set
+and only swapped in if it is at least as good as the running model. The
+swap itself is a handful of attribute assignments under the model's
+inference lock, so it lands between two frames.
+
+The previous model stays loaded, so a rollback is instant. Both can be
+triggered from the dashboard or through the watched models directory:
+  - a new .pt file appearing in models/ (e.g. from AITrainer) is deployed
+  - creating an empty file named ROLLBACK in models/ rolls back
+
+Golden frame set (optional but recommended):
+  golden_frames/*.jpg|png   - a few frames from past prints
+  golden_frames/labels.json - {"frame1.jpg": ["spaghetti"], "frame2.jpg": []}
+                              (expected defect types; [] = clean frame)
+"""
+
+import os
+import copy
+import json
+import glob
+import time
+import threading
+import cv2
+
+from ai_model import LiveAIModel, resolve_backend_path
+
+ROLLBACK_FILE = 'ROLLBACK'
+
+
+class LiveModelSwapper:
+    """
+    Owns hot swaps of one in-process LiveAIModel.
+    Inference never stops: loading, warm-up and validation all run on the
+    swap thread, and a rejected candidate is simply dropped.
+    """
+    def __init__(self, model, roi=None, watch_dir='models/', golden_dir='golden_frames/',
+                 poll_interval=5.0, max_latency_ratio=2.0, history=2, on_status=None):
+        self.model = model
+        # Own copy: polygon regions crop into a shared buffer, and warm-up /
+        # validation run while the AI thread crops through the live ROIMask
+        self.roi = copy.deepcopy(roi)
+        self.watch_dir = watch_dir
+        self.golden_dir = golden_dir
+        self.poll_interval = poll_interval
+        self.max_latency_ratio = max_latency_ratio
+        self.max_history = history
+        self.on_status = on_status      # callback(status_dict), e.g. dashboard broadcast
+
+        self.history = []               # previous model states, newest last
+        self.state = 'idle'
+        self.message = f"Running {model.model_path}"
+        self.last_report = None
+        self._golden = None             # [(name, frame, expected types or None)]
+        self._reference = None          # golden results of the running model
+        self._swap_thread = None
+        self._lock = threading.Lock()
+        self._seen = set()
+        self.running = False
+        self.watch_thread = None
+
+    # --- Swap / rollback ---
+
+    def request_swap(self, path):
+        """Start loading `path` in the background. False if a swap is already running."""
+        with self._lock:
+            if self._swap_thread is not None and self._swap_thread.is_alive():
+                print(f"[SWAP] Swap already in progress; ignoring {path}")
+                return False
+            self._swap_thread = threading.Thread(target=self._swap, args=(path,), daemon=True,
+                                                 name="ModelSwap")
+            self._swap_thread.start()
+            return True
+
+    def _swap(self, path):
+        start = time.perf_counter()
+        try:
+            self._set_status('loading', f"Loading {path}")
+            candidate = LiveAIModel(model_path=path, backend=self.model.backend)
+            candidate.enable_tiling(self.model.tiling_mode, self.model.tile_size, self.model.tile_overlap,
+                                    self.model.suspect_threshold, self.model.tile_margin)
+            candidate.warmup(self.roi)
+            candidate.set_current_layer(self.model.current_layer)
+
+            self._set_status('validating', f"Validating {path} on golden frames")
+            ok, report = self.validate(candidate)
+            self.last_report = report
+            if not ok:
+                self._set_status('rejected', f"Rejected {path}: {report['reason']}")
+                return
+
+            previous = self.model.swap_from(candidate)
+            self.history.append(previous)
+            del self.history[:-self.max_history]
+            self._reference = report['candidate']
+            self._set_status('swapped', f"Now running {path} "
+                                        f"(swap took {time.perf_counter() - start:.1f}s, no frames missed)")
+        except Exception as e:
+            self._set_status('failed', f"Could not load {path}: {e}")
+
+    def rollback(self):
+        """Switch back to the previous model (already loaded, so instant)."""
+        if not self.history:
+            self._set_status(self.state, "Nothing to roll back to.")
+            return False
+        state = self.history.pop()
+        current = self.model.model_path
+        self.model.set_state(state)
+        self._reference = None
+        self._set_status('rolled_back', f"Rolled back {current} -> {self.model.model_path}")
+        return True
+
+    # --- Golden frame validation ---
+
+    def _load_golden(self):
+        if self._golden is not None:
+            return self._golden
+        labels = {}
+        labels_path = os.path.join(self.golden_dir, 'labels.json')
+        if os.path.exists(labels_path):
+            with open(labels_path, 'r') as f:
+                labels = json.load(f)
+        self._golden = []
+        for path in sorted(glob.glob(os.path.join(self.golden_dir, '*.jpg')) +
+                           glob.glob(os.path.join(self.golden_dir, '*.png'))):
+            frame = cv2.imread(path)
+            if frame is not None:
+                name = os.path.basename(path)
+                self._golden.append((name, frame, labels.get(name)))
+        print(f"[SWAP] {len(self._golden)} golden frame(s) in {self.golden_dir}")
+        return self._golden
+
+    def _evaluate(self, model):
+        """Run a model over the golden set: hits, misses, false alarms, latency."""
+        hits = misses = false_alarms = 0
+        latency = 0.0
+        for name, frame, expected in self._load_golden():
+            start = time.perf_counter()
+            detections = model.detect_live(frame, self.roi)
+            latency += time.perf_counter() - start
+            if detections is None:
+                raise RuntimeError(f"inference failed on golden frame {name}")
+            found = {str(model.class_to_defect[c]) for c in detections['class_id']}
+            if expected is None:
+                continue
+            hits += len(found & set(expected))
+            misses += len(set(expected) - found)
+            false_alarms += len(found - set(expected))
+        count = max(1, len(self._golden))
+        return {'hits': hits, 'misses': misses, 'false_alarms': false_alarms,
+                'avg_ms': 1000.0 * latency / count}
+
+    def validate(self, candidate):
+        """
+        Compare the candidate with the running model on the golden frames.
+        Returns (ok, report). The candidate must find at least as many of
+        the expected defects, raise no more false alarms, and stay within
+        max_latency_ratio of the running model's latency.
+        """
+        if not self._load_golden():
+            print(f"[SWAP] WARNING: no golden frames in {self.golden_dir}; only the warm-up was checked.")
+            return True, {'reason': 'no golden frames', 'candidate': None, 'current': None}
+
+        report = {'candidate': self._evaluate(candidate)}
+        if self._reference is None:
+            # A detached copy: same weights and inference lock, but its golden
+            # frame results never land in the live model's last_uncertain
+            self._reference = self._evaluate(self.model.detached())
+        report['current'] = current = self._reference
+        cand = report['candidate']
+
+        if cand['hits'] < current['hits']:
+            report['reason'] = f"finds fewer golden defects ({cand['hits']} < {current['hits']})"
+        elif cand['false_alarms'] > current['false_alarms']:
+            report['reason'] = f"more false alarms ({cand['false_alarms']} > {current['false_alarms']})"
+        elif current['avg_ms'] > 0 and cand['avg_ms'] > self.max_latency_ratio * current['avg_ms']:
+            report['reason'] = f"too slow ({cand['avg_ms']:.0f} ms vs {current['avg_ms']:.0f} ms)"
+        else:
+            report['reason'] = 'ok'
+            return True, report
+        return False, report
+
+    # --- Watched models directory ---
+
+    def start_watching(self):
+        """Poll watch_dir for new models and the ROLLBACK trigger file."""
+        if not self.watch_dir:
+            return
+        os.makedirs(self.watch_dir, exist_ok=True)
+        # Models already there when we start are not deployed
+        self._seen = set(self._candidates())
+        self.running = True
+        self.watch_thread = threading.Thread(target=self._watch_loop, daemon=True, name="ModelWatch")
+        self.watch_thread.start()
+        print(f"[SWAP] Watching {self.watch_dir} for new models (touch {ROLLBACK_FILE} there to roll back).")
+
+    def _candidates(self):
+        if self.model.backend == 'openvino':
+            return glob.glob(os.path.join(self.watch_dir, '*_openvino_model'))
+        ext = '.onnx' if self.model.backend == 'onnx' else '.pt'
+        return glob.glob(os.path.join(self.watch_dir, '*' + ext))
+
+    def _watch_loop(self):
+        pending = {}    # path -> last seen size, until the file stops growing
+        while self.running:
+            rollback_path = os.path.join(self.watch_dir, ROLLBACK_FILE)
+            if os.path.exists(rollback_path):
+                try:
+                    os.remove(rollback_path)
+                except OSError:
+                    pass
+                self.rollback()
+
+            for path in self._candidates():
+                if path in self._seen:
+                    continue
+                size = os.path.getsize(path)
+                if pending.get(path) == size:
+                    # Finished copying
+                    self._seen.add(path)
+                    del pending[path]
+                    self.request_swap(resolve_backend_path(path, self.model.backend) or path)
+                else:
+                    pending[path] = size
+            time.sleep(self.poll_interval)
+
+    def stop(self):
+        self.running = False
+
+    # --- Status ---
+
+    def _set_status(self, state, message):
+        self.state = state
+        self.message = message
+        print(f"[SWAP] {message}")
+        if self.on_status is not None:
+            try:
+                self.on_status(self.get_status())
+            except Exception as e:
+                print(f"[SWAP] Status callback failed: {e}")
+
+    def get_status(self):
+        return {
+            'state': self.state,
+            'message': self.message,
+            'active': self.model.model_path,
+            'previous': [state['model_path'] for state in self.history],
+            'can_rollback': bool(self.history)
+        }
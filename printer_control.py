@@ -10,11 +10,18 @@ Based on: SECTION 3: LIVE PRINTER CONTROL STRUCTURE
 import serial
 import time
 import re
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from serial_transport import LiveSerialTransport, PrinterCommandError, PrinterDisconnected, PRIORITY_NORMAL
+from gcode_stream import LiveGcodeStreamer
 
 # Critical G-code Command Reference
 COMMANDS = {
     'emergency_stop': 'M112',
     'get_temp': 'M105',
+    'get_position': 'M114',
     'set_hotend_temp': 'M104 S{}', # S{temp}
     'set_bed_temp': 'M140 S{}', # S{temp}
     'adjust_speed': 'M220 S{}', # S{percentage}
@@ -24,85 +31,404 @@ COMMANDS = {
     'resume_print': 'M24',
     'home_all': 'G28',
     'move_to': 'G1 X{} Y{} Z{} F{}', # X, Y, Z, F{speed}
-    'show_message': 'M117 {}' # {message}
+    'show_message': 'M117 {}', # {message}
+    'auto_report_temp': 'M155 S{}', # S{seconds}, 0 = off
+    'auto_report_position': 'M154 S{}' # S{seconds} (Marlin 2.1+, ignored elsewhere)
 }
 
+# Connection states (LivePrinterControl.connection_state)
+CONNECTION_STATES = ('disconnected', 'connecting', 'connected', 'backoff', 'closed')
+# What send_async does while disconnected: fail the command at once, or queue it for the reconnect
+OFFLINE_POLICIES = ('fail', 'queue')
+
+# Serial counters carried over from one connection's transport to the next
+_TRANSPORT_COUNTERS = ('sent', 'completed', 'resends', 'errors', 'timeouts', 'total_rtt')
+
+# Regex to parse: "ok T:205.1 /210.0 B:60.2 /70.0" and auto-reports " T:205.1 /210.0 B:60.2 /70.0 @:0 B@:0"
+TEMP_REGEX = re.compile(r"T:(\d+\.?\d*)\s?/(\d+\.?\d*)\s+B:(\d+\.?\d*)\s?/(\d+\.?\d*)")
+# Regex to parse: "X:10.00 Y:20.00 Z:0.30 E:0.00 Count X:..." (M114 / M154 auto-report)
+POSITION_REGEX = re.compile(r"^X:(-?\d+\.?\d*)\s+Y:(-?\d+\.?\d*)\s+Z:(-?\d+\.?\d*)\s+E:(-?\d+\.?\d*)")
+
+def _copy_future(source, target):
+    """Resolve `target` the way `source` was resolved."""
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+class LivePrinterState:
+    """
+    Latest known printer state, fed by every line the printer sends.
+    Writers publish a new dict; snapshot() hands out the current one
+    (O(1), never touches the serial port). Treat snapshots as read-only.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {
+            'hotend': None, 'hotend_target': None, 'bed': None, 'bed_target': None,
+            'x': None, 'y': None, 'z': None, 'e': None,
+            'busy': False,
+            'temp_time': 0.0, 'position_time': 0.0, 'busy_time': 0.0
+        }
+    
+    def snapshot(self):
+        return self._state
+    
+    def update(self, **values):
+        with self._lock:
+            state = dict(self._state)
+            state.update(values)
+            self._state = state
+    
+    def handle_line(self, line):
+        """Parse one received line (temperature report, position report, busy)."""
+        now = time.time()
+        match = TEMP_REGEX.search(line)
+        if match:
+            try:
+                self.update(hotend=float(match.group(1)), hotend_target=float(match.group(2)),
+                            bed=float(match.group(3)), bed_target=float(match.group(4)),
+                            temp_time=now)
+            except ValueError:
+                print(f"[PRINTER] Error parsing temp report: {line}")
+            return
+        match = POSITION_REGEX.match(line)
+        if match:
+            x, y, z, e = (float(v) for v in match.groups())
+            self.update(x=x, y=y, z=z, e=e, position_time=now)
+            return
+        if 'busy:' in line:
+            self.update(busy=True, busy_time=now)
+        elif line.startswith('ok') and self._state['busy']:
+            self.update(busy=False)
+    
+    def temps(self, max_age=None):
+        """Temperature dict like get_live_temp, or None if unknown / older than max_age seconds."""
+        state = self._state
+        if state['hotend'] is None or (max_age is not None and time.time() - state['temp_time'] > max_age):
+            return None
+        return {
+            'hotend': state['hotend'],
+            'hotend_target': state['hotend_target'],
+            'bed': state['bed'],
+            'bed_target': state['bed_target']
+        }
+    
+    def toolhead(self, max_age=None):
+        """Toolhead (x, y) in mm, or None if unknown / older than max_age seconds."""
+        state = self._state
+        if state['x'] is None or (max_age is not None and time.time() - state['position_time'] > max_age):
+            return None
+        return state['x'], state['y']
+
 class LivePrinterControl:
     """
     Handles serial connection, G-code sending, and response parsing.
     Includes auto-reconnect logic.
     Based on: Live Printer Serial Pattern
+    
+    The connection is owned by a background supervisor thread: it
+    connects, notices a lost link, and retries with exponential backoff
+    (backoff_initial doubling up to backoff_max, with jitter), moving
+    through CONNECTION_STATES. No caller ever waits for a reconnect.
+    While disconnected, commands fail at once (offline_policy='fail') or
+    are held, up to offline_queue commands and offline_max_age seconds,
+    and sent after the reconnect ('queue'). on_connection(state) is
+    called on every state change.
+    
+    All traffic goes through a LiveSerialTransport (see serial_transport.py):
+    send_live still blocks its caller until the 'ok', but only its caller;
+    send_async returns a future, and emergency_stop_live writes M112
+    immediately, whatever else is queued or waiting for an answer.
+    
+    Temperatures (and position, where supported) are pushed by the
+    firmware every report_interval seconds (M155 / M154) and parsed into
+    self.state in the background; get_live_temp and get_state read that
+    cache. If reports stop or the firmware lacks M155, a background M105
+    poll keeps the cache fresh instead.
+    
+    stream_file prints a G-code file from the host (see gcode_stream.py);
+    while it runs, pause_live / resume_live hold and release the stream.
     """
-    def __init__(self, port='COM3', baud=115200):
+    def __init__(self, port='COM3', baud=115200, boot_timeout=2.0, command_timeout=10.0,
+                 report_interval=1, max_in_flight=1, offline_policy='fail', offline_queue=32,
+                 offline_max_age=10.0, backoff_initial=0.5, backoff_max=30.0, connect_wait=None,
+                 on_connection=None):
+        if offline_policy not in OFFLINE_POLICIES:
+            raise ValueError(f"offline_policy must be one of {OFFLINE_POLICIES}, not {offline_policy!r}")
         self.port = port
         self.baud = baud
+        self.boot_timeout = boot_timeout # Max wait for the firmware after opening the port
+        self.command_timeout = command_timeout # Max wait for an 'ok' (extended while the printer reports busy)
         self.ser = None
-        # Regex to parse: "ok T:205.1 /210.0 B:60.2 /70.0"
-        self.temp_regex = re.compile(r"T:(\d+\.?\d*)\s?/(\d+\.?\d*)\s+B:(\d+\.?\d*)\s?/(\d+\.?\d*)")
-        self.connect_live()
+        self.transport = None
+        self.temp_regex = TEMP_REGEX
+        self.report_interval = report_interval
+        self.max_in_flight = max_in_flight # Commands awaiting 'ok' at once (up to the firmware's BUFSIZE)
+        self.state = LivePrinterState()
+        self.streamer = None
+        self.polls = 0
+        
+        # --- Connection supervisor ---
+        self.offline_policy = offline_policy
+        self.offline_queue = offline_queue
+        self.offline_max_age = offline_max_age
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.on_connection = on_connection
+        self.connection_state = 'disconnected'
+        self.disconnected_at = time.time()
+        self._connected = threading.Event()
+        self._wake = threading.Event()
+        self._offline = deque() # (gcode, priority, future, queued_at)
+        self._offline_lock = threading.Lock()
+        self._serial_totals = dict.fromkeys(_TRANSPORT_COUNTERS, 0)
+        self._serial_totals['max_rtt'] = 0.0
+        self.conn_stats = {'connects': 0, 'disconnects': 0, 'failed_attempts': 0,
+                           'offline_rejected': 0, 'offline_queued': 0, 'offline_expired': 0,
+                           'offline_dropped': 0}
+        self.reconnect_times = [] # disconnect -> connected, seconds
+        
+        self.running = True
+        self.supervisor_thread = threading.Thread(target=self._supervise_loop, daemon=True,
+                                                  name="PrinterSupervisor")
+        self.supervisor_thread.start()
+        # Give the first connection time for the board reset, but never hold up startup
+        connect_wait = boot_timeout + 1.0 if connect_wait is None else connect_wait
+        if not self.wait_connected(connect_wait):
+            print(f"[PRINTER] No printer on {self.port} yet; continuing and reconnecting in the background.")
+        self.telemetry_thread = threading.Thread(target=self._telemetry_loop, daemon=True, name="PrinterTelemetry")
+        self.telemetry_thread.start()
     
     def connect_live(self):
         """
-        Attempt to connect to the printer.
-        Includes auto-retry logic.
+        One attempt to connect to the printer (the supervisor does the
+        retrying). Returns True once connected.
         """
         print(f"[PRINTER] Attempting to connect on {self.port} at {self.baud}...")
-        while True:
+        self._close_port()
+        try:
+            self.ser = serial.Serial(self.port, self.baud, timeout=2)
+            response = self._wait_for_boot()
+            transport = LiveSerialTransport(self.ser, max_in_flight=self.max_in_flight,
+                                            timeout=self.command_timeout, on_disconnect=self._on_disconnect)
+            transport.add_listener(self.state.handle_line)
+            transport.start()
+            self.transport = transport
+        except (serial.SerialException, OSError) as e:
+            print(f"[PRINTER] Connection failed: {e}")
+            self._close_port()
+            return False
+        print(f"[PRINTER] Connection established. Initial response: {response}")
+        self._enable_auto_report()
+        return True
+    
+    # --- Connection supervisor ---
+    
+    def _supervise_loop(self):
+        delay = self.backoff_initial
+        while self.running:
+            if self.connection_state == 'connected':
+                # Woken by _on_disconnect or close(); the timeout is a backstop
+                if self._wake.wait(1.0):
+                    self._wake.clear()
+                if self.transport is None or not self.transport.connected:
+                    self._link_lost("transport stopped")
+                continue
+            
+            self._wake.clear()
+            self._set_connection_state('connecting')
+            if self.connect_live():
+                if not self.running:
+                    break
+                downtime = time.time() - self.disconnected_at
+                self.conn_stats['connects'] += 1
+                if self.conn_stats['connects'] > 1:
+                    self.reconnect_times.append(downtime)
+                    print(f"[PRINTER] Reconnected after {downtime:.1f}s.")
+                delay = self.backoff_initial
+                self._connected.set()
+                self._set_connection_state('connected')
+                self._flush_offline()
+                continue
+            
+            self.conn_stats['failed_attempts'] += 1
+            wait = delay * random.uniform(0.8, 1.2)
+            delay = min(delay * 2, self.backoff_max)
+            self._set_connection_state('backoff', f"retrying in {wait:.1f}s")
+            self._wake.wait(wait)
+    
+    def _on_disconnect(self, error):
+        """Called by the transport (reader or writer thread) when the port fails."""
+        self._link_lost(error)
+    
+    def _link_lost(self, reason):
+        if self.connection_state != 'connected':
+            return
+        self._connected.clear()
+        self.disconnected_at = time.time()
+        self.conn_stats['disconnects'] += 1
+        self._set_connection_state('disconnected', str(reason))
+        self._wake.set()
+    
+    def _set_connection_state(self, state, detail=None):
+        self.connection_state = state
+        print(f"[PRINTER] Connection: {state}" + (f" ({detail})" if detail else ""))
+        if self.on_connection is not None:
             try:
-                self.ser = serial.Serial(self.port, self.baud, timeout=2)
-                time.sleep(2)  # Wait for bootloader
-                response = self.ser.readline().decode().strip()
-                print(f"[PRINTER] Connection established. Initial response: {response}")
-                return
-            except serial.SerialException as e:
-                print(f"[PRINTER] Connection failed: {e}. Retrying in 5s...")
-                time.sleep(5)
-    
-    def send_live(self, gcode):
+                self.on_connection(state)
+            except Exception as e:
+                print(f"[PRINTER] Connection callback failed: {e}")
+    
+    def wait_connected(self, timeout=None):
+        """Block until connected (or timeout). Returns True if connected."""
+        return self._connected.wait(timeout)
+    
+    @property
+    def connected(self):
+        return self.connection_state == 'connected'
+    
+    # --- Commands while disconnected ---
+    
+    def _offline_command(self, gcode, priority):
+        """Fail or hold a command sent while disconnected (see offline_policy)."""
+        future = Future()
+        if self.offline_policy == 'queue' and self.running:
+            with self._offline_lock:
+                if len(self._offline) >= self.offline_queue:
+                    dropped = self._offline.popleft()
+                    dropped[2].set_exception(PrinterDisconnected("offline queue full"))
+                    self.conn_stats['offline_dropped'] += 1
+                self._offline.append((gcode, priority, future, time.time()))
+                self.conn_stats['offline_queued'] += 1
+            if self.connected:
+                # Reconnected while we were queueing
+                self._flush_offline()
+            return future
+        self.conn_stats['offline_rejected'] += 1
+        future.set_exception(PrinterDisconnected(f"printer {self.connection_state}"))
+        return future
+    
+    def _flush_offline(self):
+        """Send what was queued while disconnected; drop commands that are too old to matter."""
+        with self._offline_lock:
+            pending, self._offline = self._offline, deque()
+        now = time.time()
+        for gcode, priority, future, queued_at in pending:
+            if now - queued_at > self.offline_max_age:
+                self.conn_stats['offline_expired'] += 1
+                future.set_exception(PrinterDisconnected(
+                    f"'{gcode}' waited {now - queued_at:.0f}s for the printer; dropped"))
+                continue
+            self.transport.send(gcode, priority=priority).add_done_callback(
+                lambda sent, future=future: _copy_future(sent, future))
+        if pending:
+            print(f"[PRINTER] Sent {len(pending)} command(s) queued while disconnected.")
+    
+    def _wait_for_boot(self):
+        """
+        Opening the port resets most boards. Instead of a fixed 2 s sleep,
+        return as soon as the firmware's greeting has arrived and gone quiet,
+        or after boot_timeout (boards without auto-reset say nothing).
+        """
+        deadline = time.time() + self.boot_timeout
+        first_line = ""
+        last_data = None
+        while time.time() < deadline:
+            if self.ser.in_waiting:
+                line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+                if line and not first_line:
+                    first_line = line
+                last_data = time.time()
+            elif last_data is not None and time.time() - last_data > 0.2:
+                break
+            else:
+                time.sleep(0.02)
+        return first_line
+    
+    def _ensure_connected(self):
+        """True if the link is up. Never blocks: reconnecting is the supervisor's job."""
+        return self.connected and self.transport is not None and self.transport.connected
+    
+    def send_async(self, gcode, priority=PRIORITY_NORMAL):
+        """
+        Queue a G-code command without waiting. Returns a Future whose
+        result is the response text (raises PrinterCommandError on a
+        firmware error, PrinterDisconnected if the printer is offline).
+        M112 always takes the emergency lane.
+        """
+        if gcode.split(';', 1)[0].strip().upper() == COMMANDS['emergency_stop']:
+            self.emergency_stop_live()
+            return None
+        if not self._ensure_connected():
+            return self._offline_command(gcode, priority)
+        # print(f"[PRINTER SEND] G-code: {gcode}") # Uncomment for verbose logging
+        return self.transport.send(gcode, priority=priority)
+    
+    def send_live(self, gcode, priority=PRIORITY_NORMAL):
         """
         Send a G-code command and wait for 'ok' response.
-        Includes error recovery.
+        Returns the response text, or None on error / timeout.
+        Returns None at once while disconnected (a queued command is still
+        sent after the reconnect, but nobody waits for it).
         """
-        if self.ser is None or not self.ser.is_open:
-            print("[PRINTER] Connection lost, attempting to reconnect...")
-            self.connect_live()
-            if self.ser is None: # Still failed
-                print("[PRINTER] Reconnect failed. Command skipped.")
-                return None
-
+        future = self.send_async(gcode, priority)
+        if future is None:
+            return None
+        if not future.done() and not self.connected:
+            print(f"[PRINTER] Printer offline; '{gcode}' queued for the reconnect.")
+            return None
         try:
-            # print(f"[PRINTER SEND] G-code: {gcode}") # Uncomment for verbose logging
-            self.ser.write(gcode.encode() + b'\n')
-            
-            # Read lines until 'ok' or error
-            response_buffer = ""
-            while True:
-                response = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                if not response:
-                    continue # Skip empty lines (timeout)
-                
-                # print(f"[PRINTER RECV] {response}") # Uncomment for verbose logging
-                response_buffer += response + "\n" # Store for parsing
-                
-                if 'ok' in response:
-                    return response_buffer # Command successful
-                if 'error' in response.lower() or 'unknown command' in response.lower():
-                    print(f"[PRINTER ERROR] Printer reported error for command: {gcode}")
-                    return None
-                    
-        except serial.SerialException as e:
-            print(f"[PRINTER] SerialException: {e}. Reconnecting...")
-            self.connect_live()
+            # The transport times the command out itself; this is a backstop
+            return future.result(timeout=self.command_timeout * 6)
+        except PrinterCommandError as e:
+            print(f"[PRINTER ERROR] Printer reported error for command: {gcode} ({e})")
+            return None
+        except PrinterDisconnected as e:
+            print(f"[PRINTER] Connection lost during '{gcode}': {e}")
+            return None
+        except (TimeoutError, FutureTimeout):
+            print(f"[PRINTER] No response to '{gcode}'.")
             return None
         except Exception as e:
             print(f"[PRINTER] Unexpected error in send_live: {e}")
             return None
 
-    def get_live_temp(self):
+    def _enable_auto_report(self):
+        """Ask the firmware to push temperatures (and position) on its own."""
+        self.transport.send(COMMANDS['auto_report_temp'].format(self.report_interval))
+        self.transport.send(COMMANDS['auto_report_position'].format(self.report_interval))
+    
+    def _telemetry_loop(self):
+        """Fallback: poll M105 / M114 whenever auto-reports are missing or late."""
+        while self.running:
+            time.sleep(self.report_interval)
+            if self.transport is None or not self.transport.connected:
+                continue
+            state = self.state.snapshot()
+            now = time.time()
+            for command, field in (('get_temp', 'temp_time'), ('get_position', 'position_time')):
+                if now - state[field] > 2.5 * self.report_interval:
+                    # Fire and forget: the reply is parsed by the state listener
+                    self.transport.send(COMMANDS[command])
+                    self.polls += 1
+    
+    def get_state(self):
+        """Latest printer state snapshot (temperatures, position, busy). No serial I/O."""
+        return self.state.snapshot()
+    
+    def get_live_temp(self, max_age=None):
         """
-        Get current temperatures by sending M105.
+        Get current temperatures from the auto-reported cache.
+        Only sends a (blocking) M105 if nothing was received within
+        max_age seconds (default: 3 report intervals).
         Returns: dict {'hotend': float, ...} or None
         """
+        max_age = 3.0 * self.report_interval if max_age is None else max_age
+        temps = self.state.temps(max_age)
+        if temps is not None:
+            return temps
+        
         resp = self.send_live(COMMANDS['get_temp'])
         
         if resp:
@@ -128,7 +454,19 @@ class LivePrinterControl:
     def emergency_stop_live(self):
         """Immediate stop - bypasses everything"""
         print("[PRINTER] EMERGENCY STOP (M112) TRIGGERED!")
-        self.send_live(COMMANDS['emergency_stop'])
+        if self.streamer is not None:
+            self.streamer.stop() # Just a flag: no further lines after the M112
+        try:
+            if self.transport is not None and self.transport.connected:
+                written = self.transport.emergency_stop()
+                print(f"[PRINTER] M112 written in {written * 1000:.1f} ms.")
+            elif self.ser is not None and self.ser.is_open:
+                # No transport (yet): write straight to the port
+                self.ser.write(b'M112\n')
+            else:
+                print("[PRINTER] FAILED TO SEND M112: printer is disconnected.")
+        except Exception as e:
+            print(f"[PRINTER] FAILED TO SEND M112: {e}")
     
     def set_temp_live(self, hotend=None, bed=None):
         """Dynamic temperature adjustment"""
@@ -143,16 +481,96 @@ class LivePrinterControl:
     
     def pause_live(self, reason="AI PAUSED"):
         """Pause print and show message on LCD"""
+        if self.is_streaming():
+            # Host print: M25 only pauses SD prints, so stop feeding lines instead
+            self.streamer.pause()
         self.send_live(COMMANDS['show_message'].format(reason.replace(" ", "_")))
-        self.send_live(COMMANDS['pause_print'])
+        if not self.is_streaming():
+            self.send_live(COMMANDS['pause_print'])
     
     def resume_live(self):
         """Resume from pause"""
         self.send_live(COMMANDS['show_message'].format("AI RESUMED"))
-        self.send_live(COMMANDS['resume_print'])
+        if self.is_streaming():
+            self.streamer.resume()
+        else:
+            self.send_live(COMMANDS['resume_print'])
+    
+    # --- Host streaming ---
+    
+    def stream_file(self, path, window=4, on_layer=None):
+        """
+        Print a G-code file from the host. Returns the running
+        LiveGcodeStreamer; on_layer(info) is called at every layer change.
+        """
+        if self.is_streaming():
+            print(f"[PRINTER] Already streaming {self.streamer.path}; ignoring {path}.")
+            return None
+        if not self._ensure_connected():
+            print("[PRINTER] Not connected. Cannot stream.")
+            return None
+        self.streamer = LiveGcodeStreamer(self, path, window=window, on_layer=on_layer)
+        return self.streamer.start()
+    
+    def is_streaming(self):
+        return self.streamer is not None and self.streamer.active
+    
+    def get_progress(self):
+        """Layer and progress of the host print, or None if nothing was streamed."""
+        if self.streamer is None:
+            return None
+        return self.streamer.get_progress()
         
+    def get_stats(self):
+        """Serial counters over all connections so far, plus connection / reconnect stats."""
+        totals = dict(self._serial_totals)
+        transport = self.transport
+        if transport is not None:
+            stats = transport.get_stats()
+            for key in _TRANSPORT_COUNTERS:
+                totals[key] += getattr(transport, key)
+            totals['max_rtt'] = max(totals['max_rtt'], transport.max_rtt)
+        else:
+            stats = {'queued': 0, 'in_flight': 0, 'estop_write_ms': None}
+        stats.update({key: totals[key] for key in _TRANSPORT_COUNTERS if key != 'total_rtt'})
+        stats['avg_rtt_ms'] = 1000.0 * totals['total_rtt'] / totals['completed'] if totals['completed'] else 0.0
+        stats['max_rtt_ms'] = 1000.0 * totals['max_rtt']
+        stats['status_polls'] = self.polls
+        stats['connection'] = self.connection_state
+        stats.update(self.conn_stats)
+        stats['offline_pending'] = len(self._offline)
+        stats['avg_reconnect_s'] = (sum(self.reconnect_times) / len(self.reconnect_times)
+                                    if self.reconnect_times else 0.0)
+        stats['max_reconnect_s'] = max(self.reconnect_times, default=0.0)
+        return stats
+    
+    def _close_port(self):
+        transport, self.transport = self.transport, None
+        if transport is not None:
+            transport.close()
+            for key in _TRANSPORT_COUNTERS:
+                self._serial_totals[key] += getattr(transport, key)
+            self._serial_totals['max_rtt'] = max(self._serial_totals['max_rtt'], transport.max_rtt)
+        if self.ser is not None and self.ser.is_open:
+            try:
+                self.ser.close()
+            except (serial.SerialException, OSError):
+                pass
+    
     def close(self):
         """Safely close the serial connection."""
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        self.running = False
+        if self.streamer is not None:
+            self.streamer.stop()
+        self._wake.set()
+        self.supervisor_thread.join(timeout=self.boot_timeout + 3.0)
+        was_open = self.ser is not None and self.ser.is_open
+        self._close_port()
+        self._connected.clear()
+        with self._offline_lock:
+            pending, self._offline = self._offline, deque()
+        for _, _, future, _ in pending:
+            future.set_exception(PrinterDisconnected("printer control closed"))
+        self._set_connection_state('closed')
+        if was_open:
             print("[PRINTER] Serial connection closed.")
\ No newline at end of file
@@ -0,0 +1,557 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: printer_emulator.py
+PURPOSE: Virtual Marlin printer on a pseudo-terminal, for tests and benchmarks.
+Based on: SECTION 3: LIVE PRINTER CONTROL STRUCTURE
+================================================================================
+
+LiveVirtualPrinter opens a pty (Linux / macOS) and answers on it like a
+Marlin board, so LivePrinterControl(port=printer.port) runs unchanged
+without hardware:
+  - Marlin's host protocol: "N<line> <gcode>*<checksum>" is checked, bad
+    lines get "Error:... / Resend: N / ok", and M110 resets the numbering.
+  - The G-code in printer_control.COMMANDS plus what a host print needs
+    (G0/G1, G90/G91, G92, M82/M83, M109/M190, M114, M115, M400).
+  - Hotend and bed follow their targets with first-order thermal lag;
+    M109/M190 block with busy keepalives until the target is reached.
+  - M155 / M154 temperature and position auto-reports.
+  - M112 is caught on arrival, like Marlin's emergency parser, even while
+    a long command is running. The printer then halts until reconnected.
+Faults to test against: per-command latency (+ jitter), line noise
+(corrupted bytes from the host), dropped "ok"s and disconnects (the pty
+goes away and comes back as a new one, like a USB re-enumeration). The
+port is a symlink that always points at the current pty, so reconnects
+find it again. `executed` lists every command the firmware accepted, in
+order (see tests/test_printer_emulator.py).
+
+Command line:
+  python printer_emulator.py serve --latency 0.005 --noise 0.001
+  python printer_emulator.py bench --commands 2000 --window 4
+"""
+
+import os
+import re
+import tty
+import math
+import time
+import random
+import select
+import argparse
+import tempfile
+import threading
+from collections import deque
+
+BUSY_INTERVAL = 2.0         # Marlin's HOST_KEEPALIVE_INTERVAL
+TEMP_WINDOW = 1.0           # M109 / M190 return within this many degrees of the target
+
+_NUMBERED_REGEX = re.compile(r"^N(-?\d+)\s*(.*?)\*(\d+)\s*$")
+_PARAM_REGEX = re.compile(r"([A-Z])\s*(-?\d*\.?\d*)")
+_ESTOP_REGEX = re.compile(r"^(?:N\d+\s*)?M112(?![0-9])")
+
+
+def _checksum(text):
+    cs = 0
+    for byte in text.encode(errors='ignore'):
+        cs ^= byte
+    return cs
+
+
+class _PtySession:
+    """One "USB connection": a pty pair and the thread reading from it."""
+    def __init__(self):
+        self.master, self.slave = os.openpty()
+        # Raw, no echo: otherwise our own output would come back as input
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        self.closed = False
+        self.reader = None
+
+    def close(self):
+        self.closed = True
+        if self.reader is not None and self.reader is not threading.current_thread():
+            self.reader.join(timeout=1.0)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class LiveVirtualPrinter:
+    """
+    A Marlin-like printer behind a pty. start() it, point
+    LivePrinterControl at `port`, close() it when done.
+    latency / jitter: seconds before each "ok" (uniform extra jitter).
+    noise: probability that a received line has a corrupted byte.
+    drop_ok: probability that a command's "ok" is never sent.
+    disconnect_every: seconds between simulated unplugs (None = never),
+    each lasting `downtime` seconds; disconnect() does one on demand.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, noise=0.0, drop_ok=0.0, disconnect_every=None,
+                 downtime=2.0, ambient=22.0, hotend_tau=8.0, bed_tau=40.0, temp_noise=0.2,
+                 homing_time=1.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.noise = noise
+        self.drop_ok = drop_ok
+        self.disconnect_every = disconnect_every
+        self.downtime = downtime
+        self.ambient = ambient
+        self.tau = {'hotend': hotend_tau, 'bed': bed_tau}
+        self.temp_noise = temp_noise
+        self.homing_time = homing_time
+        self._rng = random.Random(seed)
+
+        self._dir = tempfile.mkdtemp(prefix='virtual_printer_')
+        self.port = os.path.join(self._dir, 'ttyVIRTUAL0')
+        self.session = None
+        self.generation = 0
+        self.running = False
+        self.online = threading.Event()
+        self._write_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._commands = deque()
+        self._threads = []
+
+        self.temps = {'hotend': ambient, 'bed': ambient}
+        self.targets = {'hotend': 0.0, 'bed': 0.0}
+        self.log = deque(maxlen=10000)      # (perf_counter, line) of every line received
+        self.executed = deque(maxlen=10000) # G-code of every command accepted and run, in order
+        self.stats = {'lines': 0, 'commands': 0, 'corrupted': 0, 'line_errors': 0, 'dropped_oks': 0,
+                      'unknown': 0, 'disconnects': 0, 'estops': 0}
+        self.estop_at = None                # perf_counter() when the last M112 arrived
+        self._reset_firmware()
+
+    def _reset_firmware(self):
+        """State after a board reset (reconnect): temperatures keep their physical value."""
+        self.last_line = 0
+        self.halted = False
+        self.sd_paused = False
+        self.absolute = True
+        self.absolute_e = True
+        self.position = {'X': 0.0, 'Y': 0.0, 'Z': 0.0, 'E': 0.0}
+        self.feedrate_pct = 100
+        self.flow_pct = 100
+        self.fan = 0
+        self.message = ''
+        self.targets = {'hotend': 0.0, 'bed': 0.0}
+        self.temp_report_interval = 0.0
+        self.position_report_interval = 0.0
+        self._last_temp_report = 0.0
+        self._last_position_report = 0.0
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self.running = True
+        self._connect()
+        for target, name in ((self._execute_loop, "VirtualPrinterExec"),
+                             (self._physics_loop, "VirtualPrinterPhysics")):
+            thread = threading.Thread(target=target, daemon=True, name=name)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[EMULATOR] Virtual printer on {self.port} (latency {self.latency * 1000:.1f} ms, "
+              f"noise {self.noise:.2%}, dropped oks {self.drop_ok:.2%}).")
+        return self
+
+    def _connect(self):
+        session = _PtySession()
+        with self._cond:
+            self.session = session
+            self.generation += 1
+            self._commands.clear()
+            self._reset_firmware()
+        link = self.port + '.new'
+        os.symlink(session.name, link)
+        os.replace(link, self.port)
+        session.reader = threading.Thread(target=self._read_loop, args=(session, self.generation),
+                                          daemon=True, name="VirtualPrinterRead")
+        session.reader.start()
+        self.online.set()
+
+    def disconnect(self, downtime=None):
+        """Unplug: the host's port fails. Comes back as a new pty after `downtime` seconds."""
+        downtime = self.downtime if downtime is None else downtime
+        with self._cond:
+            session, self.session = self.session, None
+            self._commands.clear()
+        self.online.clear()
+        if session is None:
+            return
+        self.stats['disconnects'] += 1
+        try:
+            os.remove(self.port)
+        except OSError:
+            pass
+        session.close()
+        print(f"[EMULATOR] Disconnected; back in {downtime:.1f}s.")
+        if downtime is not None and downtime >= 0:
+            timer = threading.Timer(downtime, self._reconnect)
+            timer.daemon = True
+            timer.start()
+
+    def _reconnect(self):
+        if self.running and self.session is None:
+            self._connect()
+            print(f"[EMULATOR] Reconnected on {self.port}.")
+
+    def close(self):
+        self.running = False
+        with self._cond:
+            session, self.session = self.session, None
+            self._cond.notify_all()
+        if session is not None:
+            session.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        try:
+            os.remove(self.port)
+        except OSError:
+            pass
+        try:
+            os.rmdir(self._dir)
+        except OSError:
+            pass
+
+    # --- Wire ---
+
+    def _write(self, text, generation):
+        with self._write_lock:
+            session = self.session
+            if session is None or generation != self.generation:
+                return
+            try:
+                os.write(session.master, (text + '\n').encode())
+            except OSError:
+                pass
+
+    def _read_loop(self, session, generation):
+        pending = b''
+        while self.running and not session.closed:
+            ready, _, _ = select.select([session.master], [], [], 0.1)
+            if not ready or session.closed:
+                continue
+            try:
+                data = os.read(session.master, 4096)
+            except OSError:
+                return
+            pending += data
+            *lines, pending = pending.split(b'\n')
+            for raw in lines:
+                if self.noise and self._rng.random() < self.noise and len(raw) > 1:
+                    # Flip a bit in one byte, as a noisy USB cable would
+                    i = self._rng.randrange(len(raw) - 1)
+                    raw = raw[:i] + bytes([raw[i] ^ 0x04]) + raw[i + 1:]
+                    self.stats['corrupted'] += 1
+                line = raw.decode('ascii', errors='replace').strip()
+                if not line:
+                    continue
+                self.log.append((time.perf_counter(), line))
+                self.stats['lines'] += 1
+                if _ESTOP_REGEX.match(line):
+                    # Emergency parser: acted on before anything queued
+                    self._halt(generation)
+                    continue
+                with self._cond:
+                    self._commands.append((generation, line))
+                    self._cond.notify()
+
+    def _halt(self, generation):
+        self.estop_at = time.perf_counter()
+        self.stats['estops'] += 1
+        with self._cond:
+            self.halted = True
+            self.targets = {'hotend': 0.0, 'bed': 0.0}
+            self._commands.clear()
+        self._write("Error:Printer halted. kill() called!", generation)
+
+    # --- Command execution ---
+
+    def _execute_loop(self):
+        while self.running:
+            with self._cond:
+                while self.running and not self._commands:
+                    self._cond.wait(0.1)
+                if not self.running:
+                    return
+                generation, line = self._commands.popleft()
+            if self.halted or generation != self.generation:
+                continue    # killed firmware answers nothing until reset
+            self._handle(line, generation)
+
+    def _handle(self, line, generation):
+        match = _NUMBERED_REGEX.match(line)
+        if match:
+            number, gcode, cs = int(match.group(1)), match.group(2), int(match.group(3))
+            body = line[:line.rindex('*')]
+            if _checksum(body) != cs:
+                self._line_error(f"checksum mismatch, Last Line: {self.last_line}", generation)
+                return
+            if gcode.upper().startswith('M110'):
+                self.last_line = number
+            elif number != self.last_line + 1:
+                self._line_error(f"Line Number is not Last Line Number+1, Last Line: {self.last_line}",
+                                 generation)
+                return
+            else:
+                self.last_line = number
+        elif line.startswith('N'):
+            self._line_error(f"No Checksum with line number, Last Line: {self.last_line}", generation)
+            return
+        elif '*' in line:
+            self._line_error(f"No Line Number with checksum, Last Line: {self.last_line}", generation)
+            return
+        else:
+            gcode = line.split(';', 1)[0].strip()
+
+        self.stats['commands'] += 1
+        self.executed.append(gcode)
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        reply, ok_suffix = self._execute(gcode, generation)
+        if reply:
+            self._write(reply, generation)
+        if self.halted:
+            return
+        if self.drop_ok and self._rng.random() < self.drop_ok:
+            self.stats['dropped_oks'] += 1
+            return
+        self._write('ok' + ok_suffix, generation)
+
+    def _line_error(self, message, generation):
+        self.stats['line_errors'] += 1
+        self._write(f"Error:{message}\nResend: {self.last_line + 1}\nok", generation)
+
+    def _execute(self, gcode, generation):
+        """Run one command. Returns (lines to send before the ok, text appended to the ok)."""
+        if not gcode:
+            return None, ''
+        words = gcode.split(None, 1)
+        code = words[0].upper()
+        args = words[1] if len(words) > 1 else ''
+        params = {k: v for k, v in _PARAM_REGEX.findall(args.upper())}
+
+        def number(key, default=None):
+            value = params.get(key)
+            if value in (None, '', '-', '.'):
+                return default
+            return float(value)
+
+        if code in ('G0', 'G1'):
+            for axis in 'XYZ':
+                value = number(axis)
+                if value is not None:
+                    self.position[axis] = value if self.absolute else self.position[axis] + value
+            value = number('E')
+            if value is not None:
+                relative = not self.absolute or not self.absolute_e
+                self.position['E'] = self.position['E'] + value if relative else value
+        elif code == 'G28':
+            self._busy(self.homing_time, generation)
+            for axis in 'XYZ':
+                self.position[axis] = 0.0
+        elif code == 'G90':
+            self.absolute = self.absolute_e = True
+        elif code == 'G91':
+            self.absolute = False
+        elif code == 'M82':
+            self.absolute_e = True
+        elif code == 'M83':
+            self.absolute_e = False
+        elif code == 'G92':
+            if not params:
+                params = dict.fromkeys('XYZE', '0')
+            for axis in 'XYZE':
+                value = number(axis)
+                if value is not None:
+                    self.position[axis] = value
+        elif code in ('M104', 'M109'):
+            self.targets['hotend'] = number('S', self.targets['hotend'])
+            if code == 'M109':
+                self._wait_for_temp('hotend', generation)
+        elif code in ('M140', 'M190'):
+            self.targets['bed'] = number('S', self.targets['bed'])
+            if code == 'M190':
+                self._wait_for_temp('bed', generation)
+        elif code == 'M105':
+            return None, ' ' + self._temp_report()
+        elif code == 'M114':
+            return self._position_report(), ''
+        elif code == 'M115':
+            return ("FIRMWARE_NAME:Marlin 2.1 (virtual printer) PROTOCOL_VERSION:1.0 MACHINE_TYPE:Virtual\n"
+                    "Cap:AUTOREPORT_TEMP:1\nCap:AUTOREPORT_POS:1\nCap:EMERGENCY_PARSER:1"), ''
+        elif code == 'M155':
+            self.temp_report_interval = number('S', 0.0)
+        elif code == 'M154':
+            self.position_report_interval = number('S', 0.0)
+        elif code == 'M106':
+            self.fan = int(number('S', 255))
+        elif code == 'M107':
+            self.fan = 0
+        elif code == 'M220':
+            self.feedrate_pct = int(number('S', self.feedrate_pct))
+        elif code == 'M221':
+            self.flow_pct = int(number('S', self.flow_pct))
+        elif code == 'M25':
+            self.sd_paused = True
+        elif code == 'M24':
+            self.sd_paused = False
+        elif code == 'M117':
+            self.message = args
+        elif code in ('M110', 'M400', 'M84', 'M18', 'M999'):
+            pass
+        else:
+            self.stats['unknown'] += 1
+            return f'echo:Unknown command: "{gcode}"', ''
+        return None, ''
+
+    def _busy(self, seconds, generation):
+        """A long command: keepalives every BUSY_INTERVAL, like Marlin."""
+        end = time.time() + seconds
+        while time.time() < end and self.running and not self.halted:
+            time.sleep(min(BUSY_INTERVAL, max(0.0, end - time.time())))
+            if time.time() < end:
+                self._write("echo:busy: processing", generation)
+
+    def _wait_for_temp(self, heater, generation):
+        """M109 / M190: block, reporting temperatures each second, until within TEMP_WINDOW."""
+        last_report = time.time()
+        while self.running and not self.halted and generation == self.generation:
+            target = self.targets[heater]
+            if target <= 0 or abs(self.temps[heater] - target) <= TEMP_WINDOW:
+                return
+            time.sleep(0.05)
+            if time.time() - last_report >= 1.0:
+                last_report = time.time()
+                self._write(self._temp_report() + " W:?", generation)
+
+    # --- Physics and auto-reports ---
+
+    def _physics_loop(self):
+        last = time.time()
+        next_disconnect = self._next_disconnect(last)
+        while self.running:
+            time.sleep(0.05)
+            now = time.time()
+            dt, last = now - last, now
+            for heater, tau in self.tau.items():
+                # First-order lag towards the target (or ambient when off)
+                goal = max(self.targets[heater], self.ambient)
+                self.temps[heater] = goal + (self.temps[heater] - goal) * math.exp(-dt / tau)
+
+            if self.session is None or self.halted:
+                continue
+            generation = self.generation
+            if self.temp_report_interval > 0 and now - self._last_temp_report >= self.temp_report_interval:
+                self._last_temp_report = now
+                self._write(' ' + self._temp_report(), generation)
+            if (self.position_report_interval > 0 and
+                    now - self._last_position_report >= self.position_report_interval):
+                self._last_position_report = now
+                self._write(self._position_report(), generation)
+            if next_disconnect is not None and now >= next_disconnect:
+                self.disconnect()
+                next_disconnect = self._next_disconnect(now + self.downtime)
+
+    def _next_disconnect(self, now):
+        if not self.disconnect_every:
+            return None
+        return now + self.disconnect_every * self._rng.uniform(0.8, 1.2)
+
+    def _temp_report(self):
+        def noisy(value):
+            return value + self._rng.gauss(0.0, self.temp_noise) if self.temp_noise else value
+
+        def power(heater):
+            return 127 if self.targets[heater] > self.temps[heater] else 0
+
+        return (f"T:{noisy(self.temps['hotend']):.2f} /{self.targets['hotend']:.2f} "
+                f"B:{noisy(self.temps['bed']):.2f} /{self.targets['bed']:.2f} "
+                f"@:{power('hotend')} B@:{power('bed')}")
+
+    def _position_report(self):
+        p = self.position
+        return (f"X:{p['X']:.2f} Y:{p['Y']:.2f} Z:{p['Z']:.2f} E:{p['E']:.2f} "
+                f"Count X:{int(p['X'] * 80)} Y:{int(p['Y'] * 80)} Z:{int(p['Z'] * 400)}")
+
+    def get_stats(self):
+        return dict(self.stats, online=self.online.is_set(), halted=self.halted,
+                    hotend=self.temps['hotend'], bed=self.temps['bed'])
+
+
+def run_benchmark(commands=1000, window=4, load=200, **printer_options):
+    """
+    Round-trip time and throughput of LivePrinterControl against the
+    emulator, then emergency-stop latency (call -> M112 received) with
+    `load` commands queued ahead of it.
+    """
+    from printer_control import LivePrinterControl
+
+    printer = LiveVirtualPrinter(**printer_options).start()
+    control = LivePrinterControl(port=printer.port, boot_timeout=0.2, max_in_flight=window)
+    try:
+        start = time.perf_counter()
+        futures = [control.send_async(f"G1 X{i % 200} Y{(i * 7) % 200} F6000") for i in range(commands)]
+        failed = 0
+        for future in futures:
+            try:
+                future.result(timeout=control.command_timeout * 2)
+            except Exception:
+                failed += 1
+        elapsed = time.perf_counter() - start
+        stats = control.get_stats()
+        print(f"[EMULATOR] {commands} commands in {elapsed:.2f}s ({commands / elapsed:.0f}/s, window {window}): "
+              f"avg round trip {stats['avg_rtt_ms']:.2f} ms, max {stats['max_rtt_ms']:.2f} ms, "
+              f"{stats['resends']} resends, {stats['timeouts']} timeouts, {failed} failed.")
+
+        for i in range(load):
+            control.send_async(f"G1 X{i % 200} F6000")
+        time.sleep(0.05)
+        printer.estop_at = None
+        start = time.perf_counter()
+        control.emergency_stop_live()
+        deadline = time.time() + 2.0
+        while printer.estop_at is None and time.time() < deadline:
+            time.sleep(0.0005)
+        if printer.estop_at is None:
+            print("[EMULATOR] M112 never arrived.")
+        else:
+            print(f"[EMULATOR] Emergency stop with {load} commands queued: "
+                  f"{(printer.estop_at - start) * 1000:.2f} ms from call to M112 received.")
+        return {'commands': commands, 'seconds': elapsed, 'failed': failed, 'serial': stats,
+                'estop_ms': None if printer.estop_at is None else (printer.estop_at - start) * 1000}
+    finally:
+        control.close()
+        printer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Virtual Marlin printer on a pseudo-terminal.")
+    parser.add_argument('command', choices=['serve', 'bench'])
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before each ok")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random latency, seconds")
+    parser.add_argument('--noise', type=float, default=0.0, help="Probability of a corrupted line")
+    parser.add_argument('--drop-ok', type=float, default=0.0, help="Probability of a missing ok")
+    parser.add_argument('--disconnect-every', type=float, default=None, help="Seconds between unplugs")
+    parser.add_argument('--downtime', type=float, default=2.0, help="Seconds each unplug lasts")
+    parser.add_argument('--commands', type=int, default=1000, help="bench: commands to time")
+    parser.add_argument('--window', type=int, default=4, help="bench: commands in flight")
+    parser.add_argument('--load', type=int, default=200, help="bench: commands queued ahead of the M112")
+    args = parser.parse_args()
+    options = dict(latency=args.latency, jitter=args.jitter, noise=args.noise, drop_ok=args.drop_ok,
+                   disconnect_every=args.disconnect_every, downtime=args.downtime)
+
+    if args.command == 'bench':
+        run_benchmark(args.commands, args.window, args.load, **options)
+    else:
+        printer = LiveVirtualPrinter(**options).start()
+        print(f"[EMULATOR] Connect with LivePrinterControl(port='{printer.port}'). Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            printer.close()
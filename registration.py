@@ -0,0 +1,189 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: registration.py
+PURPOSE: Precomputed RGB <-> depth registration lookup tables.
+Based on: SECTION 2: LIVE KINECT CAPTURE STRUCTURE
+================================================================================
+
+The Kinect V2 color (1920x1080) and depth (512x424) cameras see the bed from
+slightly different positions. Instead of calling the SDK coordinate mapper
+per pixel at runtime, a one-off calibration maps every pixel in both
+directions and saves dense tables. After that, remapping a frame is a single
+cv2.remap and mapping a bbox is a slice of the table.
+
+The tables are built against the empty-bed depth frame, so they are exact
+for the bed plane; parallax for parts a few cm tall is a pixel or two.
+
+Calibrate with a live Kinect (bed empty):
+    python registration.py calibrate
+"""
+
+import os
+import ctypes
+import argparse
+import numpy as np
+import cv2
+
+COLOR_SIZE = (1920, 1080)   # (width, height)
+DEPTH_SIZE = (512, 424)
+
+
+class LiveRegistration:
+    """
+    Dense lookup tables:
+      color_to_depth[y, x] = (depth_x, depth_y) for every color pixel
+      depth_to_color[y, x] = (color_x, color_y) for every depth pixel
+    Unmappable pixels hold NaN.
+    """
+    def __init__(self, color_to_depth, depth_to_color):
+        self.color_to_depth = color_to_depth.astype(np.float32)
+        self.depth_to_color = depth_to_color.astype(np.float32)
+
+        # Fixed-point maps make cv2.remap noticeably faster
+        self._c2d_maps = self._fixed_maps(self.color_to_depth)
+        self._d2c_maps = self._fixed_maps(self.depth_to_color)
+        print(f"[REGISTRATION] Tables ready: color {self.color_to_depth.shape[1]}x{self.color_to_depth.shape[0]} "
+              f"<-> depth {self.depth_to_color.shape[1]}x{self.depth_to_color.shape[0]}")
+
+    @staticmethod
+    def _fixed_maps(table):
+        # NaN -> far outside the image, so remap fills with the border value
+        clean = np.nan_to_num(table, nan=-1e4)
+        return cv2.convertMaps(clean[..., 0], clean[..., 1], cv2.CV_16SC2)
+
+    # --- Persistence ---
+
+    def save(self, path='registration.npz'):
+        np.savez_compressed(path, color_to_depth=self.color_to_depth, depth_to_color=self.depth_to_color)
+        print(f"[REGISTRATION] Saved to {path}")
+
+    @classmethod
+    def load(cls, path='registration.npz'):
+        """Load saved tables, or return None if there are none."""
+        if not os.path.exists(path):
+            print(f"[REGISTRATION] No tables at '{path}'. Run: python registration.py calibrate")
+            return None
+        data = np.load(path)
+        print(f"[REGISTRATION] Loaded tables from {path}")
+        return cls(data['color_to_depth'], data['depth_to_color'])
+
+    # --- Builders ---
+
+    @classmethod
+    def from_kinect(cls, kinect_capture, depth_frame_data):
+        """
+        Build the tables with the Kinect SDK coordinate mapper (two bulk
+        calls, one per direction). `depth_frame_data` should show the empty bed.
+        """
+        from pykinect2 import PyKinectV2
+
+        runtime = kinect_capture.kinect
+        mapper = runtime._mapper
+        depth = np.ascontiguousarray(depth_frame_data, dtype=np.uint16).ravel()
+        depth_ptr = depth.ctypes.data_as(ctypes.POINTER(ctypes.c_ushort))
+        color_w, color_h = COLOR_SIZE
+        depth_w, depth_h = DEPTH_SIZE
+
+        # Color -> depth (both point structs are two float32s: X, Y)
+        color_to_depth = np.empty((color_h * color_w, 2), dtype=np.float32)
+        mapper.MapColorFrameToDepthSpace(
+            ctypes.c_uint(depth.size), depth_ptr,
+            ctypes.c_uint(color_h * color_w),
+            color_to_depth.ctypes.data_as(ctypes.POINTER(PyKinectV2._DepthSpacePoint)))
+
+        # Depth -> color
+        depth_to_color = np.empty((depth_h * depth_w, 2), dtype=np.float32)
+        mapper.MapDepthFrameToColorSpace(
+            ctypes.c_uint(depth.size), depth_ptr,
+            ctypes.c_uint(depth.size),
+            depth_to_color.ctypes.data_as(ctypes.POINTER(PyKinectV2._ColorSpacePoint)))
+
+        # The SDK marks unmappable pixels with -inf
+        color_to_depth[~np.isfinite(color_to_depth)] = np.nan
+        depth_to_color[~np.isfinite(depth_to_color)] = np.nan
+        return cls(color_to_depth.reshape(color_h, color_w, 2), depth_to_color.reshape(depth_h, depth_w, 2))
+
+    @classmethod
+    def from_point_pairs(cls, color_points, depth_points):
+        """
+        Build the tables from >= 4 hand-picked matching points on the bed
+        (planar homography). Useful without the SDK, e.g. for replays.
+        """
+        color_points = np.asarray(color_points, dtype=np.float32)
+        depth_points = np.asarray(depth_points, dtype=np.float32)
+        H, _ = cv2.findHomography(color_points, depth_points)
+        if H is None:
+            raise ValueError("Could not fit a homography to the given point pairs.")
+        return cls(cls._warp_grid(H, COLOR_SIZE, DEPTH_SIZE),
+                   cls._warp_grid(np.linalg.inv(H), DEPTH_SIZE, COLOR_SIZE))
+
+    @staticmethod
+    def _warp_grid(H, src_size, dst_size):
+        w, h = src_size
+        xs, ys = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+        grid = np.dstack([xs, ys]).reshape(-1, 1, 2)
+        mapped = cv2.perspectiveTransform(grid, H).reshape(h, w, 2)
+        # Points that land outside the other image are unmappable
+        outside = (mapped[..., 0] < 0) | (mapped[..., 0] > dst_size[0] - 1) | \
+                  (mapped[..., 1] < 0) | (mapped[..., 1] > dst_size[1] - 1)
+        mapped[outside] = np.nan
+        return mapped
+
+    # --- Frame remapping (one vectorized gather each) ---
+
+    def depth_to_color_frame(self, depth_frame):
+        """Resample a (424, 512) depth frame onto the 1920x1080 color grid."""
+        return cv2.remap(depth_frame, self._c2d_maps[0], self._c2d_maps[1],
+                         interpolation=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    def color_to_depth_frame(self, color_frame):
+        """Resample a 1920x1080 color frame onto the 512x424 depth grid."""
+        return cv2.remap(color_frame, self._d2c_maps[0], self._d2c_maps[1],
+                         interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    # --- Box mapping ---
+
+    @staticmethod
+    def _map_bbox(table, bbox, step):
+        """Bounding box of the table entries under `bbox` (sampled every `step` px)."""
+        h, w = table.shape[:2]
+        x1, y1, x2, y2 = [int(round(v)) for v in bbox]
+        x1, x2 = max(0, min(x1, w - 1)), max(0, min(x2, w))
+        y1, y2 = max(0, min(y1, h - 1)), max(0, min(y2, h))
+        if x2 <= x1 or y2 <= y1:
+            return None
+        points = table[y1:y2:step, x1:x2:step].reshape(-1, 2)
+        points = points[np.isfinite(points[:, 0])]
+        if len(points) == 0:
+            return None
+        (mx1, my1), (mx2, my2) = points.min(axis=0), points.max(axis=0)
+        return [float(mx1), float(my1), float(mx2), float(my2)]
+
+    def color_bbox_to_depth(self, bbox):
+        """Map a color-frame [x1, y1, x2, y2] to depth-frame pixels (or None)."""
+        return self._map_bbox(self.color_to_depth, bbox, step=4)
+
+    def depth_bbox_to_color(self, bbox):
+        """Map a depth-frame [x1, y1, x2, y2] to color-frame pixels (or None)."""
+        return self._map_bbox(self.depth_to_color, bbox, step=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build RGB <-> depth registration tables.")
+    parser.add_argument('command', choices=['calibrate'])
+    parser.add_argument('--output', default='registration.npz')
+    args = parser.parse_args()
+
+    import time
+    from kinect_capture import LiveKinectCapture
+    kinect = LiveKinectCapture()
+    try:
+        print("[REGISTRATION] Waiting for a depth frame (bed should be EMPTY)...")
+        depth = None
+        while depth is None:
+            _, depth = kinect.get_latest_frame()
+            time.sleep(0.05)
+        LiveRegistration.from_kinect(kinect, depth).save(args.output)
+    finally:
+        kinect.close()
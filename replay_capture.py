@@ -0,0 +1,347 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: replay_capture.py
+PURPOSE: File-backed capture sources and a raw session recorder.
+Based on: SECTION 2: LIVE KINECT CAPTURE STRUCTURE
+================================================================================
+
+Drop-in replacements for LiveKinectCapture (same get_latest_frame /
+get_live_rgb_image / get_live_depth_image / close interface) that replay
+recorded sessions, so the capture -> AI -> correction path can be profiled
+and load-tested without pykinect2 or a sensor.
+
+Raw archive layout (one directory per session):
+    meta.json       - frame shapes and count
+    color.raw       - BGRA uint8 frames, back to back (Kinect native format)
+    depth.raw       - uint16 mm frames, back to back
+    timestamps.raw  - float64 capture time per frame
+
+Compressed session archives (session_archive.py) replay the same way.
+
+Record from a live Kinect:
+    python replay_capture.py record recordings/session1 --seconds 60
+    (--format raw for the uncompressed layout above)
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+from session_archive import LiveSessionArchive, LiveSessionWriter, is_session_archive
+
+KINECT_COLOR_SHAPE = (1080, 1920, 4)
+KINECT_DEPTH_SHAPE = (424, 512)
+
+
+class LiveReplayCapture:
+    """
+    Common replay logic: decides which recorded frame is "current".
+    realtime=True  - frames appear at their recorded pace (frames are skipped
+                     if the consumer is slow, like a live sensor).
+    realtime=False - every get_latest_frame() call advances one frame
+                     (unthrottled, for benchmarks).
+    """
+    def __init__(self, frame_count, timestamps, realtime=True, loop=False):
+        self.frame_count = frame_count
+        self.timestamps = timestamps
+        self.realtime = realtime
+        self.loop = loop
+        self.index = -1
+        self.finished = False
+        self.start_time = None
+        self.latest_rgb_frame = None
+        self.latest_depth_frame = None
+
+    def _target_index(self):
+        if not self.realtime:
+            return self.index + 1
+        now = time.time()
+        if self.start_time is None:
+            self.start_time = now
+        elapsed = now - self.start_time
+        duration = self.timestamps[-1] - self.timestamps[0]
+        if self.loop and duration > 0:
+            # Frames of earlier passes count towards the index
+            passes = int(elapsed // duration)
+            elapsed -= passes * duration
+            offset = passes * self.frame_count
+        else:
+            offset = 0
+            # Past the last frame (plus one frame interval): recording is over
+            if elapsed > duration * self.frame_count / max(1, self.frame_count - 1):
+                return self.frame_count
+        local = int(np.searchsorted(self.timestamps, self.timestamps[0] + elapsed, side='right')) - 1
+        return offset + max(0, local)
+
+    def get_latest_frame(self):
+        """
+        Non-blocking frame retrieval, like LiveKinectCapture.
+        Returns the same objects until a new frame is due.
+        """
+        if self.finished:
+            return self.latest_rgb_frame, self.latest_depth_frame
+
+        target = self._target_index()
+        if target != self.index:
+            if target >= self.frame_count and not self.loop:
+                self.finished = True
+                print("[REPLAY] End of recording.")
+                return self.latest_rgb_frame, self.latest_depth_frame
+            self.latest_rgb_frame, self.latest_depth_frame = self._read_frame(target % self.frame_count, target - self.index)
+            self.index = target
+
+        return self.latest_rgb_frame, self.latest_depth_frame
+
+    def _read_frame(self, index, step):
+        raise NotImplementedError
+
+    def get_live_rgb_image(self, rgb_frame_data, out=None):
+        """
+        Convert a replayed color frame to OpenCV BGR.
+        Accepts Kinect-style BGRA (flat or HxWx4) or BGR video frames.
+        If `out` is given, convert (and resize if needed) into it in place.
+        """
+        if rgb_frame_data is None:
+            return None
+
+        if rgb_frame_data.ndim == 1:
+            rgb_frame_data = rgb_frame_data.reshape(self.color_shape)
+
+        channels = rgb_frame_data.shape[2]
+        if out is not None and out.shape[:2] != rgb_frame_data.shape[:2]:
+            bgr = cv2.cvtColor(rgb_frame_data, cv2.COLOR_BGRA2BGR) if channels == 4 else rgb_frame_data
+            return cv2.resize(bgr, (out.shape[1], out.shape[0]), dst=out)
+        if channels == 4:
+            if out is not None:
+                return cv2.cvtColor(rgb_frame_data, cv2.COLOR_BGRA2BGR, dst=out)
+            return cv2.cvtColor(rgb_frame_data, cv2.COLOR_BGRA2BGR)
+        if out is not None:
+            np.copyto(out, rgb_frame_data)
+            return out
+        return rgb_frame_data
+
+    def get_live_depth_raw(self, depth_frame_data):
+        """Replayed depth as (H, W) uint16 mm. Returns a view (no copy)."""
+        if depth_frame_data is None:
+            return None
+        return depth_frame_data.reshape(self.depth_shape)
+
+    def get_live_depth_image(self, depth_frame_data):
+        """Replayed depth as a float image in meters (like LiveKinectCapture)."""
+        if depth_frame_data is None:
+            return None
+        return self.get_live_depth_raw(depth_frame_data).astype(np.float32) * 0.001
+
+    def close(self):
+        pass
+
+
+class LiveArchiveCapture(LiveReplayCapture):
+    """
+    Replays a raw archive written by LiveArchiveRecorder.
+    All three files are memory-mapped; frames are returned as views into
+    the map, so replay costs no decoding and no copies.
+    """
+    def __init__(self, path, realtime=True, loop=False):
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.path = path
+        self.color_shape = tuple(meta['color_shape'])
+        self.depth_shape = tuple(meta['depth_shape'])
+        count = meta['frames']
+
+        self.color = np.memmap(os.path.join(path, 'color.raw'), dtype=np.uint8, mode='r',
+                               shape=(count,) + self.color_shape)
+        self.depth = np.memmap(os.path.join(path, 'depth.raw'), dtype=np.uint16, mode='r',
+                               shape=(count,) + self.depth_shape)
+        timestamps = np.memmap(os.path.join(path, 'timestamps.raw'), dtype=np.float64, mode='r',
+                               shape=(count,))
+
+        super().__init__(count, timestamps, realtime, loop)
+        print(f"[REPLAY] Archive '{path}': {count} frames, "
+              f"{timestamps[-1] - timestamps[0]:.1f}s, {'real-time' if realtime else 'unthrottled'}.")
+
+    def _read_frame(self, index, step):
+        return self.color[index], self.depth[index]
+
+    def close(self):
+        # Drop the maps so the files can be released
+        self.color = self.depth = None
+        self.latest_rgb_frame = self.latest_depth_frame = None
+        print("[REPLAY] Archive closed.")
+
+
+class LiveSessionCapture(LiveReplayCapture):
+    """
+    Replays a compressed session archive (see session_archive.py).
+    Only the frames actually shown are decoded, so skipped frames in
+    real-time mode cost nothing.
+    """
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.archive = LiveSessionArchive(path)
+        self.color_shape = self.archive.color_shape
+        self.depth_shape = self.archive.depth_shape
+        timestamps = self.archive.timestamps
+        super().__init__(len(self.archive), timestamps, realtime, loop)
+        print(f"[REPLAY] Session '{path}': {len(self.archive)} frames, "
+              f"{timestamps[-1] - timestamps[0]:.1f}s, {'real-time' if realtime else 'unthrottled'}.")
+
+    def _read_frame(self, index, step):
+        return self.archive.read_rgb(index), self.archive.read_depth(index)
+
+    def close(self):
+        self.archive.close()
+        self.latest_rgb_frame = self.latest_depth_frame = None
+        print("[REPLAY] Session closed.")
+
+
+class LiveVideoCapture(LiveReplayCapture):
+    """
+    Replays an ordinary video file (e.g. a phone recording of a print).
+    Depth is optional: a .npy of shape (N, 424, 512) uint16, memory-mapped.
+    """
+    def __init__(self, path, depth_path=None, realtime=True, loop=False):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open video '{path}'")
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.color_shape = (height, width, 3)
+        self.depth_shape = KINECT_DEPTH_SHAPE
+
+        self.depth = None
+        if depth_path is not None:
+            self.depth = np.load(depth_path, mmap_mode='r')
+            self.depth_shape = self.depth.shape[1:]
+            count = min(count, len(self.depth))
+
+        self.frame = np.empty(self.color_shape, dtype=np.uint8)
+        super().__init__(count, np.arange(count, dtype=np.float64) / fps, realtime, loop)
+        print(f"[REPLAY] Video '{path}': {count} frames at {fps:.1f} FPS, "
+              f"{'real-time' if realtime else 'unthrottled'}.")
+
+    def _read_frame(self, index, step):
+        if step < 1 or index < self.index % self.frame_count:
+            # Looped back to the start
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            step = 1
+        # Skip frames we are too late for without decoding them
+        for _ in range(step - 1):
+            self.cap.grab()
+        ok, _ = self.cap.read(self.frame)
+        if not ok:
+            return self.latest_rgb_frame, self.latest_depth_frame
+        # Fresh view object so consumers' identity checks see a new frame
+        rgb = self.frame.view()
+        depth = self.depth[index] if self.depth is not None else None
+        return rgb, depth
+
+    def close(self):
+        self.cap.release()
+        print("[REPLAY] Video closed.")
+
+
+def open_replay_capture(path, realtime=True, loop=False):
+    """Open a session archive, raw archive directory or video file as a capture source."""
+    if is_session_archive(path):
+        return LiveSessionCapture(path, realtime=realtime, loop=loop)
+    if os.path.isdir(path):
+        return LiveArchiveCapture(path, realtime=realtime, loop=loop)
+    return LiveVideoCapture(path, realtime=realtime, loop=loop)
+
+
+class LiveArchiveRecorder:
+    """
+    Appends raw Kinect frames to a session archive readable by
+    LiveArchiveCapture. Frames are written as-is (no encoding), so
+    recording keeps up with the sensor at the cost of disk space.
+    """
+    def __init__(self, path, color_shape=KINECT_COLOR_SHAPE, depth_shape=KINECT_DEPTH_SHAPE):
+        self.path = path
+        self.color_shape = tuple(color_shape)
+        self.depth_shape = tuple(depth_shape)
+        os.makedirs(path, exist_ok=True)
+        self.color_file = open(os.path.join(path, 'color.raw'), 'wb')
+        self.depth_file = open(os.path.join(path, 'depth.raw'), 'wb')
+        self.ts_file = open(os.path.join(path, 'timestamps.raw'), 'wb')
+        self.frames = 0
+        self.blank_depth = np.zeros(self.depth_shape, dtype=np.uint16)
+        print(f"[RECORDER] Recording to {path}")
+
+    def write(self, rgb_frame_data, depth_frame_data, timestamp=None):
+        """Append one frame pair. Missing depth is written as zeros."""
+        rgb = np.ascontiguousarray(rgb_frame_data, dtype=np.uint8)
+        if rgb.size != int(np.prod(self.color_shape)):
+            raise ValueError(f"Color frame has {rgb.size} bytes, expected {self.color_shape}")
+        depth = self.blank_depth if depth_frame_data is None else \
+            np.ascontiguousarray(depth_frame_data, dtype=np.uint16)
+
+        self.color_file.write(rgb.data)
+        self.depth_file.write(depth.data)
+        self.ts_file.write(np.float64(time.time() if timestamp is None else timestamp).tobytes())
+        self.frames += 1
+        if self.frames % 30 == 0:
+            # Keep the archive readable if recording is cut short
+            self._write_meta()
+
+    def _write_meta(self):
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump({
+                'frames': self.frames,
+                'color_shape': list(self.color_shape),
+                'depth_shape': list(self.depth_shape)
+            }, f)
+
+    def record(self, capture, seconds=None):
+        """Record every new color frame from a live capture until Ctrl+C or `seconds`."""
+        start = time.time()
+        last_rgb = None
+        try:
+            while seconds is None or time.time() - start < seconds:
+                rgb, depth = capture.get_latest_frame()
+                if rgb is not None and rgb is not last_rgb:
+                    last_rgb = rgb
+                    self.write(rgb, depth)
+                else:
+                    time.sleep(0.001)
+        except KeyboardInterrupt:
+            pass
+        print(f"[RECORDER] Recorded {self.frames} frames in {time.time() - start:.1f}s")
+
+    def close(self):
+        for f in (self.color_file, self.depth_file, self.ts_file):
+            f.close()
+        self._write_meta()
+        print(f"[RECORDER] Archive closed: {self.frames} frames.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record a Kinect session archive.")
+    parser.add_argument('command', choices=['record'])
+    parser.add_argument('path', help="Output archive directory")
+    parser.add_argument('--seconds', type=float, default=None)
+    parser.add_argument('--format', choices=['session', 'raw'], default='session',
+                        help="session: chunked JPEG/PNG archive; raw: uncompressed memory-mappable frames")
+    args = parser.parse_args()
+
+    from kinect_capture import LiveKinectCapture
+    kinect = LiveKinectCapture()
+    if args.format == 'session':
+        recorder = LiveSessionWriter(args.path)
+    else:
+        recorder = LiveArchiveRecorder(args.path)
+    try:
+        if args.format == 'session':
+            recorder.record_capture(kinect, args.seconds)
+        else:
+            recorder.record(kinect, args.seconds)
+    finally:
+        recorder.close()
+        kinect.close()
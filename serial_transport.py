@@ -0,0 +1,388 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: serial_transport.py
+PURPOSE: Asynchronous Marlin serial transport with a priority emergency lane.
+Based on: SECTION 3: LIVE PRINTER CONTROL STRUCTURE
+================================================================================
+
+One writer thread and one reader thread own the serial port. Callers put
+G-code on an outbound queue and get a concurrent.futures.Future for the
+response, so nobody blocks on the port itself:
+  - Commands are sent as "N<line> <gcode>*<checksum>" (Marlin's host
+    protocol). A corrupted line is answered with "Resend: N" and is sent
+    again automatically; "ok" completes the oldest command in flight.
+  - Queued commands are ordered by priority (corrections before status
+    polls), then by submission.
+  - emergency_stop() writes M112 from the calling thread straight away,
+    ahead of anything queued or in flight (Marlin's emergency parser acts
+    on it even with a full command buffer), then fails every pending
+    future: the firmware is halted and will not answer them.
+  - Every received line is also passed to listeners (e.g. temperature
+    auto-reports that are not a reply to any command).
+"""
+
+import re
+import time
+import heapq
+import threading
+from collections import deque
+from concurrent.futures import Future
+import serial
+
+PRIORITY_HIGH = 0       # Corrections
+PRIORITY_NORMAL = 1     # Everything else (status polls, user commands)
+
+RESEND_HISTORY = 64     # Acknowledged lines kept in case the printer asks for them again
+
+_RESEND_REGEX = re.compile(r"(?:Resend|rs)[: ]*N?(\d+)", re.IGNORECASE)
+_OK_LINE_REGEX = re.compile(r"^ok\s+N?(\d+)")
+
+
+class PrinterCommandError(Exception):
+    """The firmware rejected a command (error / unknown command)."""
+
+
+class PrinterDisconnected(ConnectionError):
+    """The serial link went away before the command was answered."""
+
+
+def checksum(line):
+    """Marlin/RepRap line checksum: XOR of all bytes."""
+    cs = 0
+    for byte in line.encode():
+        cs ^= byte
+    return cs
+
+
+class _Command:
+    __slots__ = ('gcode', 'priority', 'seq', 'timeout', 'future', 'line', 'sent_at', 'deadline',
+                 'response', 'error')
+
+    def __init__(self, gcode, priority, seq, timeout):
+        self.gcode = gcode
+        self.priority = priority
+        self.seq = seq
+        self.timeout = timeout
+        self.future = Future()
+        self.line = None
+        self.sent_at = None
+        self.deadline = None
+        self.response = []
+        self.error = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LiveSerialTransport:
+    """
+    Serial I/O worker for an open pyserial port. `max_in_flight` commands
+    may await their "ok" at once (1 = strict request/response; Marlin
+    buffers up to BUFSIZE commands). on_disconnect(error) is called once
+    when the port fails.
+    """
+    def __init__(self, ser, max_in_flight=1, line_numbers=True, timeout=10.0, on_disconnect=None):
+        self.ser = ser
+        self.max_in_flight = max_in_flight
+        self.line_numbers = line_numbers
+        self.timeout = timeout
+        self.on_disconnect = on_disconnect
+        # Short read timeout so the reader notices close() quickly
+        self.ser.timeout = 0.05
+
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()     # one line at a time on the wire
+        self._queue = []                        # heap of _Command
+        self._in_flight = []                    # sent, oldest first
+        self._seq = 0
+        self._next_line = 1
+        self._skip_ok = 0
+        self._resend_line = None                # line of the last resend request...
+        self._resend_echoes = 0                 # ...and how many repeats of it to expect
+        self._history = deque(maxlen=RESEND_HISTORY)  # (line, seq, gcode) of acknowledged lines
+        self._listeners = []
+        self.connected = True
+        self.running = False
+
+        # Stats
+        self.sent = 0
+        self.completed = 0
+        self.resends = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_rtt = 0.0
+        self.max_rtt = 0.0
+        self.last_estop_write = None
+
+    def start(self):
+        self.running = True
+        if self.line_numbers:
+            self._reset_line_numbers()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True, name="SerialReader")
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="SerialWriter")
+        self._reader.start()
+        self._writer.start()
+        return self
+
+    def add_listener(self, callback):
+        """callback(line) for every line received from the printer (reader thread)."""
+        self._listeners.append(callback)
+
+    # --- Outbound ---
+
+    def send(self, gcode, priority=PRIORITY_NORMAL, timeout=None):
+        """Queue a command; returns a Future resolving to the response text."""
+        gcode = gcode.split(';', 1)[0].strip()
+        with self._cond:
+            self._seq += 1
+            cmd = _Command(gcode, priority, self._seq, self.timeout if timeout is None else timeout)
+            if not self.connected:
+                cmd.future.set_exception(PrinterDisconnected("printer not connected"))
+                return cmd.future
+            heapq.heappush(self._queue, cmd)
+            self._cond.notify_all()
+        return cmd.future
+
+    def emergency_stop(self):
+        """
+        Write M112 now, from this thread, bypassing the queue. Only waits
+        for a line the writer may be in the middle of. Returns the seconds
+        from call to bytes handed to the OS.
+        """
+        start = time.perf_counter()
+        with self._write_lock:
+            self.ser.write(b'M112\n')
+            self.ser.flush()
+        self.last_estop_write = time.perf_counter() - start
+        # Halted firmware answers nothing that was queued or in flight
+        self._fail_all(PrinterCommandError("emergency stop sent"))
+        return self.last_estop_write
+
+    def _reset_line_numbers(self):
+        with self._cond:
+            self._resend_line = None
+            self._resend_echoes = 0
+            self._history.clear()
+            self._seq += 1
+            cmd = _Command('M110 N0', -1, self._seq, self.timeout)
+            cmd.line = 0
+            heapq.heappush(self._queue, cmd)
+            self._cond.notify_all()
+
+    def _format(self, cmd):
+        if not self.line_numbers:
+            return cmd.gcode
+        if cmd.line is None:
+            cmd.line = self._next_line
+            self._next_line += 1
+        elif cmd.line == 0:
+            self._next_line = 1
+        body = f"N{cmd.line} {cmd.gcode}"
+        return f"{body}*{checksum(body)}"
+
+    def _write_loop(self):
+        while self.running:
+            with self._cond:
+                self._expire(time.time())
+                if not self._queue or len(self._in_flight) >= self.max_in_flight:
+                    self._cond.wait(0.1)
+                    continue
+                cmd = heapq.heappop(self._queue)
+                if cmd.future.done():
+                    continue
+                line = self._format(cmd)
+                cmd.sent_at = time.time()
+                cmd.deadline = cmd.sent_at + cmd.timeout
+                self._in_flight.append(cmd)
+            try:
+                with self._write_lock:
+                    self.ser.write(line.encode() + b'\n')
+                self.sent += 1
+            except (serial.SerialException, OSError) as e:
+                self._disconnected(e)
+
+    def _expire(self, now):
+        """Fail commands whose ok never came (caller holds _cond)."""
+        while self._in_flight and self._in_flight[0].deadline < now:
+            cmd = self._in_flight.pop(0)
+            self.timeouts += 1
+            print(f"[SERIAL] No 'ok' for '{cmd.gcode}' after {cmd.timeout:.0f}s.")
+            cmd.future.set_exception(TimeoutError(f"no ok for '{cmd.gcode}'"))
+
+    # --- Inbound ---
+
+    def _read_loop(self):
+        pending = b''
+        while self.running:
+            try:
+                data = self.ser.read(max(1, self.ser.in_waiting))
+            except (serial.SerialException, OSError, TypeError) as e:
+                self._disconnected(e)
+                return
+            if not data:
+                continue
+            pending += data
+            *lines, pending = pending.split(b'\n')
+            for raw in lines:
+                line = raw.decode('utf-8', errors='ignore').strip()
+                if line:
+                    self._handle_line(line)
+
+    def _handle_line(self, line):
+        for callback in self._listeners:
+            try:
+                callback(line)
+            except Exception as e:
+                print(f"[SERIAL] Listener error: {e}")
+
+        lower = line.lower()
+        with self._cond:
+            head = self._in_flight[0] if self._in_flight else None
+            if lower.startswith('ok'):
+                if self._skip_ok:
+                    # Flow-control ok that follows a resend request
+                    self._skip_ok -= 1
+                    return
+                self._complete(line)
+                self._cond.notify_all()
+            elif lower.startswith(('resend', 'rs ')):
+                match = _RESEND_REGEX.search(line)
+                if match:
+                    self._resend(int(match.group(1)))
+            elif lower.startswith('error'):
+                # Line/checksum errors are followed by a Resend and fixed there
+                if 'line' not in lower and 'checksum' not in lower and head is not None:
+                    head.error = line
+            elif 'unknown command' in lower:
+                if head is not None:
+                    head.error = line
+            elif 'busy' in lower:
+                # Long command still running (homing, heating): keep waiting
+                if head is not None:
+                    head.deadline = time.time() + head.timeout
+            elif lower == 'start':
+                print("[SERIAL] Printer reset detected.")
+                self._fail_in_flight(PrinterDisconnected("printer reset"))
+                if self.line_numbers:
+                    self._reset_line_numbers()
+            elif head is not None:
+                head.response.append(line)
+
+    def _complete(self, ok_line):
+        """Resolve the command an 'ok' belongs to (caller holds _cond)."""
+        if not self._in_flight:
+            return
+        match = _OK_LINE_REGEX.match(ok_line)
+        if match and self.line_numbers:
+            # ADVANCED_OK names the line; everything before it is done too
+            line = int(match.group(1))
+            done = [c for c in self._in_flight if c.line is not None and c.line <= line] or self._in_flight[:1]
+        else:
+            done = self._in_flight[:1]
+        now = time.time()
+        for cmd in done:
+            self._in_flight.remove(cmd)
+            cmd.response.append(ok_line)
+            rtt = now - cmd.sent_at
+            self.total_rtt += rtt
+            self.max_rtt = max(self.max_rtt, rtt)
+            self.completed += 1
+            if cmd.line is not None and cmd.line > 0 and (not self._history or cmd.line > self._history[-1][0]):
+                self._history.append((cmd.line, cmd.seq, cmd.gcode))
+            if cmd.line == self._resend_line:
+                self._resend_line = None
+                self._resend_echoes = 0
+            if cmd.error is not None:
+                self.errors += 1
+                cmd.future.set_exception(PrinterCommandError(cmd.error))
+            elif not cmd.future.done():
+                cmd.future.set_result('\n'.join(cmd.response) + '\n')
+
+    def _resend(self, line):
+        """Put in-flight commands from `line` on back at the front of the queue."""
+        # The ok after a Resend is flow control, never the answer to a command
+        self._skip_ok += 1
+        if line == self._resend_line and self._resend_echoes > 0:
+            # Every line sent after the bad one is refused with the same
+            # request (max_in_flight > 1); it is already being resent
+            self._resend_echoes -= 1
+            return
+        again = [c for c in self._in_flight if c.line is not None and c.line >= line]
+        # Each in-flight line after the requested one will be refused with the same request
+        echoes = sum(1 for c in again if c.line > line)
+        # Lines the printer acknowledged but then lost (e.g. a corrupted line number)
+        for number, seq, gcode in self._history:
+            if number >= line:
+                replay = _Command(gcode, -1, seq, self.timeout)
+                replay.line = number
+                again.append(replay)
+        if not again:
+            print(f"[SERIAL] Printer asked to resend line {line}, which is no longer in flight.")
+            return
+        self.resends += len(again)
+        self._resend_line = line
+        self._resend_echoes = echoes
+        for cmd in again:
+            if cmd in self._in_flight:
+                self._in_flight.remove(cmd)
+            cmd.error = None
+            cmd.response = []
+            # Keep the line number; jump ahead of everything queued
+            cmd.priority = -1
+            heapq.heappush(self._queue, cmd)
+        self._cond.notify_all()
+
+    # --- Failure handling ---
+
+    def _fail_in_flight(self, error):
+        for cmd in self._in_flight:
+            if not cmd.future.done():
+                cmd.future.set_exception(error)
+        self._in_flight = []
+
+    def _fail_all(self, error):
+        with self._cond:
+            self._fail_in_flight(error)
+            for cmd in self._queue:
+                if not cmd.future.done():
+                    cmd.future.set_exception(error)
+            self._queue = []
+            self._cond.notify_all()
+
+    def _disconnected(self, error):
+        with self._cond:
+            if not self.connected:
+                return
+            self.connected = False
+            self.running = False
+        print(f"[SERIAL] Connection lost: {error}")
+        self._fail_all(PrinterDisconnected(str(error)))
+        if self.on_disconnect is not None:
+            self.on_disconnect(error)
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'sent': self.sent,
+                'completed': self.completed,
+                'queued': len(self._queue),
+                'in_flight': len(self._in_flight),
+                'resends': self.resends,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'avg_rtt_ms': 1000.0 * self.total_rtt / self.completed if self.completed else 0.0,
+                'max_rtt_ms': 1000.0 * self.max_rtt,
+                'estop_write_ms': None if self.last_estop_write is None else 1000.0 * self.last_estop_write
+            }
+
+    def close(self):
+        """Stop the worker threads and fail anything still pending (the port stays open)."""
+        self.running = False
+        with self._cond:
+            self.connected = False
+            self._cond.notify_all()
+        for thread in (self._reader, self._writer):
+            if thread is not threading.current_thread():
+                thread.join(timeout=1.0)
+        self._fail_all(PrinterDisconnected("transport closed"))
@@ -0,0 +1,314 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: session_archive.py
+PURPOSE: Chunked, append-only, compressed RGB-D session archive.
+Based on: SECTION 2: LIVE KINECT CAPTURE STRUCTURE / SECTION 4 (Live Data Collection)
+================================================================================
+
+One directory per print holds every frame in a few large files instead of
+thousands of small ones:
+    meta.json         - frame shapes, encoding settings, label names
+    chunk_00000.bin   - encoded frames, back to back (JPEG color, PNG depth);
+    chunk_00001.bin     a new chunk starts every `chunk_mb` megabytes
+    index.bin         - one SESSION_INDEX_DTYPE record per frame
+
+Both kinds of file are append-only. A frame's bytes are written before its
+index record, so a session cut short (crash, power loss) is still readable
+up to the last complete record. The reader memory-maps the index, so
+filtering a whole print by layer or label is a numpy expression, and only
+the frames actually used are decoded.
+
+    archive = LiveSessionArchive('recordings/print1')
+    for frame in archive.frames(archive.select(label='stringing')):
+        ...  # frame.rgb, frame.depth, frame.layer, frame.labels
+
+Replay with: python main.py --replay recordings/print1
+"""
+
+import os
+import json
+import time
+from collections import namedtuple
+import numpy as np
+import cv2
+
+# One record per frame in index.bin
+SESSION_INDEX_DTYPE = np.dtype([
+    ('timestamp', np.float64),
+    ('layer', np.int32),
+    ('labels', np.uint32),      # bitmask over meta['labels']
+    ('chunk', np.uint32),
+    ('rgb_offset', np.uint64),
+    ('rgb_size', np.uint32),
+    ('depth_offset', np.uint64),
+    ('depth_size', np.uint32)   # 0 = no depth for this frame
+])
+
+MAX_LABELS = 32
+
+SessionFrame = namedtuple('SessionFrame', ['index', 'timestamp', 'layer', 'labels', 'rgb', 'depth'])
+
+
+def is_session_archive(path):
+    return os.path.isfile(os.path.join(path, 'index.bin'))
+
+
+def _chunk_path(path, chunk):
+    return os.path.join(path, f'chunk_{chunk:05d}.bin')
+
+
+class LiveSessionWriter:
+    """
+    Appends RGB-D frames to a session archive. Color is JPEG-encoded
+    (BGRA Kinect frames are converted to BGR first), depth is stored
+    losslessly as 16-bit PNG. Reopening an existing archive appends to it.
+    """
+    def __init__(self, path, jpeg_quality=90, png_compression=1, chunk_mb=256):
+        self.path = path
+        self.jpeg_quality = jpeg_quality
+        self.png_compression = png_compression
+        self.chunk_bytes = chunk_mb * 1024 * 1024
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'version': 1, 'color_shape': None, 'depth_shape': None,
+                         'jpeg_quality': jpeg_quality, 'labels': []}
+
+        # Drop a partial trailing record left by an interrupted writer
+        index_path = os.path.join(path, 'index.bin')
+        if os.path.exists(index_path):
+            complete = os.path.getsize(index_path) // SESSION_INDEX_DTYPE.itemsize
+            with open(index_path, 'r+b') as f:
+                f.truncate(complete * SESSION_INDEX_DTYPE.itemsize)
+        self.index_file = open(index_path, 'ab')
+        self.frames = os.path.getsize(index_path) // SESSION_INDEX_DTYPE.itemsize
+
+        self.chunk = 0
+        while os.path.exists(_chunk_path(path, self.chunk + 1)):
+            self.chunk += 1
+        self.chunk_file = open(_chunk_path(path, self.chunk), 'ab')
+        self.record = np.zeros(1, dtype=SESSION_INDEX_DTYPE)
+        self.bytes_written = 0
+        print(f"[ARCHIVE] Writing session archive {path} ({self.frames} frames already).")
+
+    def label_mask(self, labels):
+        """Bitmask for a list of label names, registering new names."""
+        mask = 0
+        for label in labels:
+            label = str(label)
+            if label not in self.meta['labels']:
+                if len(self.meta['labels']) >= MAX_LABELS:
+                    raise ValueError(f"Archive supports at most {MAX_LABELS} label names.")
+                self.meta['labels'].append(label)
+                self._write_meta()
+            mask |= 1 << self.meta['labels'].index(label)
+        return mask
+
+    def write(self, rgb_frame, depth_frame=None, timestamp=None, layer=0, labels=()):
+        """Append one frame. Returns its index in the archive."""
+        if rgb_frame.ndim == 1:
+            # Flat Kinect BGRA buffer
+            height, width = (self.meta['color_shape'] or (1080, 1920))[:2]
+            rgb_frame = rgb_frame.reshape(height, width, -1)
+        if rgb_frame.shape[2] == 4:
+            rgb_frame = cv2.cvtColor(rgb_frame, cv2.COLOR_BGRA2BGR)
+        ok, rgb_bytes = cv2.imencode('.jpg', rgb_frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise IOError("JPEG encoding failed")
+        depth_bytes = None
+        if depth_frame is not None:
+            depth = np.ascontiguousarray(depth_frame, dtype=np.uint16)
+            if depth.ndim == 1:
+                depth = depth.reshape(self.meta['depth_shape'] or (424, 512))
+            ok, depth_bytes = cv2.imencode('.png', depth, [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression])
+            if not ok:
+                raise IOError("PNG encoding failed")
+
+        if self.meta['color_shape'] is None:
+            self.meta['color_shape'] = list(rgb_frame.shape)
+            if depth_frame is not None:
+                self.meta['depth_shape'] = list(depth.shape)
+            self._write_meta()
+
+        # Start a new chunk once this one is full
+        offset = self.chunk_file.tell()
+        size = rgb_bytes.nbytes + (depth_bytes.nbytes if depth_bytes is not None else 0)
+        if offset > 0 and offset + size > self.chunk_bytes:
+            self.chunk_file.close()
+            self.chunk += 1
+            self.chunk_file = open(_chunk_path(self.path, self.chunk), 'ab')
+            offset = 0
+
+        record = self.record[0]
+        record['timestamp'] = time.time() if timestamp is None else timestamp
+        record['layer'] = layer
+        record['labels'] = self.label_mask(labels)
+        record['chunk'] = self.chunk
+        record['rgb_offset'] = offset
+        record['rgb_size'] = rgb_bytes.nbytes
+        self.chunk_file.write(rgb_bytes.data)
+        record['depth_offset'] = offset + rgb_bytes.nbytes
+        record['depth_size'] = 0
+        if depth_bytes is not None:
+            record['depth_size'] = depth_bytes.nbytes
+            self.chunk_file.write(depth_bytes.data)
+        # Frame bytes must reach the file before the index points at them
+        self.chunk_file.flush()
+        self.index_file.write(self.record.tobytes())
+        self.index_file.flush()
+
+        self.bytes_written += int(record['rgb_size']) + int(record['depth_size'])
+        self.frames += 1
+        return self.frames - 1
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def record_capture(self, capture, seconds=None, layer=0):
+        """Record every new color frame from a live capture until Ctrl+C or `seconds`."""
+        start = time.time()
+        last_rgb = None
+        try:
+            while seconds is None or time.time() - start < seconds:
+                rgb, depth = capture.get_latest_frame()
+                if rgb is not None and rgb is not last_rgb:
+                    last_rgb = rgb
+                    self.write(rgb, depth, layer=layer)
+                else:
+                    time.sleep(0.001)
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.time() - start
+        print(f"[ARCHIVE] Recorded {self.frames} frames in {elapsed:.1f}s "
+              f"({self.bytes_written / max(1e-9, elapsed) / 1e6:.1f} MB/s).")
+
+    def close(self):
+        self.chunk_file.close()
+        self.index_file.close()
+        self._write_meta()
+        print(f"[ARCHIVE] Session archive closed: {self.frames} frames.")
+
+
+class LiveSessionArchive:
+    """
+    Read side of a session archive. The index and the chunks are
+    memory-mapped; len(), archive[i] and frames() decode on demand.
+    refresh() picks up frames appended since the archive was opened.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._chunks = {}
+        self.refresh()
+        print(f"[ARCHIVE] Session archive '{path}': {len(self)} frames, "
+              f"{len(self._chunk_list())} chunk(s), labels {self.label_names}.")
+
+    def refresh(self):
+        with open(os.path.join(self.path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.label_names = list(self.meta['labels'])
+        self.color_shape = tuple(self.meta['color_shape'] or (0, 0, 3))
+        self.depth_shape = tuple(self.meta['depth_shape'] or (0, 0))
+        index_path = os.path.join(self.path, 'index.bin')
+        count = os.path.getsize(index_path) // SESSION_INDEX_DTYPE.itemsize
+        self.index = np.memmap(index_path, dtype=SESSION_INDEX_DTYPE, mode='r', shape=(count,)) \
+            if count else np.zeros(0, dtype=SESSION_INDEX_DTYPE)
+        # The last chunk may have grown; remap it on next use
+        if self._chunks:
+            self._chunks.pop(max(self._chunks), None)
+        return count
+
+    def _chunk_list(self):
+        return sorted(set(int(c) for c in self.index['chunk']))
+
+    def _chunk(self, chunk):
+        data = self._chunks.get(chunk)
+        if data is None:
+            data = np.memmap(_chunk_path(self.path, chunk), dtype=np.uint8, mode='r')
+            self._chunks[chunk] = data
+        return data
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self):
+        return self.index['timestamp']
+
+    def label_mask(self, labels):
+        """Bitmask for label names (unknown names match nothing)."""
+        if isinstance(labels, str):
+            labels = [labels]
+        mask = 0
+        for label in labels:
+            if label in self.label_names:
+                mask |= 1 << self.label_names.index(label)
+        return mask
+
+    def labels_of(self, mask):
+        return [name for bit, name in enumerate(self.label_names) if int(mask) & (1 << bit)]
+
+    def select(self, layer=None, label=None, start_time=None, end_time=None, unlabeled=False):
+        """
+        Frame indices matching all given filters. `layer` is one layer or a
+        (first, last) range; `label` is a name or list of names (any match).
+        """
+        keep = np.ones(len(self.index), dtype=bool)
+        if layer is not None:
+            if isinstance(layer, (tuple, list)):
+                keep &= (self.index['layer'] >= layer[0]) & (self.index['layer'] <= layer[1])
+            else:
+                keep &= self.index['layer'] == layer
+        if label is not None:
+            keep &= (self.index['labels'] & self.label_mask(label)) != 0
+        if unlabeled:
+            keep &= self.index['labels'] == 0
+        if start_time is not None:
+            keep &= self.index['timestamp'] >= start_time
+        if end_time is not None:
+            keep &= self.index['timestamp'] <= end_time
+        return np.flatnonzero(keep)
+
+    def read_rgb(self, i):
+        record = self.index[i]
+        data = self._chunk(int(record['chunk']))
+        offset = int(record['rgb_offset'])
+        return cv2.imdecode(data[offset:offset + int(record['rgb_size'])], cv2.IMREAD_COLOR)
+
+    def read_depth(self, i):
+        record = self.index[i]
+        if record['depth_size'] == 0:
+            return None
+        data = self._chunk(int(record['chunk']))
+        offset = int(record['depth_offset'])
+        return cv2.imdecode(data[offset:offset + int(record['depth_size'])], cv2.IMREAD_UNCHANGED)
+
+    def __getitem__(self, i):
+        return self.read(i)
+
+    def read(self, i, depth=True):
+        i = int(i) if i >= 0 else len(self) + int(i)
+        record = self.index[i]
+        return SessionFrame(i, float(record['timestamp']), int(record['layer']),
+                            self.labels_of(record['labels']), self.read_rgb(i),
+                            self.read_depth(i) if depth else None)
+
+    def frames(self, indices=None, depth=True):
+        """Iterate SessionFrames in order of `indices` (all frames if None)."""
+        indices = range(len(self)) if indices is None else indices
+        for i in indices:
+            yield self.read(i, depth)
+
+    def __iter__(self):
+        return self.frames()
+
+    def close(self):
+        self._chunks.clear()
+        self.index = np.zeros(0, dtype=SESSION_INDEX_DTYPE)
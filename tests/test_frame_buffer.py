@@ -0,0 +1,38 @@
+from frame_buffer import LiveFrameSampler
+
+
+def _publish_and_consume(sampler, seq, now):
+    assert sampler.due(now)
+    sampler.publish(seq, now)
+    assert sampler.wait(timeout=0) == seq
+    sampler.done()
+
+
+def test_escalation_takes_effect_for_the_next_sample():
+    sampler = LiveFrameSampler(target_hz=1.0)
+    _publish_and_consume(sampler, 1, now=100.0)
+    assert not sampler.due(100.1)
+
+    # Suspected defect 0.1 s after a 1 Hz sample: escalate to 5 Hz
+    sampler.set_rate(5.0)
+    assert not sampler.due(100.15)
+    assert sampler.due(100.2)       # within the new 0.2 s interval, not at 101.0
+
+
+def test_escalation_after_a_long_gap_samples_immediately():
+    sampler = LiveFrameSampler(target_hz=1.0)
+    _publish_and_consume(sampler, 1, now=100.0)
+    sampler.set_rate(5.0)
+    assert sampler.due(100.5)
+
+
+def test_slowing_down_keeps_the_already_scheduled_sample():
+    sampler = LiveFrameSampler(target_hz=5.0)
+    _publish_and_consume(sampler, 1, now=100.0)
+    sampler.set_rate(1.0)
+    assert sampler.due(100.2)
+    sampler.publish(2, 100.2)
+    sampler.wait(timeout=0)
+    sampler.done()
+    assert not sampler.due(100.5)
+    assert sampler.due(101.2)
@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("serial")
+if not hasattr(os, 'openpty'):
+    pytest.skip("the virtual printer needs a pty (Linux / macOS)", allow_module_level=True)
+
+from printer_control import LivePrinterControl
+from printer_emulator import LiveVirtualPrinter
+from serial_transport import PrinterCommandError, PrinterDisconnected
+
+
+def _wait_until(condition, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def virtual_printer(request):
+    options = getattr(request, 'param', {})
+    printer = LiveVirtualPrinter(seed=1, **options).start()
+    yield printer
+    printer.close()
+
+
+@pytest.fixture
+def control(virtual_printer):
+    control = LivePrinterControl(port=virtual_printer.port, boot_timeout=0.2, command_timeout=5.0,
+                                 max_in_flight=4, backoff_initial=0.1, backoff_max=0.5)
+    assert control.wait_connected(5.0)
+    yield control
+    control.close()
+
+
+@pytest.mark.parametrize('virtual_printer', [{'noise': 0.05}], indirect=True)
+def test_every_command_runs_once_in_order_on_a_noisy_line(virtual_printer, control):
+    expected = [f"M117 {i}" for i in range(300)]
+    futures = [control.send_async(gcode) for gcode in expected]
+    for future in futures:
+        future.result(timeout=30)
+
+    executed = [gcode for gcode in virtual_printer.executed if gcode.startswith('M117')]
+    assert executed == expected
+    assert virtual_printer.stats['corrupted'] > 0
+    assert control.get_stats()['resends'] > 0
+
+
+def test_offline_send_is_rejected_then_the_supervisor_reconnects(virtual_printer, control):
+    virtual_printer.disconnect(downtime=0.5)
+    assert _wait_until(lambda: not control.connected, 5.0)
+
+    future = control.send_async("M117 offline")
+    with pytest.raises(PrinterDisconnected):
+        future.result(timeout=0)
+
+    assert control.wait_connected(10.0)
+    control.send_async("M117 back").result(timeout=5)
+    assert "M117 back" in virtual_printer.executed
+    assert "M117 offline" not in virtual_printer.executed
+    stats = control.get_stats()
+    assert stats['disconnects'] == 1 and stats['connects'] == 2
+
+
+@pytest.mark.parametrize('virtual_printer', [{'latency': 0.01}], indirect=True)
+def test_emergency_stop_jumps_the_queue_and_fails_pending_commands(virtual_printer, control):
+    futures = [control.send_async(f"G1 X{i % 200} F6000") for i in range(200)]
+    time.sleep(0.05)
+    control.emergency_stop_live()
+
+    assert _wait_until(lambda: virtual_printer.halted, 2.0)
+    # At 10 ms per command, only the first few ran before the M112 arrived
+    assert virtual_printer.stats['commands'] < 50
+    failed = 0
+    for future in futures:
+        try:
+            future.result(timeout=5)
+        except PrinterCommandError:
+            failed += 1
+    assert failed > 150
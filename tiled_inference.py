@@ -0,0 +1,138 @@
+"""
+================================================================================
+PROJECT: Live AI 3D Printer Monitor
+FILE: tiled_inference.py
+PURPOSE: Overlapping tile grid and cross-tile merging for full-resolution inference.
+Based on: SECTION 4: LIVE AI MODEL STRUCTURE
+================================================================================
+
+The model is trained at imgsz=1920, but a normal inference letterboxes the
+ROI down to 640 px, and thin defects (stringing) disappear. Tiling cuts the
+ROI into overlapping tile_size x tile_size windows that the model sees at
+native resolution. All tiles go through the model as one batch, and the
+per-tile boxes are merged back into one set of full-frame detections.
+
+LiveAIModel.enable_tiling() selects the schedule:
+  'full'        - every tile on every analyzed frame
+  'coarse_fine' - one downscaled pass over the ROI, then only the tiles
+                  around low-confidence ("suspicious") boxes at full resolution
+"""
+
+import numpy as np
+
+TILING_MODES = ('off', 'full', 'coarse_fine')
+
+
+def _axis_starts(length, tile, stride):
+    """Tile start offsets covering [0, length), last tile flush with the end."""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+class LiveTileGrid:
+    """
+    Precomputed tiles over each ROI region's crop (or the whole frame).
+    tiles[i]   = (x1, y1, x2, y2) in the crop of region tile_region[i]
+    offsets[i] = (x, y, x, y) to add to move a tile box to full-frame pixels
+    """
+    def __init__(self, roi_mask=None, width=1920, height=1080, tile_size=640, overlap=0.2):
+        self.tile_size = tile_size
+        self.overlap = overlap
+        stride = max(1, int(tile_size * (1.0 - overlap)))
+
+        if roi_mask is not None and roi_mask.crop_mode:
+            self.regions = list(roi_mask.regions)
+            bounds = [(r.x1, r.y1, r.x2, r.y2) for r in self.regions]
+        else:
+            self.regions = None
+            bounds = [(0, 0, width, height)]
+
+        tiles, tile_region, offsets = [], [], []
+        for index, (x1, y1, x2, y2) in enumerate(bounds):
+            w, h = x2 - x1, y2 - y1
+            for ty in _axis_starts(h, tile_size, stride):
+                for tx in _axis_starts(w, tile_size, stride):
+                    tiles.append((tx, ty, min(w, tx + tile_size), min(h, ty + tile_size)))
+                    tile_region.append(index)
+                    offsets.append((x1 + tx, y1 + ty, x1 + tx, y1 + ty))
+
+        self.tiles = np.array(tiles, dtype=np.int32)
+        self.tile_region = np.array(tile_region, dtype=np.int16)
+        self.offsets = np.array(offsets, dtype=np.float32)
+        # Tile bounds in full-frame pixels, for selecting tiles around boxes
+        self.frame_tiles = self.tiles.astype(np.float32) + self.offsets
+        print(f"[TILES] {len(self.tiles)} tiles of {tile_size}px ({overlap:.0%} overlap) "
+              f"over {len(bounds)} region(s).")
+
+    def crop_tiles(self, frame, indices=None):
+        """
+        Tile views for `indices` (all tiles if None). Region crops are taken
+        once per region; tiles are views into them (no copies for rectangles).
+        """
+        indices = np.arange(len(self.tiles)) if indices is None else indices
+        if self.regions is not None:
+            crops = {}
+            for i in indices:
+                r = int(self.tile_region[i])
+                if r not in crops:
+                    crops[r] = self.regions[r].crop(frame)
+        else:
+            crops = {0: frame}
+        views = []
+        for i in indices:
+            x1, y1, x2, y2 = self.tiles[i]
+            views.append(crops[int(self.tile_region[i])][y1:y2, x1:x2])
+        return views
+
+    def tiles_around(self, bboxes, margin=32):
+        """Indices of tiles overlapping any full-frame box (grown by `margin` px)."""
+        if len(bboxes) == 0:
+            return np.empty(0, dtype=np.int64)
+        boxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        t = self.frame_tiles
+        hit = (t[:, None, 0] < boxes[None, :, 2] + margin) & (t[:, None, 2] > boxes[None, :, 0] - margin) & \
+              (t[:, None, 1] < boxes[None, :, 3] + margin) & (t[:, None, 3] > boxes[None, :, 1] - margin)
+        return np.flatnonzero(hit.any(axis=1))
+
+
+def merge_detections(detections, iou_threshold=0.5, ios_threshold=0.6):
+    """
+    Cross-tile NMS on a DETECTION_DTYPE array in full-frame coordinates.
+
+    Same-class boxes are merged into the most confident one when their IoU
+    exceeds `iou_threshold` (the same object seen by two tiles), or when the
+    smaller box mostly lies inside the larger (`ios_threshold`, a defect cut
+    by a tile edge). The kept box grows to the union of what it absorbed, so
+    a string crossing a tile seam comes out as one box.
+    """
+    if detections is None or len(detections) < 2:
+        return detections
+
+    order = np.argsort(-detections['confidence'], kind='stable')
+    dets = detections[order].copy()
+    boxes = dets['bbox']
+    area = np.prod(np.clip(boxes[:, 2:] - boxes[:, :2], 0, None), axis=1)
+
+    tl = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    br = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    iou = inter / np.maximum(area[:, None] + area[None, :] - inter, 1e-9)
+    ios = inter / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-9)
+    same = dets['class_id'][:, None] == dets['class_id'][None, :]
+    overlaps = same & ((iou > iou_threshold) | (ios > ios_threshold))
+
+    alive = np.ones(len(dets), dtype=bool)
+    for i in range(len(dets)):
+        if not alive[i]:
+            continue
+        absorbed = overlaps[i] & alive
+        absorbed[i] = False
+        if absorbed.any():
+            members = boxes[absorbed]
+            boxes[i, :2] = np.minimum(boxes[i, :2], members[:, :2].min(axis=0))
+            boxes[i, 2:] = np.maximum(boxes[i, 2:], members[:, 2:].max(axis=0))
+            alive[absorbed] = False
+    return dets[alive]
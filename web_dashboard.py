@@ -7,12 +7,11 @@ Based on: SECTION 6: LIVE WEB DASHBOARD STRUCTURE
 ================================================================================
 """
 
+import os
 import threading
 import base64
 import time
 import cv2
-from flask import Flask, render_template, Response
-from flask_socketio import SocketIO
 
 class LiveWebDashboard:
     """
@@ -20,10 +19,16 @@ class LiveWebDashboard:
     web interface with SocketIO for real-time updates.
     """
     def __init__(self):
+        # Imported here: flask + socketio add noticeably to startup time, and
+        # main.py builds the dashboard in parallel with the other modules
+        from flask import Flask
+        from flask_socketio import SocketIO
+        
         self.app = Flask(__name__, template_folder='templates')
         # Allow all origins for simplicity in this solo project
         self.socketio = SocketIO(self.app, cors_allowed_origins="*")
         self.clients = 0
+        self.model_swapper = None # Set by attach_model_swapper
         
         self._setup_routes()
         self._setup_socketio()
@@ -47,6 +52,8 @@ class LiveWebDashboard:
     
     def _setup_routes(self):
         """Defines the main HTML page routes."""
+        from flask import render_template
+        
         @self.app.route('/')
         def index():
             # Renders the live.html template
@@ -80,6 +87,28 @@ class LiveWebDashboard:
         def handle_ping():
             self.socketio.emit('pong')
             
+        @self.socketio.on('model_rollback')
+        def handle_model_rollback():
+            if self.model_swapper is None:
+                return
+            print("[WEB] Model rollback requested.")
+            self.model_swapper.rollback()
+        
+        @self.socketio.on('model_swap')
+        def handle_model_swap(data):
+            if self.model_swapper is None or not data or not data.get('name'):
+                return
+            # Only models inside the watched directory can be deployed from the web
+            path = os.path.join(self.model_swapper.watch_dir, os.path.basename(data['name']))
+            print(f"[WEB] Model swap requested: {path}")
+            if os.path.exists(path):
+                self.model_swapper.request_swap(path)
+        
+        @self.socketio.on('model_status')
+        def handle_model_status():
+            if self.model_swapper is not None:
+                self.socketio.emit('model_status', self.model_swapper.get_status())
+            
         # TODO: Add handlers for buttons (Pause, Resume, Stop)
         # This requires passing the 'printer' object to this class from main.py
         
@@ -114,6 +143,7 @@ class LiveWebDashboard:
             self.socketio.emit('live_frame', {
                 'image': image_base64,
                 'layer': metadata.get('layer', 0),
+                'progress': metadata.get('progress', None),
                 'temp': metadata.get('temp', {}),
                 'defect': metadata.get('defect', None),
                 'timestamp': time.time()
@@ -121,6 +151,15 @@ class LiveWebDashboard:
         except Exception as e:
             print(f"[WEB] Error broadcasting frame: {e}")
     
+    def attach_model_swapper(self, swapper):
+        """Enable the model swap / rollback controls (see model_swap.py)."""
+        self.model_swapper = swapper
+        swapper.on_status = self.broadcast_model_status
+    
+    def broadcast_model_status(self, status_dict):
+        if self.clients > 0:
+            self.socketio.emit('model_status', status_dict)
+    
     def broadcast_live_status(self, status_dict):
         """Broadcast a generic status update."""
         if self.clients > 0: